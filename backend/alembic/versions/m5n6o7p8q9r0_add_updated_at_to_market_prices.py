@@ -0,0 +1,35 @@
+"""add updated_at to market_prices for cross-worker freshness checks
+
+Revision ID: m5n6o7p8q9r0
+Revises: l4m5n6o7p8q9
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "m5n6o7p8q9r0"
+down_revision = "l4m5n6o7p8q9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "market_prices",
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    # Existing rows were fetched at some unknown time; dating them to their
+    # price_date keeps them stale instead of fresh for a TTL after deploy.
+    op.execute("UPDATE market_prices SET updated_at = price_date::timestamptz")
+    op.alter_column(
+        "market_prices",
+        "updated_at",
+        server_default=sa.text("CURRENT_TIMESTAMP"),
+        nullable=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("market_prices", "updated_at")
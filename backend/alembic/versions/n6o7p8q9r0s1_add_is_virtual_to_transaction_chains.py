@@ -0,0 +1,31 @@
+"""add is_virtual to transaction_chains
+
+Revision ID: n6o7p8q9r0s1
+Revises: m5n6o7p8q9r0
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "n6o7p8q9r0s1"
+down_revision = "m5n6o7p8q9r0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "transaction_chains",
+        sa.Column(
+            "is_virtual",
+            sa.Boolean(),
+            server_default=sa.text("false"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("transaction_chains", "is_virtual")
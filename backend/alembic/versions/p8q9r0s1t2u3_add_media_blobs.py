@@ -0,0 +1,98 @@
+"""move image bytes into media_blobs
+
+Revision ID: p8q9r0s1t2u3
+Revises: o7p8q9r0s1t2
+Create Date: 2026-10-19
+
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "p8q9r0s1t2u3"
+down_revision = "o7p8q9r0s1t2"
+branch_labels = None
+depends_on = None
+
+# (table, bytes column, mime column, hash column)
+MEDIA_COLUMNS = (
+    ("users", "photo_data", "photo_mime", "photo_hash"),
+    ("items", "photo_data", "photo_mime", "photo_hash"),
+    ("counterparties", "logo_data", "logo_mime", "logo_hash"),
+    ("counterparties", "photo_data", "photo_mime", "photo_hash"),
+)
+BATCH_ROWS = 200
+
+
+def _move_blobs(table: str, data_column: str, mime_column: str, hash_column: str) -> None:
+    bind = op.get_bind()
+    select_rows = sa.text(
+        f"SELECT id, {data_column} AS data, {mime_column} AS mime FROM {table} "
+        f"WHERE {data_column} IS NOT NULL AND {hash_column} IS NULL "
+        f"ORDER BY id LIMIT {BATCH_ROWS}"
+    )
+    insert_blob = sa.text(
+        "INSERT INTO media_blobs (sha256, mime, size_bytes, data) "
+        "VALUES (:sha256, :mime, :size_bytes, :data) "
+        "ON CONFLICT (sha256) DO NOTHING"
+    )
+    update_row = sa.text(f"UPDATE {table} SET {hash_column} = :sha256 WHERE id = :id")
+    while True:
+        rows = bind.execute(select_rows).all()
+        if not rows:
+            break
+        for row in rows:
+            data = bytes(row.data)
+            digest = hashlib.sha256(data).hexdigest()
+            bind.execute(
+                insert_blob,
+                {
+                    "sha256": digest,
+                    "mime": row.mime or "application/octet-stream",
+                    "size_bytes": len(data),
+                    "data": data,
+                },
+            )
+            bind.execute(update_row, {"sha256": digest, "id": row.id})
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_blobs",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("mime", sa.String(length=50), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+    for table, data_column, mime_column, hash_column in MEDIA_COLUMNS:
+        op.add_column(table, sa.Column(hash_column, sa.String(length=64), nullable=True))
+        op.create_foreign_key(
+            f"fk_{table}_{hash_column}",
+            table,
+            "media_blobs",
+            [hash_column],
+            ["sha256"],
+        )
+        _move_blobs(table, data_column, mime_column, hash_column)
+        op.drop_column(table, data_column)
+
+
+def downgrade() -> None:
+    for table, data_column, _mime_column, hash_column in MEDIA_COLUMNS:
+        op.add_column(table, sa.Column(data_column, sa.LargeBinary(), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET {data_column} = media_blobs.data "
+            f"FROM media_blobs WHERE media_blobs.sha256 = {table}.{hash_column}"
+        )
+        op.drop_constraint(f"fk_{table}_{hash_column}", table, type_="foreignkey")
+        op.drop_column(table, hash_column)
+    op.drop_table("media_blobs")
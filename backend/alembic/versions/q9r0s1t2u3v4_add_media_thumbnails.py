@@ -0,0 +1,31 @@
+"""add media thumbnails
+
+Revision ID: q9r0s1t2u3v4
+Revises: p8q9r0s1t2u3
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "q9r0s1t2u3v4"
+down_revision = "p8q9r0s1t2u3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_thumbnails",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["sha256"], ["media_blobs.sha256"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("sha256", "size"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("media_thumbnails")
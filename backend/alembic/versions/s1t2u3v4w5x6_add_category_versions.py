@@ -0,0 +1,34 @@
+"""add category versions
+
+Revision ID: s1t2u3v4w5x6
+Revises: r0s1t2u3v4w5
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "s1t2u3v4w5x6"
+down_revision = "r0s1t2u3v4w5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "category_versions",
+        sa.Column("scope", sa.String(length=40), nullable=False),
+        sa.Column("version", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("scope"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("category_versions")
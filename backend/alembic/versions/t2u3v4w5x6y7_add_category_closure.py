@@ -0,0 +1,50 @@
+"""add category closure
+
+Revision ID: t2u3v4w5x6y7
+Revises: s1t2u3v4w5x6
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "t2u3v4w5x6y7"
+down_revision = "s1t2u3v4w5x6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "category_closure",
+        sa.Column("ancestor_id", sa.BigInteger(), nullable=False),
+        sa.Column("descendant_id", sa.BigInteger(), nullable=False),
+        sa.Column("depth", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["ancestor_id"], ["categories.id"]),
+        sa.ForeignKeyConstraint(["descendant_id"], ["categories.id"]),
+        sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+    )
+    op.create_index(
+        "ix_category_closure_descendant_ancestor",
+        "category_closure",
+        ["descendant_id", "ancestor_id"],
+    )
+    op.execute(
+        """
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM categories
+            UNION ALL
+            SELECT closure.ancestor_id, categories.id, closure.depth + 1
+            FROM closure
+            JOIN categories ON categories.parent_id = closure.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM closure
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_category_closure_descendant_ancestor", table_name="category_closure")
+    op.drop_table("category_closure")
@@ -0,0 +1,53 @@
+"""add counterparty search indexes
+
+Revision ID: u3v4w5x6y7z8
+Revises: t2u3v4w5x6y7
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+
+revision = "u3v4w5x6y7z8"
+down_revision = "t2u3v4w5x6y7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_counterparties_name_trgm",
+        "counterparties",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_counterparties_full_name_trgm",
+        "counterparties",
+        ["full_name"],
+        postgresql_using="gin",
+        postgresql_ops={"full_name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_counterparties_inn_prefix",
+        "counterparties",
+        ["inn"],
+        postgresql_ops={"inn": "varchar_pattern_ops"},
+    )
+    op.create_index(
+        "ix_counterparties_ogrn_prefix",
+        "counterparties",
+        ["ogrn"],
+        postgresql_ops={"ogrn": "varchar_pattern_ops"},
+    )
+    op.create_index("ix_counterparties_name_id", "counterparties", ["name", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_counterparties_name_id", table_name="counterparties")
+    op.drop_index("ix_counterparties_ogrn_prefix", table_name="counterparties")
+    op.drop_index("ix_counterparties_inn_prefix", table_name="counterparties")
+    op.drop_index("ix_counterparties_full_name_trgm", table_name="counterparties")
+    op.drop_index("ix_counterparties_name_trgm", table_name="counterparties")
@@ -0,0 +1,33 @@
+"""add media sprite last_used_at
+
+Revision ID: v4w5x6y7z8a9
+Revises: u3v4w5x6y7z8
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "v4w5x6y7z8a9"
+down_revision = "u3v4w5x6y7z8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "media_sprites",
+        sa.Column(
+            "last_used_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.create_index("ix_media_sprites_last_used_at", "media_sprites", ["last_used_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_sprites_last_used_at", table_name="media_sprites")
+    op.drop_column("media_sprites", "last_used_at")
@@ -0,0 +1,38 @@
+"""add occurrence_date to transactions
+
+Revision ID: w5x6y7z8a9b0
+Revises: v4w5x6y7z8a9
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "w5x6y7z8a9b0"
+down_revision = "v4w5x6y7z8a9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("transactions", sa.Column("occurrence_date", sa.Date(), nullable=True))
+    # Rows materialized so far still carry their occurrence's date unless
+    # they were edited, which is the best that can be recovered.
+    op.execute(
+        "UPDATE transactions SET occurrence_date = transactions.transaction_date::date "
+        "FROM transaction_chains "
+        "WHERE transaction_chains.id = transactions.chain_id "
+        "AND transaction_chains.is_virtual"
+    )
+    op.create_index(
+        "ix_transactions_chain_occurrence_date",
+        "transactions",
+        ["chain_id", "occurrence_date"],
+        postgresql_where=sa.text("occurrence_date IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_chain_occurrence_date", table_name="transactions")
+    op.drop_column("transactions", "occurrence_date")
@@ -0,0 +1,30 @@
+"""add counterparty logo_hash index
+
+Revision ID: x6y7z8a9b0c1
+Revises: w5x6y7z8a9b0
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "x6y7z8a9b0c1"
+down_revision = "w5x6y7z8a9b0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_counterparties_logo_hash",
+        "counterparties",
+        ["logo_hash"],
+        postgresql_where=sa.text("logo_hash IS NOT NULL"),
+    )
+    op.create_index("ix_media_sprites_sha256", "media_sprites", ["sha256"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_sprites_sha256", table_name="media_sprites")
+    op.drop_index("ix_counterparties_logo_hash", table_name="counterparties")
@@ -1,30 +1,158 @@
 from fastapi import Header, HTTPException, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from google.oauth2 import id_token
-from google.auth.transport import requests
-import base64
+from cachetools import LRUCache, TTLCache
+from dataclasses import dataclass
+from datetime import date
+from google.auth import exceptions as google_exceptions, jwt as google_jwt
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import hashlib
 import hmac
 import json
-import secrets
+import multiprocessing
+import re
+import requests
+import threading
 import time
 
 from config import settings
 from db import get_db
 from models import OnboardingState, User
+from passwords import (
+    _b64url_decode,
+    _b64url_encode,
+    hash_password_sync,
+    stored_iterations,
+    verify_password_sync,
+)
 
 AUTH_TOKEN_TTL_SECONDS = 60 * 60 * 24 * 7
-GOOGLE_REQUEST = requests.Request()
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
 
+# sha256 of a verified Google ID token -> (user id, token exp). Entries are
+# checked against exp on read, so a cached token never outlives its claims.
+_GOOGLE_TOKEN_CACHE: LRUCache[str, tuple[int, int]] = LRUCache(
+    maxsize=settings.google_token_cache_max_entries
+)
+_GOOGLE_TOKEN_CACHE_LOCK = threading.Lock()
 
-def _b64url_encode(data: bytes) -> str:
-    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+_PASSWORD_POOL: ProcessPoolExecutor | None = None
+_PASSWORD_POOL_LOCK = threading.Lock()
+# Hashes queued or running at once; requests beyond this get a 503.
+_PASSWORD_SLOTS = threading.BoundedSemaphore(settings.password_hash_max_pending)
 
 
-def _b64url_decode(data: str) -> bytes:
-    padded = data + "=" * (-len(data) % 4)
-    return base64.urlsafe_b64decode(padded)
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller as request handlers see it.
+
+    Built from a few columns of ``users`` so authentication never loads the
+    profile or avatar; endpoints that edit the profile use
+    ``get_current_user_record`` instead.
+    """
+
+    id: int
+    accounting_start_date: date | None
+    is_google: bool
+
+
+_PRINCIPAL_CACHE: TTLCache[int, Principal] = TTLCache(
+    maxsize=settings.principal_cache_max_entries,
+    ttl=settings.principal_cache_ttl_seconds,
+)
+_PRINCIPAL_CACHE_LOCK = threading.Lock()
+
+
+def load_principal(db: Session, user_id: int) -> Principal | None:
+    with _PRINCIPAL_CACHE_LOCK:
+        principal = _PRINCIPAL_CACHE.get(user_id)
+    if principal is not None:
+        return principal
+    row = db.execute(
+        select(User.id, User.accounting_start_date, User.google_sub).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    principal = Principal(
+        id=row.id,
+        accounting_start_date=row.accounting_start_date,
+        is_google=row.google_sub is not None,
+    )
+    # accounting_start_date is set once and never changes afterwards, so only
+    # principals that have it can be shared safely between workers.
+    if principal.accounting_start_date is not None:
+        with _PRINCIPAL_CACHE_LOCK:
+            _PRINCIPAL_CACHE[user_id] = principal
+    return principal
+
+
+def invalidate_principal(user_id: int) -> None:
+    with _PRINCIPAL_CACHE_LOCK:
+        _PRINCIPAL_CACHE.pop(user_id, None)
+
+
+class GoogleCertStore:
+    """Google's ID token signing certificates, kept fresh by a background thread.
+
+    Requests verify against the in-memory copy; a synchronous fetch only
+    happens before the first refresh or when a token names an unknown key id.
+    """
+
+    def __init__(self) -> None:
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.certs: dict[str, str] = {}
+        self.expires_at = 0.0
+        self.stop_event = threading.Event()
+        self.refresher: threading.Thread | None = None
+
+    def refresh(self) -> dict[str, str]:
+        response = self.session.get(
+            GOOGLE_CERTS_URL, timeout=settings.google_certs_timeout_seconds
+        )
+        response.raise_for_status()
+        certs = response.json()
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else settings.google_certs_refresh_seconds
+        with self.lock:
+            self.certs = certs
+            self.expires_at = time.monotonic() + max_age
+        return certs
+
+    def get(self, force_refresh: bool = False) -> dict[str, str]:
+        with self.lock:
+            if not force_refresh and self.certs and time.monotonic() < self.expires_at:
+                return self.certs
+        return self.refresh()
+
+    def _refresh_loop(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+                # Refresh well before Google's max-age runs out.
+                delay = max((self.expires_at - time.monotonic()) * 0.8, 60)
+            except (requests.RequestException, ValueError):
+                delay = 30
+            self.stop_event.wait(delay)
+
+    def start(self) -> None:
+        if self.refresher is not None:
+            return
+        self.stop_event.clear()
+        self.refresher = threading.Thread(
+            target=self._refresh_loop, name="google-cert-refresh", daemon=True
+        )
+        self.refresher.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.refresher = None
+
+
+GOOGLE_CERTS = GoogleCertStore()
 
 
 def _sign(payload: bytes) -> str:
@@ -62,39 +190,81 @@ def verify_access_token(token: str) -> dict:
     return payload
 
 
+def _password_pool() -> ProcessPoolExecutor:
+    global _PASSWORD_POOL
+    with _PASSWORD_POOL_LOCK:
+        if _PASSWORD_POOL is None:
+            # spawn: workers import only the passwords module, not the app.
+            _PASSWORD_POOL = ProcessPoolExecutor(
+                max_workers=settings.password_hash_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _PASSWORD_POOL
+
+
+def shutdown_password_pool() -> None:
+    global _PASSWORD_POOL
+    with _PASSWORD_POOL_LOCK:
+        pool, _PASSWORD_POOL = _PASSWORD_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_password_task(func, *args):
+    """Run PBKDF2 in the process pool, rejecting work beyond the queue limit
+    instead of letting it pile up on the request threadpool."""
+    if not _PASSWORD_SLOTS.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-in attempts in progress. Try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return _password_pool().submit(func, *args).result()
+    except BrokenProcessPool:
+        shutdown_password_pool()
+        raise HTTPException(
+            status_code=503,
+            detail="Password service is restarting. Try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    finally:
+        _PASSWORD_SLOTS.release()
+
+
 def hash_password(password: str) -> str:
-    iterations = 120_000
-    salt = secrets.token_bytes(16)
-    digest = hashlib.pbkdf2_hmac(
-        "sha256", password.encode("utf-8"), salt, iterations
-    )
-    return "pbkdf2_sha256${}${}${}".format(
-        iterations, _b64url_encode(salt), _b64url_encode(digest)
+    return _run_password_task(
+        hash_password_sync, password, settings.password_hash_iterations
     )
 
 
 def verify_password(password: str, stored: str | None) -> bool:
     if not stored:
         return False
-    try:
-        algorithm, iterations_raw, salt_b64, digest_b64 = stored.split("$", 3)
-        if algorithm != "pbkdf2_sha256":
-            return False
-        iterations = int(iterations_raw)
-        salt = _b64url_decode(salt_b64)
-        expected = _b64url_decode(digest_b64)
-    except (ValueError, TypeError):
-        return False
-    candidate = hashlib.pbkdf2_hmac(
-        "sha256", password.encode("utf-8"), salt, iterations
-    )
-    return hmac.compare_digest(candidate, expected)
+    return _run_password_task(verify_password_sync, password, stored)
+
+
+def password_needs_rehash(stored: str | None) -> bool:
+    return bool(stored) and stored_iterations(stored) != settings.password_hash_iterations
+
+
+def verify_google_id_token(token: str) -> dict:
+    """Same checks as ``id_token.verify_oauth2_token`` without an audience,
+    against the cached certificates."""
+    certs = GOOGLE_CERTS.get()
+    if google_jwt.decode_header(token).get("kid") not in certs:
+        # Google rotated its keys since the last refresh.
+        certs = GOOGLE_CERTS.get(force_refresh=True)
+    payload = google_jwt.decode(token, certs=certs)
+    if payload.get("iss") not in GOOGLE_ISSUERS:
+        raise google_exceptions.GoogleAuthError("Wrong issuer")
+    return payload
 
 
 def get_current_user(
     authorization: str | None = Header(default=None),
     db: Session = Depends(get_db),
-) -> User:
+) -> Principal:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
 
@@ -106,13 +276,25 @@ def get_current_user(
         user_id = payload.get("sub")
         if not isinstance(user_id, int):
             raise HTTPException(status_code=401, detail="Invalid token subject")
-        user = db.get(User, user_id)
-        if not user:
+        principal = load_principal(db, user_id)
+        if not principal:
             raise HTTPException(status_code=401, detail="User not found")
-        return user
+        return principal
+
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    with _GOOGLE_TOKEN_CACHE_LOCK:
+        cached = _GOOGLE_TOKEN_CACHE.get(token_hash)
+    if cached is not None:
+        user_id, exp = cached
+        if exp > time.time():
+            principal = load_principal(db, user_id)
+            if principal:
+                return principal
+        with _GOOGLE_TOKEN_CACHE_LOCK:
+            _GOOGLE_TOKEN_CACHE.pop(token_hash, None)
 
     try:
-        payload = id_token.verify_oauth2_token(token, GOOGLE_REQUEST)
+        payload = verify_google_id_token(token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
@@ -168,4 +350,18 @@ def get_current_user(
                 user.name != name and name]):
             db.commit()
 
+    exp = payload.get("exp")
+    if isinstance(exp, int):
+        with _GOOGLE_TOKEN_CACHE_LOCK:
+            _GOOGLE_TOKEN_CACHE[token_hash] = (user.id, exp)
+    return load_principal(db, user.id)
+
+
+def get_current_user_record(
+    principal: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> User:
+    user = db.get(User, principal.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
     return user
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 import hashlib
 import json
+import threading
+
+from cachetools import LRUCache
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.encoders import jsonable_encoder
@@ -8,7 +11,9 @@ import sqlalchemy as sa
 from sqlalchemy import or_, select
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
+from auth import Principal, get_current_user
+from category_service import add_category_closure, bump_category_version, category_versions
+from config import settings
 from db import get_db
 from models import Category, User, UserCategoryState
 from schemas import (
@@ -24,11 +29,24 @@ router = APIRouter(prefix="/categories", tags=["categories"])
 
 @dataclass
 class CategoryCacheEntry:
+    versions: tuple[int, int]
     etag: str
     payload: list[dict]
 
 
-CATEGORY_CACHE: dict[tuple[int, bool], CategoryCacheEntry] = {}
+@dataclass
+class GlobalCategoryNodes:
+    version: int
+    nodes: list[dict]
+
+
+# Trees are validated against category_versions on every request, so a write
+# handled by any worker invalidates the cached copies in all of them.
+CATEGORY_CACHE: LRUCache[tuple[int, bool], CategoryCacheEntry] = LRUCache(
+    maxsize=settings.category_cache_max_entries
+)
+_GLOBAL_NODES: GlobalCategoryNodes | None = None
+_CATEGORY_CACHE_LOCK = threading.Lock()
 CACHE_CONTROL_VALUE = "private, max-age=60"
 
 
@@ -47,12 +65,6 @@ def etag_matches(header_value: str | None, etag: str) -> bool:
     return "*" in parts or etag in parts
 
 
-def invalidate_category_cache(user_id: int) -> None:
-    for key in list(CATEGORY_CACHE.keys()):
-        if key[0] == user_id:
-            CATEGORY_CACHE.pop(key, None)
-
-
 def normalize_icon(value: str | None) -> str | None:
     if value is None:
         return None
@@ -83,14 +95,6 @@ def build_category_out(category: Category, state: UserCategoryState | None) -> C
     )
 
 
-def sort_tree(nodes: list[CategoryOut]) -> list[CategoryOut]:
-    nodes.sort(key=lambda item: item.name.casefold())
-    for node in nodes:
-        if node.children:
-            sort_tree(node.children)
-    return nodes
-
-
 def fetch_category(
     db: Session, user: User, category_id: int, allow_archived: bool = False
 ) -> Category:
@@ -104,78 +108,111 @@ def fetch_category(
     return category
 
 
-@router.get("", response_model=list[CategoryOut])
-def list_categories(
-    request: Request,
-    response: Response,
-    include_archived: bool = True,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    cache_key = (user.id, include_archived)
-    cache_entry = CATEGORY_CACHE.get(cache_key)
-    if cache_entry:
-        if etag_matches(request.headers.get("if-none-match"), cache_entry.etag):
-            return Response(
-                status_code=304,
-                headers={
-                    "ETag": cache_entry.etag,
-                    "Cache-Control": CACHE_CONTROL_VALUE,
-                },
-            )
-        response.headers["ETag"] = cache_entry.etag
-        response.headers["Cache-Control"] = CACHE_CONTROL_VALUE
-        return cache_entry.payload
+def sort_tree(nodes: list[dict]) -> list[dict]:
+    nodes.sort(key=lambda item: item["name"].casefold())
+    for node in nodes:
+        if node["children"]:
+            sort_tree(node["children"])
+    return nodes
+
+
+def global_category_nodes(db: Session, version: int) -> list[dict]:
+    """Serialized global categories without any user state, built once per version."""
+    global _GLOBAL_NODES
+    with _CATEGORY_CACHE_LOCK:
+        cached = _GLOBAL_NODES
+    if cached is not None and cached.version == version:
+        return cached.nodes
 
     categories = db.execute(
-        select(Category).where(
-            or_(Category.owner_user_id.is_(None), Category.owner_user_id == user.id)
-        )
+        select(Category).where(Category.owner_user_id.is_(None))
     ).scalars()
+    nodes = [jsonable_encoder(build_category_out(category, None)) for category in categories]
+    with _CATEGORY_CACHE_LOCK:
+        _GLOBAL_NODES = GlobalCategoryNodes(version=version, nodes=nodes)
+    return nodes
+
 
+def build_category_tree(
+    db: Session, user_id: int, global_version: int, include_archived: bool
+) -> list[dict]:
     states = db.execute(
-        select(UserCategoryState).where(UserCategoryState.user_id == user.id)
+        select(UserCategoryState).where(UserCategoryState.user_id == user_id)
     ).scalars()
     state_map = {state.category_id: state for state in states}
 
-    nodes: dict[int, CategoryOut] = {}
-    for category in categories:
+    nodes: dict[int, dict] = {}
+    for shared in global_category_nodes(db, global_version):
+        if not include_archived and shared["archived_at"] is not None:
+            continue
+        node = {**shared, "children": []}
+        state = state_map.get(node["id"])
+        if state:
+            node["enabled"] = state.enabled
+            if state.icon_override is not None:
+                node["icon_name"] = state.icon_override
+        nodes[node["id"]] = node
+
+    own_categories = db.execute(
+        select(Category).where(Category.owner_user_id == user_id)
+    ).scalars()
+    for category in own_categories:
         if not include_archived and category.archived_at is not None:
             continue
-        nodes[category.id] = build_category_out(category, state_map.get(category.id))
+        nodes[category.id] = jsonable_encoder(
+            build_category_out(category, state_map.get(category.id))
+        )
 
-    roots: list[CategoryOut] = []
+    roots: list[dict] = []
     for node in nodes.values():
-        parent_id = node.parent_id
+        parent_id = node["parent_id"]
         parent = nodes.get(parent_id) if parent_id else None
         if parent:
-            parent.children.append(node)
+            parent["children"].append(node)
         else:
             roots.append(node)
+    return sort_tree(roots)
 
-    payload = jsonable_encoder(sort_tree(roots))
-    etag = compute_etag(payload)
-    CATEGORY_CACHE[cache_key] = CategoryCacheEntry(etag=etag, payload=payload)
 
-    if etag_matches(request.headers.get("if-none-match"), etag):
+@router.get("", response_model=list[CategoryOut])
+def list_categories(
+    request: Request,
+    response: Response,
+    include_archived: bool = True,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    versions = category_versions(db, user.id)
+    cache_key = (user.id, include_archived)
+    with _CATEGORY_CACHE_LOCK:
+        cache_entry = CATEGORY_CACHE.get(cache_key)
+    if cache_entry is None or cache_entry.versions != versions:
+        payload = build_category_tree(db, user.id, versions[0], include_archived)
+        cache_entry = CategoryCacheEntry(
+            versions=versions, etag=compute_etag(payload), payload=payload
+        )
+        with _CATEGORY_CACHE_LOCK:
+            CATEGORY_CACHE[cache_key] = cache_entry
+
+    if etag_matches(request.headers.get("if-none-match"), cache_entry.etag):
         return Response(
             status_code=304,
             headers={
-                "ETag": etag,
+                "ETag": cache_entry.etag,
                 "Cache-Control": CACHE_CONTROL_VALUE,
             },
         )
 
-    response.headers["ETag"] = etag
+    response.headers["ETag"] = cache_entry.etag
     response.headers["Cache-Control"] = CACHE_CONTROL_VALUE
-    return payload
+    return cache_entry.payload
 
 
 @router.post("", response_model=CategoryOut)
 def create_category(
     payload: CategoryCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     name = payload.name.strip()
     if not name:
@@ -210,9 +247,10 @@ def create_category(
         icon_name=icon_name,
     )
     db.add(category)
+    add_category_closure(db, category)
+    bump_category_version(db, user.id)
     db.commit()
     db.refresh(category)
-    invalidate_category_cache(user.id)
     return build_category_out(category, None)
 
 
@@ -221,7 +259,7 @@ def update_category_scope(
     category_id: int,
     payload: CategoryScopeUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     category = fetch_category(db, user, category_id)
     if category.owner_user_id != user.id:
@@ -236,6 +274,7 @@ def update_category_scope(
             )
 
     category.scope = payload.scope
+    bump_category_version(db, user.id)
     db.commit()
     db.refresh(category)
     state = db.execute(
@@ -244,7 +283,6 @@ def update_category_scope(
             UserCategoryState.category_id == category_id,
         )
     ).scalar_one_or_none()
-    invalidate_category_cache(user.id)
     return build_category_out(category, state)
 
 
@@ -253,7 +291,7 @@ def update_category_visibility(
     category_id: int,
     payload: CategoryVisibilityUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     category = fetch_category(db, user, category_id, allow_archived=True)
     state = db.execute(
@@ -273,8 +311,8 @@ def update_category_visibility(
         )
         db.add(state)
 
+    bump_category_version(db, user.id)
     db.commit()
-    invalidate_category_cache(user.id)
     return build_category_out(category, state)
 
 
@@ -283,7 +321,7 @@ def update_category_icon(
     category_id: int,
     payload: CategoryIconUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     category = fetch_category(db, user, category_id)
     icon_name = normalize_icon(payload.icon_name)
@@ -314,9 +352,9 @@ def update_category_icon(
             )
             db.add(state)
 
+    bump_category_version(db, user.id)
     db.commit()
     db.refresh(category)
-    invalidate_category_cache(user.id)
     return build_category_out(category, state)
 
 
@@ -324,7 +362,7 @@ def update_category_icon(
 def delete_category(
     category_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     category = fetch_category(db, user, category_id, allow_archived=True)
     if category.owner_user_id != user.id:
@@ -350,6 +388,6 @@ def delete_category(
     for item in to_archive:
         item.archived_at = sa.func.now()
 
+    bump_category_version(db, user.id)
     db.commit()
-    invalidate_category_cache(user.id)
     return {"ok": True}
@@ -1,16 +1,246 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time
+import threading
+
+from cachetools import LRUCache
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import Select, and_, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from models import Category, User, UserCategoryState
+from config import settings
+from models import (
+    Category,
+    CategoryClosure,
+    CategoryVersion,
+    Transaction,
+    User,
+    UserCategoryState,
+)
+
+GLOBAL_CATEGORY_SCOPE = "global"
+_SESSION_INDEX_KEY = "category_index"
+
+
+@dataclass(frozen=True)
+class ResolvedCategory:
+    id: int
+    name: str
+    scope: str
+    owner_user_id: int | None
+    archived: bool
+    enabled: bool
+
+
+@dataclass(frozen=True)
+class CategoryIndex:
+    versions: tuple[int, int]
+    by_id: dict[int, ResolvedCategory]
+    by_name: dict[str, ResolvedCategory]
+
+
+_INDEX_CACHE: LRUCache[int, CategoryIndex] = LRUCache(
+    maxsize=settings.category_cache_max_entries
+)
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def user_category_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def add_category_closure(db: Session, category: Category) -> None:
+    """Link a new category to itself and to every ancestor of its parent."""
+    db.flush()
+    db.execute(
+        insert(CategoryClosure).values(
+            ancestor_id=category.id, descendant_id=category.id, depth=0
+        )
+    )
+    if category.parent_id is None:
+        return
+    db.execute(
+        insert(CategoryClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                CategoryClosure.ancestor_id,
+                literal(category.id),
+                CategoryClosure.depth + 1,
+            ).where(CategoryClosure.descendant_id == category.parent_id),
+        )
+    )
+
+
+def category_subtree(category_ids: list[int]) -> Select:
+    """Ids of the given categories and all of their descendants."""
+    return select(CategoryClosure.descendant_id).where(
+        CategoryClosure.ancestor_id.in_(category_ids)
+    )
+
+
+def category_totals(
+    db: Session,
+    user_id: int,
+    date_from: date,
+    date_to: date,
+    direction: str = "EXPENSE",
+    category_ids: list[int] | None = None,
+    include_descendants: bool = False,
+) -> dict[int, tuple[int, int]]:
+    """Sum realized transactions per category: {id: (amount_rub, count)}.
+
+    With include_descendants every category also counts its whole subtree,
+    which is one join on category_closure rather than a walk of the tree.
+    """
+    if include_descendants:
+        group = CategoryClosure.ancestor_id
+        stmt = select(
+            group, func.sum(Transaction.amount_rub), func.count(Transaction.id)
+        ).join(CategoryClosure, CategoryClosure.descendant_id == Transaction.category_id)
+    else:
+        group = Transaction.category_id
+        stmt = select(group, func.sum(Transaction.amount_rub), func.count(Transaction.id))
+    stmt = stmt.where(
+        Transaction.user_id == user_id,
+        Transaction.deleted_at.is_(None),
+        Transaction.direction == direction,
+        Transaction.category_id.isnot(None),
+        Transaction.transaction_date >= datetime.combine(date_from, time.min),
+        Transaction.transaction_date <= datetime.combine(date_to, time.max),
+        or_(Transaction.transaction_type == "ACTUAL", Transaction.status == "REALIZED"),
+    )
+    if category_ids is not None:
+        stmt = stmt.where(group.in_(category_ids))
+    rows = db.execute(stmt.group_by(group)).all()
+    return {category_id: (int(amount or 0), count) for category_id, amount, count in rows}
+
+
+def _increment_version(db: Session, scope: str) -> bool:
+    result = db.execute(
+        update(CategoryVersion)
+        .where(CategoryVersion.scope == scope)
+        .values(version=CategoryVersion.version + 1)
+    )
+    return bool(result.rowcount)
+
+
+def bump_category_version(db: Session, user_id: int | None) -> None:
+    """Mark the user's categories (or the global tree for None) as changed.
+
+    Call before committing the write it describes.
+    """
+    scope = GLOBAL_CATEGORY_SCOPE if user_id is None else user_category_scope(user_id)
+    db.info.pop(_SESSION_INDEX_KEY, None)
+    if _increment_version(db, scope):
+        return
+    try:
+        with db.begin_nested():
+            db.add(CategoryVersion(scope=scope, version=1))
+    except IntegrityError:
+        # Another transaction created the row first.
+        _increment_version(db, scope)
+
+
+def category_versions(db: Session, user_id: int) -> tuple[int, int]:
+    """Return the (global, user) category versions; 0 when never bumped."""
+    user_scope = user_category_scope(user_id)
+    rows = dict(
+        db.execute(
+            select(CategoryVersion.scope, CategoryVersion.version).where(
+                CategoryVersion.scope.in_((GLOBAL_CATEGORY_SCOPE, user_scope))
+            )
+        ).all()
+    )
+    return rows.get(GLOBAL_CATEGORY_SCOPE, 0), rows.get(user_scope, 0)
+
+
+def _load_category_index(db: Session, user_id: int, versions: tuple[int, int]) -> CategoryIndex:
+    rows = db.execute(
+        select(
+            Category.id,
+            Category.name,
+            Category.scope,
+            Category.owner_user_id,
+            Category.archived_at,
+            UserCategoryState.enabled,
+        )
+        .outerjoin(
+            UserCategoryState,
+            and_(
+                UserCategoryState.category_id == Category.id,
+                UserCategoryState.user_id == user_id,
+            ),
+        )
+        .where(or_(Category.owner_user_id.is_(None), Category.owner_user_id == user_id))
+        .order_by(Category.id)
+    ).all()
+
+    by_id: dict[int, ResolvedCategory] = {}
+    for row in rows:
+        by_id[row.id] = ResolvedCategory(
+            id=row.id,
+            name=row.name,
+            scope=row.scope,
+            owner_user_id=row.owner_user_id,
+            archived=row.archived_at is not None,
+            enabled=row.enabled is not False,
+        )
+
+    # A user's own category shadows a global one with the same name, and an
+    # active category shadows an archived one.
+    by_name: dict[str, ResolvedCategory] = {}
+    for category in sorted(
+        by_id.values(),
+        key=lambda item: (item.owner_user_id is not None, not item.archived, -item.id),
+    ):
+        by_name[category.name] = category
+    return CategoryIndex(versions=versions, by_id=by_id, by_name=by_name)
+
+
+def category_index(db: Session, user_id: int) -> CategoryIndex:
+    """Visible categories with the user's state, checked once per session.
+
+    The process-wide copy is reused until a category write bumps the
+    global or the user's version.
+    """
+    session_indexes = db.info.setdefault(_SESSION_INDEX_KEY, {})
+    index = session_indexes.get(user_id)
+    if index is not None:
+        return index
+
+    versions = category_versions(db, user_id)
+    with _INDEX_CACHE_LOCK:
+        index = _INDEX_CACHE.get(user_id)
+    if index is None or index.versions != versions:
+        index = _load_category_index(db, user_id, versions)
+        with _INDEX_CACHE_LOCK:
+            _INDEX_CACHE[user_id] = index
+    session_indexes[user_id] = index
+    return index
+
+
+def _check_category_usable(category: ResolvedCategory) -> ResolvedCategory:
+    if category.archived:
+        raise HTTPException(status_code=400, detail="Category is archived")
+    if not category.enabled:
+        raise HTTPException(status_code=400, detail="Category is disabled")
+    return category
 
 
 def resolve_category_or_400(
     db: Session, user: User, category_id: int | None
-) -> Category | None:
+) -> ResolvedCategory | None:
     if category_id is None:
         return None
 
+    category = category_index(db, user.id).by_id.get(category_id)
+    if category is None:
+        return _query_category_or_400(db, user, category_id)
+    return _check_category_usable(category)
+
+
+def _query_category_or_400(db: Session, user: User, category_id: int) -> ResolvedCategory:
+    # Misses are errors in practice; report them exactly as before.
     category = db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category_id")
@@ -20,16 +250,26 @@ def resolve_category_or_400(
             status_code=403, detail="Category is not available for this user"
         )
 
-    if category.archived_at is not None:
-        raise HTTPException(status_code=400, detail="Category is archived")
-
     state = db.execute(
         select(UserCategoryState).where(
             UserCategoryState.user_id == user.id,
             UserCategoryState.category_id == category_id,
         )
     ).scalar_one_or_none()
-    if state and not state.enabled:
-        raise HTTPException(status_code=400, detail="Category is disabled")
+    return _check_category_usable(
+        ResolvedCategory(
+            id=category.id,
+            name=category.name,
+            scope=category.scope,
+            owner_user_id=category.owner_user_id,
+            archived=category.archived_at is not None,
+            enabled=state.enabled if state else True,
+        )
+    )
 
-    return category
+
+def resolve_category_by_name(db: Session, user: User, name: str) -> ResolvedCategory:
+    category = category_index(db, user.id).by_name.get(name)
+    if category is None:
+        raise HTTPException(status_code=400, detail=f"Category '{name}' not found")
+    return _check_category_usable(category)
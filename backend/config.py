@@ -7,5 +7,39 @@ class Settings(BaseSettings):
     public_base_url: str = "http://localhost:8000"
     moex_base_url: str = "https://iss.moex.com/iss"
     moex_timeout_seconds: int = 20
+    cbr_base_url: str = "https://cbr.ru"
+    cbr_timeout_seconds: int = 20
+    upstream_budget_seconds: float = 8.0
+    upstream_failure_threshold: int = 3
+    upstream_reset_seconds: int = 30
+    market_price_cache_ttl_seconds: int = 900
+    market_price_cache_max_entries: int = 2048
+    market_price_refresh_workers: int = 2
+    plan_preview_cache_max_entries: int = 512
+    transaction_copy_threshold_rows: int = 20000
+    google_token_cache_max_entries: int = 4096
+    principal_cache_ttl_seconds: int = 30
+    password_hash_iterations: int = 120_000
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 16
+    principal_cache_max_entries: int = 10000
+    google_certs_refresh_seconds: int = 3600
+    google_certs_timeout_seconds: int = 10
+    job_workers: int = 2
+    job_poll_seconds: float = 2.0
+    job_max_attempts: int = 5
+    job_retry_base_seconds: int = 10
+    job_lease_seconds: int = 900
+    chain_purge_inline_max_rows: int = 2000
+    chain_purge_batch_rows: int = 5000
+    # How far ahead GET /transactions expands virtual chains without date_to.
+    virtual_occurrence_horizon_days: int = 730
+    media_thumbnail_sizes: list[int] = [48, 96, 256]
+    media_thumbnail_quality: int = 80
+    media_cache_max_age_seconds: int = 31_536_000
+    media_sprite_retention_days: int = 30
+    media_sprite_prune_batch: int = 100
+    image_upload_workers: int = 2
+    category_cache_max_entries: int = 2048
 
 settings = Settings()
@@ -1,57 +1,50 @@
 from datetime import datetime, timezone
-from io import BytesIO
+import math
 import re
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from fastapi.responses import Response
-from PIL import Image
-from sqlalchemy import func, or_, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
-from config import settings
+from auth import Principal, get_current_user
 from db import get_db
+from media import (
+    PreparedImage,
+    media_response,
+    media_sprite,
+    media_url,
+    prepare_upload,
+    store_prepared_image,
+)
 from models import Counterparty, CounterpartyIndustry, User
 from opf_reference import LEGAL_FORMS
 from schemas import (
     CounterpartyCreate,
     CounterpartyIndustryOut,
+    CounterpartyLogoSpriteCellOut,
+    CounterpartyLogoSpriteOut,
+    CounterpartyLogoSpriteRequest,
     CounterpartyOut,
+    CounterpartyPageOut,
     CounterpartyUpdate,
     LegalFormOut,
 )
 
 router = APIRouter(prefix="/counterparties", tags=["counterparties"])
 
-MAX_LOGO_BYTES = 2 * 1024 * 1024
-MAX_LOGO_DIM = 1024
-ALLOWED_LOGO_FORMATS = {"PNG", "JPEG", "WEBP"}
-FORMAT_TO_MIME = {
-    "PNG": "image/png",
-    "JPEG": "image/jpeg",
-    "WEBP": "image/webp",
-}
-
 LEGAL_FORM_CODES = {item["code"] for item in LEGAL_FORMS}
 
 
-def build_logo_url(counterparty_id: int) -> str:
-    return f"{settings.public_base_url}/counterparties/{counterparty_id}/logo"
-
-
 def apply_logo_url(counterparty: Counterparty) -> None:
     counterparty.logo_url = (
-        build_logo_url(counterparty.id) if counterparty.logo_data else None
+        media_url(counterparty.logo_hash) if counterparty.logo_hash else None
     )
 
 
-def build_photo_url(counterparty_id: int) -> str:
-    return f"{settings.public_base_url}/counterparties/{counterparty_id}/photo"
-
-
 def apply_photo_url(counterparty: Counterparty) -> None:
     counterparty.photo_url = (
-        build_photo_url(counterparty.id) if counterparty.photo_data else None
+        media_url(counterparty.photo_hash) if counterparty.photo_hash else None
     )
 
 
@@ -252,7 +245,7 @@ def list_counterparties(
     include_deleted: bool = Query(default=False),
     deleted_only: bool = Query(default=False),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(Counterparty).where(
         or_(Counterparty.owner_user_id.is_(None), Counterparty.owner_user_id == user.id)
@@ -271,25 +264,144 @@ def list_counterparties(
     return rows
 
 
+def _parse_search_cursor(value: str) -> tuple[str, int]:
+    name, separator, raw_id = value.rpartition("|")
+    if not separator:
+        raise HTTPException(status_code=400, detail="Invalid cursor format")
+    try:
+        return name, int(raw_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor value") from exc
+
+
+def _like_pattern(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/search", response_model=CounterpartyPageOut)
+def search_counterparties(
+    q: str | None = None,
+    industry_id: int | None = None,
+    ids: list[int] | None = Query(default=None),
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    stmt = select(Counterparty).where(
+        or_(Counterparty.owner_user_id.is_(None), Counterparty.owner_user_id == user.id),
+    )
+    if ids:
+        # Lookups by id resolve existing selections, which may be deleted.
+        stmt = stmt.where(Counterparty.id.in_(ids))
+    else:
+        stmt = stmt.where(Counterparty.deleted_at.is_(None))
+    if industry_id is not None:
+        stmt = stmt.where(Counterparty.industry_id == industry_id)
+    query = normalize_text(q)
+    if query:
+        pattern = _like_pattern(query)
+        conditions = [
+            Counterparty.name.ilike(f"%{pattern}%", escape="\\"),
+            Counterparty.full_name.ilike(f"%{pattern}%", escape="\\"),
+        ]
+        if query.isdigit():
+            conditions.append(Counterparty.inn.like(f"{pattern}%", escape="\\"))
+            conditions.append(Counterparty.ogrn.like(f"{pattern}%", escape="\\"))
+        stmt = stmt.where(or_(*conditions))
+    if cursor:
+        cursor_name, cursor_id = _parse_search_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                Counterparty.name > cursor_name,
+                and_(Counterparty.name == cursor_name, Counterparty.id > cursor_id),
+            )
+        )
+
+    stmt = stmt.order_by(Counterparty.name.asc(), Counterparty.id.asc()).limit(limit + 1)
+    rows = list(db.execute(stmt).scalars())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    for row in rows:
+        apply_logo_url(row)
+        apply_photo_url(row)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = f"{last.name}|{last.id}"
+    return CounterpartyPageOut(items=rows, next_cursor=next_cursor, has_more=has_more)
+
+
 @router.get("/legal-forms", response_model=list[LegalFormOut])
-def list_legal_forms(user: User = Depends(get_current_user)) -> list[LegalFormOut]:
+def list_legal_forms(user: Principal = Depends(get_current_user)) -> list[LegalFormOut]:
     return [LegalFormOut(**item) for item in LEGAL_FORMS]
 
 
 @router.get("/industries", response_model=list[CounterpartyIndustryOut])
 def list_industries(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ) -> list[CounterpartyIndustryOut]:
     stmt = select(CounterpartyIndustry).order_by(CounterpartyIndustry.id.asc())
     return list(db.execute(stmt).scalars())
 
 
+@router.post("/logo-sprite", response_model=CounterpartyLogoSpriteOut)
+def get_counterparty_logo_sprite(
+    payload: CounterpartyLogoSpriteRequest,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    rows = db.execute(
+        select(
+            Counterparty.id,
+            Counterparty.entity_type,
+            Counterparty.logo_hash,
+            Counterparty.photo_hash,
+        ).where(
+            Counterparty.id.in_(set(payload.counterparty_ids)),
+            or_(Counterparty.owner_user_id.is_(None), Counterparty.owner_user_id == user.id),
+        )
+    ).all()
+    image_hashes = {
+        row.id: row.photo_hash if row.entity_type == "PERSON" else row.logo_hash
+        for row in rows
+    }
+    image_hashes = {key: value for key, value in image_hashes.items() if value}
+
+    sprite = media_sprite(db, list(image_hashes.values()), payload.size)
+    if sprite is None:
+        raise HTTPException(status_code=404, detail="Logo not found.")
+    db.commit()
+
+    positions = {digest: index for index, digest in enumerate(sprite.cells)}
+    cells = []
+    for counterparty_id, digest in sorted(image_hashes.items()):
+        index = positions.get(digest)
+        if index is None:
+            continue
+        cells.append(
+            CounterpartyLogoSpriteCellOut(
+                counterparty_id=counterparty_id,
+                x=(index % sprite.columns) * sprite.cell_size,
+                y=(index // sprite.columns) * sprite.cell_size,
+            )
+        )
+    return CounterpartyLogoSpriteOut(
+        sprite_url=media_url(sprite.sha256),
+        cell_size=sprite.cell_size,
+        width=sprite.columns * sprite.cell_size,
+        height=math.ceil(len(sprite.cells) / sprite.columns) * sprite.cell_size,
+        cells=cells,
+    )
+
+
 @router.post("", response_model=CounterpartyOut)
 def create_counterparty(
     data: CounterpartyCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     normalized = normalize_payload(data)
     if normalized["industry_id"] is not None:
@@ -330,7 +442,7 @@ def update_counterparty(
     counterparty_id: int,
     data: CounterpartyUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     counterparty = db.get(Counterparty, counterparty_id)
     if not counterparty or counterparty.owner_user_id != user.id:
@@ -380,7 +492,7 @@ def update_counterparty(
 def delete_counterparty(
     counterparty_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     counterparty = db.get(Counterparty, counterparty_id)
     if not counterparty or counterparty.owner_user_id != user.id:
@@ -396,58 +508,31 @@ def delete_counterparty(
 @router.get("/{counterparty_id}/logo")
 def get_counterparty_logo(
     counterparty_id: int,
+    request: Request,
     db: Session = Depends(get_db),
 ):
     counterparty = db.get(Counterparty, counterparty_id)
-    if not counterparty or not counterparty.logo_data:
-        raise HTTPException(status_code=404, detail="Logo not found.")
-    media_type = counterparty.logo_mime or "application/octet-stream"
-    return Response(content=counterparty.logo_data, media_type=media_type)
+    return media_response(
+        request, db, counterparty.logo_hash if counterparty else None, "Logo not found."
+    )
 
 
-@router.post("/{counterparty_id}/logo", response_model=CounterpartyOut)
-async def upload_counterparty_logo(
-    counterparty_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+def _editable_counterparty(
+    db: Session, user: Principal, counterparty_id: int, entity_type: str, detail: str
+) -> Counterparty:
     counterparty = db.get(Counterparty, counterparty_id)
     if not counterparty or counterparty.owner_user_id != user.id:
         raise HTTPException(status_code=404, detail="Контрагент не найден.")
     if counterparty.deleted_at is not None:
         raise HTTPException(status_code=400, detail="Нельзя редактировать удаленного контрагента.")
-    if counterparty.entity_type != "LEGAL":
-        raise HTTPException(status_code=400, detail="Логотип доступен только для ЮЛ/ИП.")
-
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Файл не загружен.")
-    if len(data) > MAX_LOGO_BYTES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Размер логотипа не должен превышать {MAX_LOGO_BYTES // (1024 * 1024)} МБ.",
-        )
+    if counterparty.entity_type != entity_type:
+        raise HTTPException(status_code=400, detail=detail)
+    return counterparty
 
-    try:
-        image = Image.open(BytesIO(data))
-        image.verify()
-        image = Image.open(BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
-
-    if image.format not in ALLOWED_LOGO_FORMATS:
-        raise HTTPException(status_code=400, detail="Недопустимый формат изображения.")
-
-    width, height = image.size
-    if width > MAX_LOGO_DIM or height > MAX_LOGO_DIM:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Разрешение логотипа не должно превышать {MAX_LOGO_DIM}px.",
-        )
 
-    counterparty.logo_mime = FORMAT_TO_MIME[image.format]
-    counterparty.logo_data = data
+def _save_logo(db: Session, counterparty: Counterparty, image: PreparedImage) -> Counterparty:
+    counterparty.logo_mime = image.mime
+    counterparty.logo_hash = store_prepared_image(db, image)
     apply_logo_url(counterparty)
     db.commit()
     db.refresh(counterparty)
@@ -455,16 +540,45 @@ async def upload_counterparty_logo(
     return counterparty
 
 
+def _save_photo(db: Session, counterparty: Counterparty, image: PreparedImage) -> Counterparty:
+    counterparty.photo_mime = image.mime
+    counterparty.photo_hash = store_prepared_image(db, image)
+    apply_photo_url(counterparty)
+    db.commit()
+    db.refresh(counterparty)
+    apply_photo_url(counterparty)
+    return counterparty
+
+
+@router.post("/{counterparty_id}/logo", response_model=CounterpartyOut)
+async def upload_counterparty_logo(
+    counterparty_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    counterparty = await run_in_threadpool(
+        _editable_counterparty,
+        db,
+        user,
+        counterparty_id,
+        "LEGAL",
+        "Логотип доступен только для ЮЛ/ИП.",
+    )
+    image = await prepare_upload(file, "логотипа")
+    return await run_in_threadpool(_save_logo, db, counterparty, image)
+
+
 @router.get("/{counterparty_id}/photo")
 def get_counterparty_photo(
     counterparty_id: int,
+    request: Request,
     db: Session = Depends(get_db),
 ):
     counterparty = db.get(Counterparty, counterparty_id)
-    if not counterparty or not counterparty.photo_data:
-        raise HTTPException(status_code=404, detail="Photo not found.")
-    media_type = counterparty.photo_mime or "application/octet-stream"
-    return Response(content=counterparty.photo_data, media_type=media_type)
+    return media_response(
+        request, db, counterparty.photo_hash if counterparty else None, "Photo not found."
+    )
 
 
 @router.post("/{counterparty_id}/photo", response_model=CounterpartyOut)
@@ -472,46 +586,15 @@ async def upload_counterparty_photo(
     counterparty_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
-    counterparty = db.get(Counterparty, counterparty_id)
-    if not counterparty or counterparty.owner_user_id != user.id:
-        raise HTTPException(status_code=404, detail="Контрагент не найден.")
-    if counterparty.deleted_at is not None:
-        raise HTTPException(status_code=400, detail="Нельзя редактировать удаленного контрагента.")
-    if counterparty.entity_type != "PERSON":
-        raise HTTPException(status_code=400, detail="Фотография доступна только для физических лиц.")
-
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Файл не загружен.")
-    if len(data) > MAX_LOGO_BYTES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Размер фотографии не должен превышать {MAX_LOGO_BYTES // (1024 * 1024)} МБ.",
-        )
-
-    try:
-        image = Image.open(BytesIO(data))
-        image.verify()
-        image = Image.open(BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
-
-    if image.format not in ALLOWED_LOGO_FORMATS:
-        raise HTTPException(status_code=400, detail="Недопустимый формат изображения.")
-
-    width, height = image.size
-    if width > MAX_LOGO_DIM or height > MAX_LOGO_DIM:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Разрешение фотографии не должно превышать {MAX_LOGO_DIM}px.",
-        )
-
-    counterparty.photo_mime = FORMAT_TO_MIME[image.format]
-    counterparty.photo_data = data
-    apply_photo_url(counterparty)
-    db.commit()
-    db.refresh(counterparty)
-    apply_photo_url(counterparty)
-    return counterparty
+    counterparty = await run_in_threadpool(
+        _editable_counterparty,
+        db,
+        user,
+        counterparty_id,
+        "PERSON",
+        "Фотография доступна только для физических лиц.",
+    )
+    image = await prepare_upload(file)
+    return await run_in_threadpool(_save_photo, db, counterparty, image)
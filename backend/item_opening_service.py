@@ -3,8 +3,8 @@ from datetime import date, datetime
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
-from category_service import resolve_category_or_400
-from models import Category, Item, Transaction, User
+from category_service import resolve_category_by_name
+from models import Item, Transaction, User
 from market_utils import is_moex_item
 from transactions import (
     ResolvedSide,
@@ -112,26 +112,6 @@ def _build_item_comment(item: Item, action: str) -> str:
     return f'{action_label}: "{item.name}"'
 
 
-def _resolve_category_by_name(db: Session, user: User, name: str) -> Category:
-    category = (
-        db.query(Category)
-        .filter(Category.name == name, Category.owner_user_id == user.id)
-        .first()
-    )
-    if not category:
-        category = (
-            db.query(Category)
-            .filter(Category.name == name, Category.owner_user_id.is_(None))
-            .first()
-        )
-    if not category:
-        raise HTTPException(status_code=400, detail=f"Category '{name}' not found")
-    resolved = resolve_category_or_400(db, user, category.id)
-    if not resolved:
-        raise HTTPException(status_code=400, detail=f"Category '{name}' is not available")
-    return resolved
-
-
 def _validate_tx_date(tx_date: date, side: ResolvedSide, label: str) -> None:
     if tx_date < side.start_date:
         raise HTTPException(
@@ -270,7 +250,7 @@ def _create_income_expense(
                 )
             primary.current_value_rub = next_balance
 
-    category = _resolve_category_by_name(db, user, category_name)
+    category = resolve_category_by_name(db, user, category_name)
     tx = Transaction(
         user_id=user.id,
         linked_item_id=linked_item_id,
@@ -1,17 +1,37 @@
 from __future__ import annotations
 
 import calendar
+from contextlib import contextmanager
 from dataclasses import dataclass
+import threading
 from datetime import date, datetime, timedelta, timezone
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal, ROUND_CEILING, ROUND_HALF_UP
 
+from cachetools import LRUCache
+import numpy as np
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-
-from category_service import resolve_category_or_400
-from models import Category, Item, ItemPlanSettings, Transaction, TransactionChain, User
-from schemas import ItemPlanSettingsBase
-from transaction_chains import build_schedule_dates
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from category_service import resolve_category_by_name
+from config import settings as app_settings
+from jobs import enqueue_job, job_handler
+from models import Item, ItemPlanSettings, Job, Transaction, TransactionChain, User
+from schemas import (
+    ItemPlanPreviewOut,
+    ItemPlanPreviewRowOut,
+    ItemPlanSettingsBase,
+    ItemReplanEntry,
+    ItemReplanOut,
+    ItemReplanResultOut,
+)
+from transaction_chains import (
+    build_schedule_dates,
+    deferred_planned_inserts,
+    insert_planned_transactions,
+    schedule_date_array,
+    sync_chain_rows,
+)
 
 INTEREST_ITEM_TYPES = {"deposit", "savings_account"}
 LOAN_ASSET_TYPES = {"loan_to_third_party", "third_party_receivables"}
@@ -28,6 +48,13 @@ LOAN_LIABILITY_TYPES = {
 }
 LOAN_ITEM_TYPES = LOAN_ASSET_TYPES | LOAN_LIABILITY_TYPES
 
+# Keyed by user, accounting start date, plan_signature and the fields of the
+# referenced accounts that plan building reads.
+_PREVIEW_CACHE: LRUCache[tuple, ItemPlanPreviewOut] = LRUCache(
+    maxsize=app_settings.plan_preview_cache_max_entries
+)
+_PREVIEW_CACHE_LOCK = threading.Lock()
+
 
 @dataclass(frozen=True)
 class ResolvedPlanSide:
@@ -37,6 +64,42 @@ class ResolvedPlanSide:
     start_date: date
 
 
+@dataclass(frozen=True)
+class PlannedChain:
+    """One AUTO_ITEM chain computed in memory, before anything is written."""
+
+    chain_name: str
+    schedule_dates: list[date]
+    amounts: list[int]
+    direction: str
+    primary_item: Item
+    primary_card_item: Item | None
+    counterparty_item: Item | None
+    counterparty_card_item: Item | None
+    counterparty_id: int | None
+    category_id: int | None
+    purpose: str
+    frequency: str
+    start_date: date
+    end_date: date
+    monthly_day: int | None
+    monthly_rule: str | None
+    interval_days: int | None
+    weekly_day: int | None
+
+
+@dataclass(frozen=True)
+class LoanPlanSchedule:
+    schedule_dates: list[date]
+    base_date: date
+    full_repayment: bool
+    monthly_day: int | None
+    monthly_rule: str | None
+    weekly_day: int | None
+    interval_days: int | None
+    repayment_side: ResolvedPlanSide
+
+
 def _resolve_min_date(user: User, item: Item, account: Item | None = None) -> date:
     if not user.accounting_start_date:
         raise HTTPException(status_code=400, detail="Accounting start date is not set.")
@@ -161,15 +224,189 @@ def delete_auto_chains(
     tx_query.update({Transaction.deleted_at: now}, synchronize_session=False)
 
 
+ITEM_PLAN_SYNC_JOB = "ITEM_PLAN_SYNC"
+
+
+def has_auto_chains(db: Session, user: User, item_id: int) -> bool:
+    return (
+        db.query(TransactionChain.id)
+        .filter(
+            TransactionChain.user_id == user.id,
+            TransactionChain.linked_item_id == item_id,
+            TransactionChain.source == "AUTO_ITEM",
+            TransactionChain.deleted_at.is_(None),
+        )
+        .first()
+        is not None
+    )
+
+
+def queue_item_plan_sync(db: Session, user: User, item: Item) -> Job:
+    """Queue the chain writes for an item whose plan, status or settings changed.
+
+    The job reads the item when it runs: an open item with an enabled plan has
+    its chains rebuilt, anything else has them dropped.
+    """
+    return enqueue_job(
+        db, user, ITEM_PLAN_SYNC_JOB, {"item_id": item.id}, dedupe_key=f"item:{item.id}"
+    )
+
+
+@job_handler(ITEM_PLAN_SYNC_JOB)
+def _run_item_plan_sync(db: Session, user: User, payload: dict) -> dict:
+    item = (
+        db.query(Item)
+        .filter(Item.id == payload["item_id"], Item.user_id == user.id)
+        .with_for_update()
+        .first()
+    )
+    if not item:
+        return {"action": "skipped"}
+    settings = item.plan_settings
+    if settings and settings.enabled and item.closed_at is None and item.archived_at is None:
+        rebuild_item_chains(db, user, item, settings)
+        return {"action": "rebuilt"}
+    delete_auto_chains(db, user, item.id, keep_realized=True)
+    return {"action": "deleted"}
+
+
+def replan_items(db: Session, user: User, entries: list[ItemReplanEntry]) -> ItemReplanOut:
+    """Apply new rates or plan settings to several items and rebuild their
+    chains in one transaction.
+
+    Each item runs in its own savepoint, so a failing item is reported and
+    rolled back without affecting the rest. Category and account lookups are
+    shared across items, and the new planned rows of all items go out in a
+    single bulk insert at the end.
+    """
+    item_ids = {entry.item_id for entry in entries}
+    items = {
+        item.id: item
+        for item in db.query(Item)
+        .options(selectinload(Item.plan_settings))
+        .filter(Item.id.in_(item_ids), Item.user_id == user.id)
+        .with_for_update()
+    }
+
+    results: list[ItemReplanResultOut] = []
+    new_rows: list[dict] = []
+    with shared_plan_lookups(db):
+        for entry in entries:
+            item = items.get(entry.item_id)
+            if not item:
+                detail = "Item not found"
+            elif item.archived_at is not None or item.closed_at is not None:
+                detail = "Cannot replan closed or archived item"
+            elif entry.interest_rate is not None and item.type_code not in (
+                INTEREST_ITEM_TYPES | LOAN_ITEM_TYPES
+            ):
+                detail = "interest_rate is only allowed for deposit, savings_account, or loan types"
+            else:
+                detail = None
+            if detail:
+                results.append(
+                    ItemReplanResultOut(item_id=entry.item_id, status="FAILED", detail=detail)
+                )
+                continue
+
+            savepoint = db.begin_nested()
+            try:
+                old_signature = plan_signature(item, item.plan_settings)
+                if entry.interest_rate is not None:
+                    item.interest_rate = entry.interest_rate
+                settings = upsert_plan_settings(db, item, entry.plan_settings)
+                db.flush()
+                if plan_signature(item, settings) == old_signature:
+                    savepoint.commit()
+                    results.append(
+                        ItemReplanResultOut(item_id=item.id, status="UNCHANGED")
+                    )
+                    continue
+                with deferred_planned_inserts(db) as item_rows:
+                    rebuild_item_chains(db, user, item, settings)
+                savepoint.commit()
+            except HTTPException as exc:
+                savepoint.rollback()
+                results.append(
+                    ItemReplanResultOut(
+                        item_id=item.id, status="FAILED", detail=str(exc.detail)
+                    )
+                )
+                continue
+            new_rows.extend(item_rows)
+            results.append(ItemReplanResultOut(item_id=item.id, status="REPLANNED"))
+
+    insert_planned_transactions(db, new_rows)
+    db.commit()
+    return ItemReplanOut(results=results, inserted_rows=len(new_rows))
+
+
 def rebuild_item_chains(
     db: Session,
     user: User,
     item: Item,
     settings: ItemPlanSettings | None,
+    incremental: bool = True,
 ) -> None:
-    delete_auto_chains(db, user, item.id, keep_realized=True)
-    if settings and settings.enabled:
-        create_item_chains(db, user, item, settings)
+    """Bring the item's AUTO_ITEM chains in line with its plan settings.
+
+    The incremental mode keeps each chain and matches the new schedule to its
+    unrealized planned rows by date: only changed rows are updated, and only
+    missing or obsolete dates are inserted or soft-deleted. Dates the chain
+    has already realized are not planned again. With
+    ``incremental=False`` every chain is dropped and generated again.
+    """
+    if not incremental or not settings or not settings.enabled:
+        delete_auto_chains(db, user, item.id, keep_realized=True)
+        if settings and settings.enabled:
+            create_item_chains(db, user, item, settings)
+        return
+
+    planned_chains = plan_item_chains(db, user, item, settings)
+    chains = (
+        db.query(TransactionChain)
+        .filter(
+            TransactionChain.user_id == user.id,
+            TransactionChain.linked_item_id == item.id,
+            TransactionChain.source == "AUTO_ITEM",
+            TransactionChain.deleted_at.is_(None),
+        )
+        .all()
+    )
+    chains_by_purpose = {chain.purpose: chain for chain in chains}
+    planned_purposes = [planned.purpose for planned in planned_chains]
+    if len(chains_by_purpose) != len(chains) or len(set(planned_purposes)) != len(
+        planned_purposes
+    ):
+        # Chains cannot be paired up unambiguously.
+        delete_auto_chains(db, user, item.id, keep_realized=True)
+        for planned in planned_chains:
+            _create_chain_with_transactions(db, user, item, planned)
+        return
+
+    now = datetime.now(timezone.utc)
+    for planned in planned_chains:
+        chain = chains_by_purpose.pop(planned.purpose, None)
+        if chain is None:
+            _create_chain_with_transactions(db, user, item, planned)
+        else:
+            _sync_chain_with_transactions(db, user, item, chain, planned, now)
+
+    obsolete_ids = [chain.id for chain in chains_by_purpose.values()]
+    if obsolete_ids:
+        for chain in chains_by_purpose.values():
+            chain.deleted_at = now
+        (
+            db.query(Transaction)
+            .filter(
+                Transaction.user_id == user.id,
+                Transaction.chain_id.in_(obsolete_ids),
+                Transaction.transaction_type == "PLANNED",
+                Transaction.status != "REALIZED",
+                Transaction.deleted_at.is_(None),
+            )
+            .update({Transaction.deleted_at: now}, synchronize_session=False)
+        )
 
 
 def create_item_chains(
@@ -178,20 +415,152 @@ def create_item_chains(
     item: Item,
     settings: ItemPlanSettings,
 ) -> None:
+    for planned in plan_item_chains(db, user, item, settings):
+        _create_chain_with_transactions(db, user, item, planned)
+
+
+def plan_item_chains(
+    db: Session,
+    user: User,
+    item: Item,
+    settings: ItemPlanSettings,
+) -> list[PlannedChain]:
     if item.type_code in INTEREST_ITEM_TYPES:
-        _create_interest_chain(db, user, item, settings)
-        return
+        return [_plan_interest_chain(db, user, item, settings)]
     if item.type_code in LOAN_ITEM_TYPES:
-        _create_loan_chains(db, user, item, settings)
-        return
+        return _plan_loan_chains(db, user, item, settings)
     raise HTTPException(status_code=400, detail="Auto plans are not supported for this type")
 
 
+def validate_item_plan(
+    db: Session,
+    user: User,
+    item: Item,
+    settings: ItemPlanSettings,
+) -> None:
+    """Run the plan's settings, date and account checks without computing amounts."""
+    if item.type_code in INTEREST_ITEM_TYPES:
+        _interest_schedule(db, user, item, settings)
+    elif item.type_code in LOAN_ITEM_TYPES:
+        _loan_schedule(db, user, item, settings)
+    else:
+        raise HTTPException(status_code=400, detail="Auto plans are not supported for this type")
+
+
+def _account_cache_key(db: Session, user: User, account_id: int | None) -> tuple:
+    """The account fields plan resolution reads, following a card to its account."""
+    rows = []
+    while account_id is not None and len(rows) < 2:
+        row = db.execute(
+            select(
+                Item.id,
+                Item.kind,
+                Item.type_code,
+                Item.currency_code,
+                Item.counterparty_id,
+                Item.open_date,
+                Item.card_account_id,
+            ).where(Item.id == account_id, Item.user_id == user.id)
+        ).first()
+        if row is None:
+            break
+        rows.append(tuple(row))
+        account_id = row.card_account_id if row.type_code == "bank_card" else None
+    return tuple(rows)
+
+
+def preview_item_chains(
+    db: Session,
+    user: User,
+    item: Item,
+    settings: ItemPlanSettings,
+) -> ItemPlanPreviewOut:
+    signature = plan_signature(item, settings)
+    if signature is None:
+        raise HTTPException(status_code=400, detail="Auto plan is not enabled")
+    account_id = (
+        item.interest_payout_account_id
+        if item.type_code in INTEREST_ITEM_TYPES
+        else settings.repayment_account_id
+    )
+    cache_key = (
+        user.id,
+        user.accounting_start_date,
+        signature,
+        _account_cache_key(db, user, account_id),
+    )
+    with _PREVIEW_CACHE_LOCK:
+        cached = _PREVIEW_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    principal_by_date: dict[date, int] = {}
+    interest_by_date: dict[date, int] = {}
+    for planned in plan_item_chains(db, user, item, settings):
+        target = interest_by_date if planned.purpose == "INTEREST" else principal_by_date
+        for payout_date, amount in zip(planned.schedule_dates, planned.amounts):
+            target[payout_date] = target.get(payout_date, 0) + amount
+
+    rows = [
+        ItemPlanPreviewRowOut(
+            payout_date=payout_date,
+            principal_rub=principal_by_date.get(payout_date, 0),
+            interest_rub=interest_by_date.get(payout_date, 0),
+        )
+        for payout_date in sorted(principal_by_date.keys() | interest_by_date.keys())
+    ]
+    preview = ItemPlanPreviewOut(
+        rows=rows,
+        principal_total_rub=sum(principal_by_date.values()),
+        interest_total_rub=sum(interest_by_date.values()),
+    )
+    with _PREVIEW_CACHE_LOCK:
+        _PREVIEW_CACHE[cache_key] = preview
+    return preview
+
+
+_SHARED_LOOKUPS_KEY = "plan_shared_lookups"
+
+
+@contextmanager
+def shared_plan_lookups(db: Session):
+    """Memoize account resolution across the plans built inside the block, so
+    a batch of items resolves each account once. Categories are already
+    memoized per session by category_service."""
+    db.info[_SHARED_LOOKUPS_KEY] = {}
+    try:
+        yield
+    finally:
+        db.info.pop(_SHARED_LOOKUPS_KEY, None)
+
+
+def _shared_lookup(db: Session, key: tuple, load):
+    lookups = db.info.get(_SHARED_LOOKUPS_KEY)
+    if lookups is None:
+        return load()
+    if key not in lookups:
+        lookups[key] = load()
+    return lookups[key]
+
+
 def _resolve_item_for_plan(
     db: Session,
     user: User,
     item_id: int,
     role_label: str,
+) -> ResolvedPlanSide:
+    return _shared_lookup(
+        db,
+        ("plan_side", user.id, item_id),
+        lambda: _query_item_for_plan(db, user, item_id, role_label),
+    )
+
+
+def _query_item_for_plan(
+    db: Session,
+    user: User,
+    item_id: int,
+    role_label: str,
 ) -> ResolvedPlanSide:
     item = (
         db.query(Item)
@@ -230,37 +599,10 @@ def _resolve_item_for_plan(
     )
 
 
-def _resolve_category_by_name(db: Session, user: User, name: str) -> Category:
-    category = (
-        db.query(Category)
-        .filter(Category.name == name, Category.owner_user_id == user.id)
-        .first()
-    )
-    if not category:
-        category = (
-            db.query(Category)
-            .filter(Category.name == name, Category.owner_user_id.is_(None))
-            .first()
-        )
-    if not category:
-        raise HTTPException(status_code=400, detail=f"Category '{name}' not found")
-    resolved = resolve_category_or_400(db, user, category.id)
-    if not resolved:
-        raise HTTPException(status_code=400, detail=f"Category '{name}' is not available")
-    return resolved
-
-
 def _days_in_year(day: date) -> int:
     return 366 if calendar.isleap(day.year) else 365
 
 
-def _iter_days(start: date, end: date):
-    current = start
-    while current <= end:
-        yield current
-        current += timedelta(days=1)
-
-
 def _round_cents(value: Decimal) -> int:
     return int(value.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
 
@@ -273,9 +615,15 @@ def _sum_interest_cents(
         return Decimal(0)
     annual_rate = Decimal(str(rate)) / Decimal(100)
     total = Decimal(0)
-    for day in _iter_days(start, end):
-        daily_rate = annual_rate / Decimal(_days_in_year(day))
-        total += principal * daily_rate
+    # The daily rate only changes with the year length, so each calendar-year
+    # segment is one multiplication instead of one addition per day.
+    segment_start = start
+    while segment_start <= end:
+        segment_end = min(date(segment_start.year, 12, 31), end)
+        days = (segment_end - segment_start).days + 1
+        daily_rate = annual_rate / Decimal(_days_in_year(segment_start))
+        total += principal * daily_rate * days
+        segment_start = segment_end + timedelta(days=1)
     return total
 
 
@@ -333,12 +681,12 @@ def _ensure_start_date(start_date: date, min_date: date, label: str) -> None:
         )
 
 
-def _create_interest_chain(
+def _interest_schedule(
     db: Session,
     user: User,
     item: Item,
     settings: ItemPlanSettings,
-) -> None:
+) -> tuple[list[date], int | None, str | None, ResolvedPlanSide]:
     if item.interest_rate is None:
         raise HTTPException(status_code=400, detail="interest_rate is required for auto plan")
     if item.interest_payout_order is None:
@@ -366,7 +714,7 @@ def _create_interest_chain(
         start_date, monthly_day, monthly_rule = _resolve_monthly_schedule(
             item.open_date, end_date, settings.first_payout_rule
         )
-        schedule_dates = build_schedule_dates(
+        payout_days = schedule_date_array(
             start_date,
             end_date,
             "MONTHLY",
@@ -375,16 +723,15 @@ def _create_interest_chain(
             monthly_rule,
             None,
         )
-        if end_date not in schedule_dates:
-            schedule_dates.append(end_date)
+        # union1d also keeps the result sorted and unique.
+        payout_days = np.union1d(payout_days, np.array([end_date], dtype="datetime64[D]"))
     else:
-        schedule_dates = [end_date]
+        payout_days = np.array([end_date], dtype="datetime64[D]")
         start_date = end_date
         monthly_day = end_date.day
         monthly_rule = None
 
-    schedule_dates = sorted({dt for dt in schedule_dates})
-    schedule_dates = [dt for dt in schedule_dates if dt >= min_date]
+    schedule_dates = payout_days[payout_days >= np.datetime64(min_date, "D")].tolist()
     if not schedule_dates:
         raise HTTPException(status_code=400, detail="No dates generated for auto plan")
 
@@ -416,7 +763,18 @@ def _create_interest_chain(
                 detail="Interest payout account currency must match item currency",
             )
         _ensure_start_date(schedule_dates[0], primary_side.start_date, "Plan start date")
+    return schedule_dates, monthly_day, monthly_rule, primary_side
+
 
+def _plan_interest_chain(
+    db: Session,
+    user: User,
+    item: Item,
+    settings: ItemPlanSettings,
+) -> PlannedChain:
+    schedule_dates, monthly_day, monthly_rule, primary_side = _interest_schedule(
+        db, user, item, settings
+    )
     amounts_precise: list[Decimal] = []
     amounts_rounded: list[int] = []
     principal_cents = item.initial_value_rub
@@ -479,13 +837,9 @@ def _create_interest_chain(
         if item.type_code == "deposit"
         else "Проценты по накопительным счетам"
     )
-    category = _resolve_category_by_name(db, user, category_name)
+    category = resolve_category_by_name(db, user, category_name)
 
-    _create_chain_with_transactions(
-        db=db,
-        user=user,
-        item=item,
-        settings=settings,
+    return PlannedChain(
         chain_name=f"Проценты: {item.name}",
         schedule_dates=schedule_dates,
         amounts=amounts_rounded,
@@ -507,12 +861,12 @@ def _create_interest_chain(
     )
 
 
-def _create_loan_chains(
+def _loan_schedule(
     db: Session,
     user: User,
     item: Item,
     settings: ItemPlanSettings,
-) -> None:
+) -> LoanPlanSchedule:
     if item.interest_rate is None:
         raise HTTPException(status_code=400, detail="interest_rate is required for loan plan")
     if settings.repayment_frequency is None:
@@ -557,7 +911,6 @@ def _create_loan_chains(
         monthly_rule,
         interval_days,
     )
-    schedule_dates = sorted({dt for dt in schedule_dates})
     if full_repayment and schedule_dates and schedule_dates[-1] != end_date:
         schedule_dates.append(end_date)
     schedule_dates = sorted({dt for dt in schedule_dates})
@@ -580,6 +933,37 @@ def _create_loan_chains(
             status_code=400, detail="Repayment account currency must match loan currency"
         )
     _ensure_start_date(schedule_dates[0], repayment_side.start_date, "Plan start date")
+    if item.kind != "LIABILITY" and (
+        settings.payment_amount_rub is None or settings.payment_amount_kind is None
+    ):
+        raise HTTPException(status_code=400, detail="payment amount is required")
+    return LoanPlanSchedule(
+        schedule_dates=schedule_dates,
+        base_date=base_date,
+        full_repayment=full_repayment,
+        monthly_day=monthly_day,
+        monthly_rule=monthly_rule,
+        weekly_day=weekly_day,
+        interval_days=interval_days,
+        repayment_side=repayment_side,
+    )
+
+
+def _plan_loan_chains(
+    db: Session,
+    user: User,
+    item: Item,
+    settings: ItemPlanSettings,
+) -> list[PlannedChain]:
+    schedule = _loan_schedule(db, user, item, settings)
+    schedule_dates = schedule.schedule_dates
+    base_date = schedule.base_date
+    full_repayment = schedule.full_repayment
+    monthly_day = schedule.monthly_day
+    monthly_rule = schedule.monthly_rule
+    weekly_day = schedule.weekly_day
+    interval_days = schedule.interval_days
+    repayment_side = schedule.repayment_side
 
     if item.kind == "LIABILITY":
         principal_amounts, interest_amounts = _build_auto_loan_schedule(
@@ -590,8 +974,6 @@ def _create_loan_chains(
             repayment_type=settings.repayment_type,
         )
     else:
-        if settings.payment_amount_rub is None or settings.payment_amount_kind is None:
-            raise HTTPException(status_code=400, detail="payment amount is required")
         principal_amounts, interest_amounts = _build_loan_schedule(
             principal_cents=item.initial_value_rub,
             rate=item.interest_rate,
@@ -608,7 +990,7 @@ def _create_loan_chains(
         principal_counterparty = item
         principal_counterparty_card = None
         interest_direction = "EXPENSE"
-        interest_category = _resolve_category_by_name(
+        interest_category = resolve_category_by_name(
             db, user, "Оплата плановых процентов по кредитам"
         )
     else:
@@ -617,13 +999,9 @@ def _create_loan_chains(
         principal_counterparty = repayment_side.effective_item
         principal_counterparty_card = repayment_side.card_item
         interest_direction = "INCOME"
-        interest_category = _resolve_category_by_name(db, user, "Проценты по займам")
+        interest_category = resolve_category_by_name(db, user, "Проценты по займам")
 
-    _create_chain_with_transactions(
-        db=db,
-        user=user,
-        item=item,
-        settings=settings,
+    principal_chain = PlannedChain(
         chain_name=f"Погашение основного долга: {item.name}",
         schedule_dates=schedule_dates,
         amounts=principal_amounts,
@@ -644,11 +1022,7 @@ def _create_loan_chains(
         weekly_day=weekly_day,
     )
 
-    _create_chain_with_transactions(
-        db=db,
-        user=user,
-        item=item,
-        settings=settings,
+    interest_chain = PlannedChain(
         chain_name=f"Проценты: {item.name}",
         schedule_dates=schedule_dates,
         amounts=interest_amounts,
@@ -668,6 +1042,7 @@ def _create_loan_chains(
         interval_days=interval_days,
         weekly_day=weekly_day,
     )
+    return [principal_chain, interest_chain]
 
 
 def _build_loan_schedule(
@@ -768,14 +1143,49 @@ def _simulate_annuity_outstanding(
     return outstanding
 
 
-def _find_annuity_payment(
+def _annuity_interest_factors(
+    rate: float, period_start: date, payout_dates: list[date]
+) -> list[Decimal]:
+    factors: list[Decimal] = []
+    start = period_start
+    for payout_date in payout_dates:
+        factors.append(_sum_interest_cents(1, rate, start, payout_date))
+        start = payout_date + timedelta(days=1)
+    return factors
+
+
+def _estimate_annuity_payment(principal_cents: int, rate: float, factors: list[Decimal]) -> Decimal:
+    # Textbook monthly annuity as the starting point.
+    periods = len(factors)
+    monthly_rate = Decimal(str(rate)) / Decimal(1200)
+    if monthly_rate > 0:
+        growth = (1 + monthly_rate) ** periods
+        guess = Decimal(principal_cents) * monthly_rate * growth / (growth - 1)
+    else:
+        guess = Decimal(principal_cents) / Decimal(periods)
+
+    # Before period i the balance is linear in the payment, a_i - b_i * P, so
+    # one Newton step on the per-period factors lands on the exact root.
+    # Every payment must also exceed its own period's interest:
+    # P > (a_i - b_i * P) * f_i, i.e. P > a_i * f_i / (1 + b_i * f_i).
+    base = Decimal(principal_cents)
+    weight = Decimal(0)
+    interest_floor = Decimal(0)
+    for factor in factors:
+        interest_floor = max(interest_floor, base * factor / (1 + weight * factor))
+        base *= 1 + factor
+        weight = weight * (1 + factor) + 1
+    outstanding = base - weight * guess
+    payment = guess + outstanding / weight
+    return max(payment, interest_floor)
+
+
+def _bisect_annuity_payment(
     principal_cents: int,
     rate: float,
     period_start: date,
     payout_dates: list[date],
 ) -> int:
-    if principal_cents <= 0:
-        return 0
     low = 1
     high = max(principal_cents, 1)
     attempts = 0
@@ -803,6 +1213,42 @@ def _find_annuity_payment(
     return low
 
 
+def _find_annuity_payment(
+    principal_cents: int,
+    rate: float,
+    period_start: date,
+    payout_dates: list[date],
+) -> int:
+    """Smallest whole payment in cents that repays the loan by the last date."""
+    if principal_cents <= 0:
+        return 0
+    if not payout_dates:
+        return _bisect_annuity_payment(principal_cents, rate, period_start, payout_dates)
+
+    factors = _annuity_interest_factors(rate, period_start, payout_dates)
+    estimate = _estimate_annuity_payment(principal_cents, rate, factors)
+    payment = max(int(estimate.to_integral_value(rounding=ROUND_CEILING)), 1)
+
+    def repaid(value: int) -> bool:
+        return (
+            _simulate_annuity_outstanding(
+                principal_cents, rate, period_start, payout_dates, value
+            )
+            <= 0
+        )
+
+    # Confirm the estimate against the exact simulation; only a near-tie can
+    # move it by a cent. Anything further off goes back to bisection.
+    for _ in range(3):
+        if not repaid(payment):
+            payment += 1
+        elif payment > 1 and repaid(payment - 1):
+            payment -= 1
+        else:
+            return payment
+    return _bisect_annuity_payment(principal_cents, rate, period_start, payout_dates)
+
+
 def _build_annuity_schedule(
     principal_cents: int,
     rate: float,
@@ -888,88 +1334,124 @@ def _resolve_principal_payment(
     return principal_payment
 
 
+def _planned_chain_values(item: Item, planned: PlannedChain) -> dict:
+    amount_min = min(planned.amounts)
+    amount_max = max(planned.amounts)
+    return {
+        "name": planned.chain_name,
+        "start_date": planned.start_date,
+        "end_date": planned.end_date,
+        "frequency": planned.frequency,
+        "weekly_day": planned.weekly_day,
+        "monthly_day": planned.monthly_day,
+        "monthly_rule": planned.monthly_rule,
+        "interval_days": planned.interval_days,
+        "linked_item_id": item.id,
+        "source": "AUTO_ITEM",
+        "purpose": planned.purpose,
+        "primary_item_id": planned.primary_item.id,
+        "primary_card_item_id": planned.primary_card_item.id
+        if planned.primary_card_item
+        else None,
+        "counterparty_item_id": planned.counterparty_item.id
+        if planned.counterparty_item
+        else None,
+        "counterparty_card_item_id": planned.counterparty_card_item.id
+        if planned.counterparty_card_item
+        else None,
+        "counterparty_id": planned.counterparty_id,
+        "amount_rub": amount_min,
+        "amount_counterparty": amount_min if planned.direction == "TRANSFER" else None,
+        "amount_is_variable": amount_min != amount_max,
+        "amount_min_rub": amount_min,
+        "amount_max_rub": amount_max,
+        "direction": planned.direction,
+        "category_id": planned.category_id,
+    }
+
+
+def _planned_transaction_values(planned: PlannedChain, amount: int) -> dict:
+    # Everything but the date, type, status and comment of a planned row.
+    return {
+        "primary_item_id": planned.primary_item.id,
+        "primary_card_item_id": planned.primary_card_item.id
+        if planned.primary_card_item
+        else None,
+        "counterparty_item_id": planned.counterparty_item.id
+        if planned.counterparty_item
+        else None,
+        "counterparty_card_item_id": planned.counterparty_card_item.id
+        if planned.counterparty_card_item
+        else None,
+        "counterparty_id": planned.counterparty_id,
+        "amount_rub": amount,
+        "amount_counterparty": amount if planned.direction == "TRANSFER" else None,
+        "direction": planned.direction,
+        "category_id": planned.category_id,
+    }
+
+
+def _planned_transaction_row(
+    user: User, chain_id: int, planned: PlannedChain, tx_date: date, amount: int
+) -> dict:
+    return {
+        "user_id": user.id,
+        "chain_id": chain_id,
+        "transaction_date": datetime.combine(tx_date, datetime.min.time()),
+        "transaction_type": "PLANNED",
+        "status": "CONFIRMED",
+        "comment": None,
+        **_planned_transaction_values(planned, amount),
+    }
+
+
 def _create_chain_with_transactions(
     db: Session,
     user: User,
     item: Item,
-    settings: ItemPlanSettings,
-    chain_name: str,
-    schedule_dates: list[date],
-    amounts: list[int],
-    direction: str,
-    primary_item: Item,
-    primary_card_item: Item | None,
-    counterparty_item: Item | None,
-    counterparty_card_item: Item | None,
-    counterparty_id: int | None,
-    category_id: int | None,
-    purpose: str,
-    frequency: str,
-    start_date: date,
-    end_date: date,
-    monthly_day: int | None,
-    monthly_rule: str | None,
-    interval_days: int | None,
-    weekly_day: int | None,
+    planned: PlannedChain,
 ) -> None:
-    if len(schedule_dates) != len(amounts):
+    if len(planned.schedule_dates) != len(planned.amounts):
         raise HTTPException(status_code=400, detail="Schedule length mismatch")
 
-    amount_min = min(amounts)
-    amount_max = max(amounts)
-    is_variable = amount_min != amount_max
     chain = TransactionChain(
         user_id=user.id,
-        name=chain_name,
-        start_date=start_date,
-        end_date=end_date,
-        frequency=frequency,
-        weekly_day=weekly_day,
-        monthly_day=monthly_day,
-        monthly_rule=monthly_rule,
-        interval_days=interval_days,
-        linked_item_id=item.id,
-        source="AUTO_ITEM",
-        purpose=purpose,
-        primary_item_id=primary_item.id,
-        primary_card_item_id=primary_card_item.id if primary_card_item else None,
-        counterparty_item_id=counterparty_item.id if counterparty_item else None,
-        counterparty_card_item_id=counterparty_card_item.id if counterparty_card_item else None,
-        counterparty_id=counterparty_id,
-        amount_rub=amount_min,
-        amount_counterparty=amount_min if direction == "TRANSFER" else None,
-        amount_is_variable=is_variable,
-        amount_min_rub=amount_min,
-        amount_max_rub=amount_max,
-        direction=direction,
-        category_id=category_id,
         comment=None,
+        **_planned_chain_values(item, planned),
     )
     db.add(chain)
     db.flush()
 
-    txs = []
-    for tx_date, amount in zip(schedule_dates, amounts):
-        txs.append(
-            Transaction(
-                user_id=user.id,
-                chain_id=chain.id,
-                transaction_date=datetime.combine(tx_date, datetime.min.time()),
-                primary_item_id=primary_item.id,
-                primary_card_item_id=primary_card_item.id if primary_card_item else None,
-                counterparty_item_id=counterparty_item.id if counterparty_item else None,
-                counterparty_card_item_id=counterparty_card_item.id
-                if counterparty_card_item
-                else None,
-                counterparty_id=counterparty_id,
-                amount_rub=amount,
-                amount_counterparty=amount if direction == "TRANSFER" else None,
-                direction=direction,
-                transaction_type="PLANNED",
-                status="CONFIRMED",
-                category_id=category_id,
-                comment=None,
-            )
-        )
+    insert_planned_transactions(
+        db,
+        [
+            _planned_transaction_row(user, chain.id, planned, tx_date, amount)
+            for tx_date, amount in zip(planned.schedule_dates, planned.amounts)
+        ],
+    )
 
-    db.add_all(txs)
+
+def _sync_chain_with_transactions(
+    db: Session,
+    user: User,
+    item: Item,
+    chain: TransactionChain,
+    planned: PlannedChain,
+    now: datetime,
+) -> None:
+    if len(planned.schedule_dates) != len(planned.amounts):
+        raise HTTPException(status_code=400, detail="Schedule length mismatch")
+
+    for key, value in _planned_chain_values(item, planned).items():
+        setattr(chain, key, value)
+
+    sync_chain_rows(
+        db,
+        user,
+        chain.id,
+        [
+            _planned_transaction_row(user, chain.id, planned, tx_date, amount)
+            for tx_date, amount in zip(planned.schedule_dates, planned.amounts)
+        ],
+        now,
+    )
@@ -0,0 +1,248 @@
+from datetime import datetime, timedelta, timezone
+import threading
+from typing import Any, Callable
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, event, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from auth import Principal, get_current_user
+from config import settings
+from db import SessionLocal, get_db
+from models import Job, User
+from schemas import JobOut, JobStatus
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+JobHandler = Callable[[Session, User, dict[str, Any]], dict[str, Any] | None]
+
+_HANDLERS: dict[str, JobHandler] = {}
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_WORKERS: list[threading.Thread] = []
+# Set on a session that enqueued a job; workers are woken once it commits.
+_WAKE_ON_COMMIT = "wake_job_workers"
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register the function that runs jobs of this kind.
+
+    Handlers must be idempotent: a job is retried after a failure and may be
+    re-run if its worker dies mid-way. A handler may commit between batches.
+    """
+
+    def register(func: JobHandler) -> JobHandler:
+        _HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+def enqueue_job(
+    db: Session,
+    user: User,
+    kind: str,
+    payload: dict[str, Any],
+    dedupe_key: str | None = None,
+) -> Job:
+    """Add a job to the caller's transaction; workers see it once it commits."""
+    if dedupe_key is not None:
+        queued = (
+            db.query(Job)
+            .filter(
+                Job.user_id == user.id,
+                Job.kind == kind,
+                Job.dedupe_key == dedupe_key,
+                Job.status == "QUEUED",
+            )
+            .first()
+        )
+        if queued:
+            queued.payload = payload
+            return queued
+
+    job = Job(
+        user_id=user.id,
+        kind=kind,
+        dedupe_key=dedupe_key,
+        payload=payload,
+        status="QUEUED",
+        attempts=0,
+        max_attempts=settings.job_max_attempts,
+        run_after=datetime.now(timezone.utc),
+    )
+    db.add(job)
+    db.flush()
+    db.info[_WAKE_ON_COMMIT] = True
+    return job
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers_after_commit(session: Session) -> None:
+    if session.info.pop(_WAKE_ON_COMMIT, False):
+        _WAKE.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_wake_after_rollback(session: Session) -> None:
+    session.info.pop(_WAKE_ON_COMMIT, None)
+
+
+def _fail_exhausted_leases(db: Session, now: datetime, lease_expired: datetime) -> None:
+    # A job that keeps killing or hanging its worker must not run forever.
+    result = db.execute(
+        update(Job)
+        .where(
+            Job.status == "RUNNING",
+            Job.locked_at < lease_expired,
+            Job.attempts >= Job.max_attempts,
+        )
+        .values(
+            status="FAILED",
+            locked_at=None,
+            finished_at=now,
+            last_error="Lease expired on the last attempt",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        db.commit()
+
+
+def _claim_job(db: Session) -> Job | None:
+    now = datetime.now(timezone.utc)
+    lease_expired = now - timedelta(seconds=settings.job_lease_seconds)
+    _fail_exhausted_leases(db, now, lease_expired)
+    job = db.execute(
+        select(Job)
+        .where(
+            or_(
+                and_(Job.status == "QUEUED", Job.run_after <= now),
+                # A RUNNING job whose lease ran out lost its worker.
+                and_(
+                    Job.status == "RUNNING",
+                    Job.locked_at < lease_expired,
+                    Job.attempts < Job.max_attempts,
+                ),
+            )
+        )
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "RUNNING"
+    job.attempts += 1
+    job.locked_at = now
+    db.commit()
+    return job
+
+
+def _record_failure(db: Session, job_id: int, error: str, retry: bool) -> None:
+    db.rollback()
+    job = db.get(Job, job_id)
+    if job is None:
+        return
+    now = datetime.now(timezone.utc)
+    job.last_error = error[:2000]
+    job.locked_at = None
+    if retry and job.attempts < job.max_attempts:
+        job.status = "QUEUED"
+        delay = settings.job_retry_base_seconds * 2 ** (job.attempts - 1)
+        job.run_after = now + timedelta(seconds=delay)
+    else:
+        job.status = "FAILED"
+        job.finished_at = now
+    db.commit()
+
+
+def run_next_job() -> bool:
+    """Claim and run one due job. Returns False when the queue is idle."""
+    with SessionLocal() as db:
+        job = _claim_job(db)
+        if job is None:
+            return False
+
+        job_id = job.id
+        handler = _HANDLERS.get(job.kind)
+        if handler is None:
+            _record_failure(db, job_id, f"Unknown job kind: {job.kind}", retry=False)
+            return True
+
+        try:
+            user = db.get(User, job.user_id)
+            result = handler(db, user, dict(job.payload or {}))
+            job = db.get(Job, job_id)
+            job.status = "DONE"
+            job.result = result
+            job.last_error = None
+            job.locked_at = None
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        except HTTPException as exc:
+            # Validation errors will not go away on retry.
+            _record_failure(db, job_id, str(exc.detail), retry=False)
+        except Exception as exc:
+            _record_failure(db, job_id, f"{type(exc).__name__}: {exc}", retry=True)
+        return True
+
+
+def _worker_loop() -> None:
+    while not _STOP.is_set():
+        try:
+            worked = run_next_job()
+        except SQLAlchemyError:
+            worked = False
+        if not worked:
+            _WAKE.wait(settings.job_poll_seconds)
+            _WAKE.clear()
+
+
+def start_job_workers() -> None:
+    if _WORKERS:
+        return
+    _STOP.clear()
+    for index in range(settings.job_workers):
+        worker = threading.Thread(
+            target=_worker_loop, name=f"job-worker-{index}", daemon=True
+        )
+        worker.start()
+        _WORKERS.append(worker)
+
+
+def stop_job_workers() -> None:
+    _STOP.set()
+    _WAKE.set()
+    for worker in _WORKERS:
+        worker.join(timeout=settings.job_poll_seconds + 5)
+    _WORKERS.clear()
+
+
+@router.get("", response_model=list[JobOut])
+def list_jobs(
+    status: list[JobStatus] | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    stmt = select(Job).where(Job.user_id == user.id)
+    if status:
+        stmt = stmt.where(Job.status.in_(status))
+    stmt = stmt.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit)
+    return list(db.execute(stmt).scalars())
+
+
+@router.get("/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    job = db.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,14 +1,14 @@
-from datetime import datetime, timezone, date as date_type
+from datetime import datetime, timedelta, timezone, date as date_type
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
-from category_service import resolve_category_or_400
+from auth import Principal, get_current_user
+from category_service import category_totals, resolve_category_or_400
 from db import get_db
 from models import Limit, User
-from schemas import LimitCreate, LimitOut
+from schemas import LimitCreate, LimitOut, LimitUsageOut
 
 router = APIRouter(prefix="/limits", tags=["limits"])
 
@@ -39,12 +39,27 @@ def _validate_custom_start_date(user: User, start_date: date_type | None) -> Non
         )
 
 
+def _limit_range(limit: Limit, on: date_type) -> tuple[date_type, date_type] | None:
+    if limit.period == "CUSTOM":
+        if not limit.custom_start_date or not limit.custom_end_date:
+            return None
+        return limit.custom_start_date, limit.custom_end_date
+    if limit.period == "WEEKLY":
+        start = on - timedelta(days=on.weekday())
+        return start, start + timedelta(days=6)
+    if limit.period == "MONTHLY":
+        start = on.replace(day=1)
+        next_month = start.replace(day=28) + timedelta(days=4)
+        return start, next_month - timedelta(days=next_month.day)
+    return on.replace(month=1, day=1), on.replace(month=12, day=31)
+
+
 @router.get("", response_model=list[LimitOut])
 def list_limits(
     include_deleted: bool = Query(default=False),
     deleted_only: bool = Query(default=False),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(Limit).where(Limit.user_id == user.id)
     if deleted_only:
@@ -55,11 +70,55 @@ def list_limits(
     return list(db.execute(stmt).scalars())
 
 
+@router.get("/usage", response_model=list[LimitUsageOut])
+def list_limit_usage(
+    on: date_type | None = Query(default=None),
+    include_deleted: bool = Query(default=False),
+    include_descendants: bool = Query(default=True),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    on = on or date_type.today()
+    stmt = select(Limit).where(Limit.user_id == user.id)
+    if not include_deleted:
+        stmt = stmt.where(Limit.deleted_at.is_(None))
+    limits = db.execute(stmt).scalars()
+
+    by_range: dict[tuple[date_type, date_type], list[Limit]] = {}
+    for limit in limits:
+        limit_range = _limit_range(limit, on)
+        if limit_range:
+            by_range.setdefault(limit_range, []).append(limit)
+
+    # Limits sharing a period are summed together in one grouped query.
+    usage = []
+    for (start_date, end_date), range_limits in by_range.items():
+        totals = category_totals(
+            db,
+            user.id,
+            start_date,
+            end_date,
+            category_ids=sorted({limit.category_id for limit in range_limits}),
+            include_descendants=include_descendants,
+        )
+        for limit in range_limits:
+            spent_rub, _count = totals.get(limit.category_id, (0, 0))
+            usage.append(
+                LimitUsageOut(
+                    limit_id=limit.id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    spent_rub=spent_rub,
+                )
+            )
+    return usage
+
+
 @router.post("", response_model=LimitOut)
 def create_limit(
     data: LimitCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     category = _resolve_expense_category(db, user, data.category_id)
     if data.period == "CUSTOM":
@@ -84,7 +143,7 @@ def update_limit(
     limit_id: int,
     data: LimitCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     limit = (
         db.query(Limit)
@@ -116,7 +175,7 @@ def update_limit(
 def delete_limit(
     limit_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     limit = (
         db.query(Limit)
@@ -1,19 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from fastapi.responses import Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta, date as date_type
 import requests
 from pathlib import Path
-from io import BytesIO
-from PIL import Image
 from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import select, delete, func, or_, text
 from sqlalchemy.exc import SQLAlchemyError
 
 from db import get_db
+from media import (
+    PRIVATE_CACHE_CONTROL,
+    PreparedImage,
+    media_response,
+    media_url,
+    prepare_upload,
+    router as media_router,
+    store_prepared_image,
+)
 from models import (
     Item,
+    ItemPlanSettings,
     User,
     OnboardingState,
     Currency,
@@ -27,6 +37,10 @@ from config import settings
 from schemas import (
     ItemCreate,
     ItemOut,
+    ItemPlanPreviewOut,
+    ItemPlanPreviewRequest,
+    ItemReplanOut,
+    ItemReplanRequest,
     CurrencyOut,
     FxRateOut,
     BankOut,
@@ -40,7 +54,19 @@ from schemas import (
     AccountingStartDateUpdate,
     ItemCloseRequest,
 )
-from auth import get_current_user, create_access_token, hash_password, verify_password
+from auth import (
+    GOOGLE_CERTS,
+    Principal,
+    get_current_user,
+    get_current_user_record,
+    invalidate_principal,
+    password_needs_rehash,
+    shutdown_password_pool,
+    create_access_token,
+    hash_password,
+    verify_password,
+)
+from upstream import CBR_BREAKER, UpstreamUnavailableError, upstream_latency_budget
 
 from transactions import (
     router as transactions_router,
@@ -52,13 +78,18 @@ from limits import router as limits_router
 from counterparties import router as counterparties_router
 from market import router as market_router, resolve_market_instrument
 from onboarding import router as onboarding_router
+from reports import router as reports_router
+from jobs import router as jobs_router, start_job_workers, stop_job_workers
 from market_utils import is_moex_item, is_moex_type
 from item_plan_service import (
     create_item_chains,
-    delete_auto_chains,
+    has_auto_chains,
     plan_signature,
-    rebuild_item_chains,
+    preview_item_chains,
+    queue_item_plan_sync,
+    replan_items,
     upsert_plan_settings,
+    validate_item_plan,
 )
 from item_opening_service import (
     create_commission_transaction,
@@ -71,7 +102,17 @@ from item_opening_service import (
     _build_item_comment,
 )
 
-app = FastAPI(title="FinApp API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    GOOGLE_CERTS.start()
+    start_job_workers()
+    yield
+    stop_job_workers()
+    GOOGLE_CERTS.stop()
+    shutdown_password_pool()
+
+
+app = FastAPI(title="FinApp API", version="0.1.0", lifespan=lifespan)
 
 _FX_CACHE: dict[str, tuple[datetime, list[FxRateOut]]] = {}
 _FX_CACHE_TTL = timedelta(hours=1)
@@ -134,6 +175,9 @@ app.include_router(limits_router)
 app.include_router(counterparties_router)
 app.include_router(market_router)
 app.include_router(onboarding_router)
+app.include_router(reports_router)
+app.include_router(jobs_router)
+app.include_router(media_router)
 
 UPLOADS_DIR = Path(__file__).resolve().parent / "uploads"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
@@ -150,6 +194,20 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(UpstreamUnavailableError)
+def handle_upstream_unavailable(request, exc: UpstreamUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(settings.upstream_reset_seconds)},
+    )
+
+
+@app.exception_handler(requests.RequestException)
+def handle_upstream_error(request, exc: requests.RequestException):
+    return JSONResponse(status_code=502, content={"detail": str(exc)})
+
+
 def _parse_date_req(date_req: str | None) -> date_type | None:
     if not date_req:
         return None
@@ -163,8 +221,10 @@ def _parse_date_req(date_req: str | None) -> date_type | None:
 
 def _fetch_cbr_rates(date_req: str | None) -> tuple[date_type, list[FxRateOut]]:
     params = {"date_req": date_req} if date_req else None
-    response = requests.get("https://cbr.ru/scripts/XML_daily.asp", params=params, timeout=20)
-    response.raise_for_status()
+    response = CBR_BREAKER.get(
+        f"{settings.cbr_base_url.rstrip('/')}/scripts/XML_daily.asp",
+        params=params,
+    )
 
     root = ET.fromstring(response.content)
     response_date_text = (root.attrib.get("Date") or "").strip()
@@ -367,28 +427,12 @@ def _get_bank_industry_id(db: Session) -> int | None:
 
 def _apply_logo_url(counterparty: Counterparty) -> None:
     counterparty.logo_url = (
-        f"{settings.public_base_url}/counterparties/{counterparty.id}/logo"
-        if counterparty.logo_data
-        else None
+        media_url(counterparty.logo_hash) if counterparty.logo_hash else None
     )
 
 
-MAX_ITEM_PHOTO_BYTES = 2 * 1024 * 1024
-MAX_ITEM_PHOTO_DIM = 1024
-ALLOWED_ITEM_PHOTO_FORMATS = {"PNG", "JPEG", "WEBP"}
-_FORMAT_TO_MIME = {
-    "PNG": "image/png",
-    "JPEG": "image/jpeg",
-    "WEBP": "image/webp",
-}
-
-
 def _apply_item_photo_url(item: Item) -> None:
-    url = (
-        f"{settings.public_base_url}/items/{item.id}/photo"
-        if item.photo_data
-        else None
-    )
+    url = media_url(item.photo_hash) if item.photo_hash else None
     setattr(item, "photo_url", url)
 
 
@@ -578,6 +622,9 @@ def login(
     user = db.execute(select(User).where(User.login == payload.login)).scalar_one_or_none()
     if not user or not verify_password(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = hash_password(payload.password)
+        db.commit()
 
     token = create_access_token(user.id)
     return AuthResponse(
@@ -585,28 +632,19 @@ def login(
         user=AuthUserOut(id=user.id, login=user.login, name=user.name),
     )
 
-MAX_PHOTO_BYTES = 2 * 1024 * 1024
-MAX_PHOTO_DIM = 1024
-ALLOWED_PHOTO_FORMATS = {"PNG", "JPEG", "WEBP"}
-FORMAT_TO_MIME = {
-    "PNG": "image/png",
-    "JPEG": "image/jpeg",
-    "WEBP": "image/webp",
-}
-
 
 def build_user_photo_url(user_id: int) -> str:
     return f"{settings.public_base_url}/users/me/photo"
 
 
 def apply_user_photo_url(user: User) -> None:
-    if user.photo_data:
+    if user.photo_hash:
         user.photo_url = build_user_photo_url(user.id)
 
 
 @app.get("/users/me", response_model=UserMeOut)
 def get_me(
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_record),
     db: Session = Depends(get_db),
 ):
     apply_user_photo_url(user)
@@ -617,7 +655,7 @@ def get_me(
 def set_accounting_start_date(
     payload: AccountingStartDateUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_record),
 ):
     if user.accounting_start_date is not None:
         raise HTTPException(status_code=400, detail="Accounting start date is already set.")
@@ -645,6 +683,7 @@ def set_accounting_start_date(
     )
 
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
@@ -653,7 +692,7 @@ def set_accounting_start_date(
 def update_user_profile(
     payload: UserProfileUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_record),
 ):
     # Валидация: first_name обязателен, если пользователь не из Google или если google_sub есть, но first_name пустое
     if payload.first_name is not None:
@@ -681,40 +720,9 @@ def update_user_profile(
     return user
 
 
-@app.post("/users/me/photo", response_model=UserMeOut)
-async def upload_user_photo(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Файл не загружен.")
-    if len(data) > MAX_PHOTO_BYTES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Размер фотографии не должен превышать {MAX_PHOTO_BYTES // (1024 * 1024)} МБ.",
-        )
-
-    try:
-        image = Image.open(BytesIO(data))
-        image.verify()
-        image = Image.open(BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
-
-    if image.format not in ALLOWED_PHOTO_FORMATS:
-        raise HTTPException(status_code=400, detail="Недопустимый формат изображения.")
-
-    width, height = image.size
-    if width > MAX_PHOTO_DIM or height > MAX_PHOTO_DIM:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Разрешение фотографии не должно превышать {MAX_PHOTO_DIM}px.",
-        )
-
-    user.photo_mime = FORMAT_TO_MIME[image.format]
-    user.photo_data = data
+def _save_user_photo(db: Session, user: User, image: PreparedImage) -> User:
+    user.photo_mime = image.mime
+    user.photo_hash = store_prepared_image(db, image)
     apply_user_photo_url(user)
     db.commit()
     db.refresh(user)
@@ -722,22 +730,37 @@ async def upload_user_photo(
     return user
 
 
+@app.post("/users/me/photo", response_model=UserMeOut)
+async def upload_user_photo(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user_record),
+):
+    image = await prepare_upload(file)
+    return await run_in_threadpool(_save_user_photo, db, user, image)
+
+
 @app.get("/users/me/photo")
 def get_user_photo(
-    user: User = Depends(get_current_user),
+    request: Request,
+    user: User = Depends(get_current_user_record),
+    db: Session = Depends(get_db),
 ):
-    if not user.photo_data:
-        raise HTTPException(status_code=404, detail="Photo not found.")
-    media_type = user.photo_mime or "application/octet-stream"
-    return Response(content=user.photo_data, media_type=media_type)
+    return media_response(
+        request, db, user.photo_hash, "Photo not found.", cache_control=PRIVATE_CACHE_CONTROL
+    )
 
 
-@app.get("/items", response_model=list[ItemOut])
+@app.get(
+    "/items",
+    response_model=list[ItemOut],
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def list_items(
     include_archived: bool = False,
     include_closed: bool = False,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(Item).where(Item.user_id == user.id).options(
         selectinload(Item.plan_settings)
@@ -765,7 +788,7 @@ def list_items(
 @app.get("/currencies", response_model=list[CurrencyOut])
 def list_currencies(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(Currency).order_by(Currency.iso_char_code.asc())
     return list(db.execute(stmt).scalars())
@@ -775,7 +798,7 @@ def list_currencies(
 def list_banks(
     q: str | None = None,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     bank_industry_id = _get_bank_industry_id(db)
     if not bank_industry_id:
@@ -796,23 +819,33 @@ def list_banks(
     return rows
 
 
-@app.get("/fx-rates", response_model=list[FxRateOut])
+@app.get(
+    "/fx-rates",
+    response_model=list[FxRateOut],
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def list_fx_rates(
     date_req: str | None = None,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     try:
         return _get_fx_rates(date_req, db)
+    except UpstreamUnavailableError:
+        raise
     except requests.RequestException as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
 
 
-@app.post("/fx-rates/batch", response_model=dict[str, list[FxRateOut]])
+@app.post(
+    "/fx-rates/batch",
+    response_model=dict[str, list[FxRateOut]],
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def list_fx_rates_batch(
     payload: FxRatesBatchRequest,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     results: dict[str, list[FxRateOut]] = {}
     for raw in {value.strip() for value in payload.dates if value}:
@@ -828,11 +861,15 @@ def list_fx_rates_batch(
     return results
 
 
-@app.post("/items", response_model=ItemOut)
+@app.post(
+    "/items",
+    response_model=ItemOut,
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def create_item(
     payload: ItemCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     accounting_start_date = _ensure_accounting_start_date(user)
     is_moex = is_moex_type(payload.type_code)
@@ -1084,13 +1121,59 @@ def create_item(
     _apply_item_photo_url(item)
     return item
 
-@app.patch("/items/{item_id}", response_model=ItemOut)
+@app.post("/items/plan-preview", response_model=ItemPlanPreviewOut)
+def preview_item_plan(
+    payload: ItemPlanPreviewRequest,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    accounting_start_date = _ensure_accounting_start_date(user)
+    deposit_end_date = None
+    if payload.type_code == "deposit" and payload.deposit_term_days:
+        deposit_end_date = payload.open_date + timedelta(days=payload.deposit_term_days)
+
+    # Transient objects only: nothing is added to the session.
+    item = Item(
+        user_id=user.id,
+        kind=payload.kind,
+        type_code=payload.type_code,
+        name="",
+        currency_code=payload.currency_code,
+        open_date=payload.open_date,
+        deposit_term_days=payload.deposit_term_days,
+        deposit_end_date=deposit_end_date,
+        interest_rate=payload.interest_rate,
+        interest_payout_order=payload.interest_payout_order,
+        interest_capitalization=payload.interest_capitalization,
+        interest_payout_account_id=payload.interest_payout_account_id,
+        initial_value_rub=payload.initial_value_rub,
+        start_date=accounting_start_date,
+    )
+    settings = ItemPlanSettings(**payload.plan_settings.model_dump())
+    return preview_item_chains(db, user, item, settings)
+
+
+@app.post("/items/replan", response_model=ItemReplanOut)
+def replan_items_batch(
+    payload: ItemReplanRequest,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    _ensure_accounting_start_date(user)
+    return replan_items(db, user, payload.items)
+
+
+@app.patch(
+    "/items/{item_id}",
+    response_model=ItemOut,
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def update_item(
     item_id: int,
     payload: ItemCreate,
     purge_card_transactions: bool = False,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     item = db.get(Item, item_id)
     if not item or item.user_id != user.id:
@@ -1380,11 +1463,15 @@ def update_item(
     is_plan_enabled = settings.enabled if settings else False
     new_signature = plan_signature(item, settings)
 
+    plan_job = None
     if is_plan_enabled:
         if old_signature != new_signature:
-            rebuild_item_chains(db, user, item, settings)
+            # Check the settings now so they still fail the request; amounts and
+            # chain writes run in the background.
+            validate_item_plan(db, user, item, settings)
+            plan_job = queue_item_plan_sync(db, user, item)
     elif was_plan_enabled:
-        delete_auto_chains(db, user, item.id, keep_realized=True)
+        plan_job = queue_item_plan_sync(db, user, item)
 
     if should_rebuild_opening and new_history_status == "NEW" and has_opening_value:
         create_opening_transactions(
@@ -1421,13 +1508,15 @@ def update_item(
     db.commit()
     db.refresh(item)
     _apply_item_photo_url(item)
+    if plan_job:
+        setattr(item, "plan_job_id", plan_job.id)
     return item
 
 @app.patch("/items/{item_id}/archive", response_model=ItemOut)
 def archive_item(
     item_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     item = db.get(Item, item_id)
     if not item or item.user_id != user.id:
@@ -1436,20 +1525,28 @@ def archive_item(
     if item.archived_at is None:
         item.archived_at = func.now()
 
-    delete_auto_chains(db, user, item.id, keep_realized=True)
+    plan_job = None
+    if has_auto_chains(db, user, item.id):
+        plan_job = queue_item_plan_sync(db, user, item)
 
     db.commit()
     db.refresh(item)
     _apply_item_photo_url(item)
+    if plan_job:
+        setattr(item, "plan_job_id", plan_job.id)
     return item
 
-@app.patch("/items/{item_id}/close", response_model=ItemOut)
+@app.patch(
+    "/items/{item_id}/close",
+    response_model=ItemOut,
+    dependencies=[Depends(upstream_latency_budget)],
+)
 def close_item(
     item_id: int,
     close_cards: bool = False,
     payload: ItemCloseRequest | None = None,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     item = db.get(Item, item_id)
     if not item or item.user_id != user.id:
@@ -1608,66 +1705,41 @@ def close_item(
     if item.closed_at is None:
         item.closed_at = func.now()
 
-    delete_auto_chains(db, user, item.id, keep_realized=True)
+    plan_job = None
+    if has_auto_chains(db, user, item.id):
+        plan_job = queue_item_plan_sync(db, user, item)
 
     db.commit()
     db.refresh(item)
     _apply_item_photo_url(item)
+    if plan_job:
+        setattr(item, "plan_job_id", plan_job.id)
     return item
 
 @app.get("/items/{item_id}/photo")
 def get_item_photo(
     item_id: int,
+    request: Request,
     db: Session = Depends(get_db),
 ):
     item = db.get(Item, item_id)
-    if not item or not item.photo_data:
-        raise HTTPException(status_code=404, detail="Photo not found.")
-    media_type = item.photo_mime or "application/octet-stream"
-    return Response(content=item.photo_data, media_type=media_type)
+    return media_response(
+        request, db, item.photo_hash if item else None, "Photo not found."
+    )
 
 
-@app.post("/items/{item_id}/photo", response_model=ItemOut)
-async def upload_item_photo(
-    item_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+def _editable_item(db: Session, user: Principal, item_id: int) -> Item:
     item = db.get(Item, item_id)
     if not item or item.user_id != user.id:
         raise HTTPException(status_code=404, detail="Item not found.")
     if item.archived_at is not None:
         raise HTTPException(status_code=400, detail="Cannot edit archived item.")
+    return item
 
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Файл не загружен.")
-    if len(data) > MAX_ITEM_PHOTO_BYTES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Размер фотографии не должен превышать {MAX_ITEM_PHOTO_BYTES // (1024 * 1024)} МБ.",
-        )
-
-    try:
-        image = Image.open(BytesIO(data))
-        image.verify()
-        image = Image.open(BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
-
-    if image.format not in ALLOWED_ITEM_PHOTO_FORMATS:
-        raise HTTPException(status_code=400, detail="Недопустимый формат изображения.")
-
-    width, height = image.size
-    if width > MAX_ITEM_PHOTO_DIM or height > MAX_ITEM_PHOTO_DIM:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Разрешение фотографии не должно превышать {MAX_ITEM_PHOTO_DIM}px.",
-        )
 
-    item.photo_mime = _FORMAT_TO_MIME[image.format]
-    item.photo_data = data
+def _save_item_photo(db: Session, item: Item, image: PreparedImage) -> Item:
+    item.photo_mime = image.mime
+    item.photo_hash = store_prepared_image(db, image)
     item.photo_updated_at = func.now()
     db.commit()
     db.refresh(item)
@@ -1675,10 +1747,22 @@ async def upload_item_photo(
     return item
 
 
+@app.post("/items/{item_id}/photo", response_model=ItemOut)
+async def upload_item_photo(
+    item_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    item = await run_in_threadpool(_editable_item, db, user, item_id)
+    image = await prepare_upload(file)
+    return await run_in_threadpool(_save_item_photo, db, item, image)
+
+
 @app.get("/items/archived", response_model=list[ItemOut])
 def list_archived_items(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
 
     stmt = select(Item).where(
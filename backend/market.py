@@ -1,27 +1,47 @@
-from datetime import datetime, timedelta, date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone, date
+import threading
 from typing import Any
 
 import requests
+from cachetools import LRUCache
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
+from auth import Principal, get_current_user
 from config import settings
-from db import get_db
+from db import SessionLocal, get_db
 from market_utils import MOEX_TYPE_CODES, is_moex_type
-from models import MarketInstrument, MarketPrice, User
+from models import MarketInstrument, MarketPrice
 from schemas import (
     MarketBoardOut,
     MarketInstrumentDetailsOut,
     MarketInstrumentOut,
     MarketPriceOut,
 )
+from upstream import MOEX_BREAKER, UpstreamUnavailableError, upstream_latency_budget
 
-router = APIRouter(prefix="/market", tags=["market"])
+router = APIRouter(
+    prefix="/market",
+    tags=["market"],
+    dependencies=[Depends(upstream_latency_budget)],
+)
 
-_PRICE_CACHE: dict[str, tuple[datetime, MarketPriceOut]] = {}
-_PRICE_CACHE_TTL = timedelta(minutes=15)
+# Bounded per-process front of the shared market_prices table. Entries keep the
+# time the price was last refreshed from ISS, so stale ones can still be served
+# while a background refresh runs.
+_PRICE_CACHE: LRUCache[str, tuple[datetime, MarketPriceOut]] = LRUCache(
+    maxsize=settings.market_price_cache_max_entries
+)
+_PRICE_CACHE_LOCK = threading.Lock()
+_PRICE_CACHE_TTL = timedelta(seconds=settings.market_price_cache_ttl_seconds)
+_PRICE_REFRESH_INFLIGHT: set[str] = set()
+_PRICE_REFRESH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.market_price_refresh_workers,
+    thread_name_prefix="market-price-refresh",
+)
 
 
 def _table_rows(payload: dict[str, Any], key: str) -> list[dict[str, Any]]:
@@ -145,12 +165,10 @@ def _parse_bool(value: Any) -> bool | None:
 
 
 def _moex_get(path: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
-    response = requests.get(
+    response = MOEX_BREAKER.get(
         f"{settings.moex_base_url.rstrip('/')}/{path.lstrip('/')}",
         params=params,
-        timeout=settings.moex_timeout_seconds,
     )
-    response.raise_for_status()
     payload = response.json()
     if not isinstance(payload, dict):
         raise HTTPException(status_code=502, detail="Unexpected MOEX response")
@@ -348,6 +366,24 @@ def _apply_bond_price(price_out: MarketPriceOut, face_value_cents: int | None) -
     price_out.price_percent_bp = None
 
 
+def _search_stored_instruments(
+    db: Session, q: str | None, type_code: str | None, limit: int, offset: int
+) -> list[MarketInstrument]:
+    stmt = select(MarketInstrument)
+    if q:
+        pattern = f"%{q}%"
+        stmt = stmt.where(
+            MarketInstrument.secid.ilike(pattern)
+            | MarketInstrument.isin.ilike(pattern)
+            | MarketInstrument.short_name.ilike(pattern)
+            | MarketInstrument.name.ilike(pattern)
+        )
+    if type_code and is_moex_type(type_code):
+        stmt = stmt.where(MarketInstrument.type_code == type_code)
+    stmt = stmt.order_by(MarketInstrument.secid).limit(limit).offset(offset)
+    return list(db.execute(stmt).scalars())
+
+
 @router.get("/instruments", response_model=list[MarketInstrumentOut])
 def search_instruments(
     q: str | None = None,
@@ -355,12 +391,15 @@ def search_instruments(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     params: dict[str, Any] = {"iss.meta": "off", "limit": limit, "start": offset}
     if q:
         params["q"] = q
-    payload = _moex_get("securities.json", params=params)
+    try:
+        payload = _moex_get("securities.json", params=params)
+    except UpstreamUnavailableError:
+        return _search_stored_instruments(db, q, type_code, limit, offset)
     rows = _table_rows(payload, "securities")
 
     candidates: list[dict[str, Any]] = []
@@ -416,26 +455,72 @@ def search_instruments(
 def get_instrument_details(
     secid: str,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
-    details, boards = _fetch_instrument_details(secid)
+    try:
+        details, boards = _fetch_instrument_details(secid)
+    except UpstreamUnavailableError:
+        instrument = db.get(MarketInstrument, secid)
+        if not instrument:
+            raise
+        return MarketInstrumentDetailsOut(instrument=instrument, boards=[])
     instrument = _upsert_instrument(db, details)
     return MarketInstrumentDetailsOut(instrument=instrument, boards=boards)
 
 
-@router.get("/instruments/{secid}/price", response_model=MarketPriceOut)
-def get_instrument_price(
-    secid: str,
-    board_id: str | None = None,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    cache_key = f"{secid}|{board_id or ''}"
-    cached = _PRICE_CACHE.get(cache_key)
-    now = datetime.utcnow()
-    if cached and now - cached[0] < _PRICE_CACHE_TTL:
-        return cached[1]
+def _price_cache_get(cache_key: str) -> tuple[datetime, MarketPriceOut] | None:
+    with _PRICE_CACHE_LOCK:
+        return _PRICE_CACHE.get(cache_key)
+
+
+def _price_cache_put(cache_key: str, refreshed_at: datetime, price: MarketPriceOut) -> None:
+    with _PRICE_CACHE_LOCK:
+        _PRICE_CACHE[cache_key] = (refreshed_at, price)
+
+
+def _price_out_from_row(row: MarketPrice) -> MarketPriceOut:
+    return MarketPriceOut(
+        instrument_id=row.instrument_id,
+        board_id=row.board_id,
+        price_date=row.price_date,
+        price_time=None,
+        price_cents=row.price_cents,
+        price_percent_bp=row.price_percent_bp,
+        accint_cents=row.accint_cents,
+        yield_bp=row.yield_bp,
+        currency_code=row.currency_code,
+        updated_at=row.updated_at,
+    )
+
+
+def _load_stored_price(db: Session, secid: str, board_id: str | None) -> MarketPrice | None:
+    if not board_id:
+        instrument = db.get(MarketInstrument, secid)
+        board_id = instrument.default_board_id if instrument else None
+    if not board_id:
+        return None
+    return (
+        db.execute(
+            select(MarketPrice)
+            .where(
+                MarketPrice.instrument_id == secid,
+                MarketPrice.board_id == board_id,
+            )
+            .order_by(MarketPrice.price_date.desc())
+            .limit(1)
+        )
+        .scalars()
+        .first()
+    )
+
+
+def _is_fresh(refreshed_at: datetime | None, now: datetime) -> bool:
+    return refreshed_at is not None and now - refreshed_at < _PRICE_CACHE_TTL
+
 
+def _refresh_instrument_price(
+    db: Session, secid: str, board_id: str | None
+) -> MarketPriceOut:
     details, boards = _fetch_instrument_details(secid)
     instrument = _upsert_instrument(db, details)
     selected_board_id = _select_board_id(board_id, instrument, boards)
@@ -448,12 +533,9 @@ def get_instrument_price(
                 market = market or board.market
                 break
 
-    try:
-        price_date, price_out = _fetch_latest_price(
-            secid, selected_board_id, engine=engine, market=market
-        )
-    except requests.RequestException as exc:
-        raise HTTPException(status_code=502, detail=str(exc)) from exc
+    price_date, price_out = _fetch_latest_price(
+        secid, selected_board_id, engine=engine, market=market
+    )
 
     if instrument.type_code == "bonds":
         face_value_cents = instrument.face_value_cents or details.get("face_value_cents")
@@ -480,24 +562,103 @@ def get_instrument_price(
     existing.yield_bp = price_out.yield_bp
     existing.currency_code = price_out.currency_code or instrument.currency_code
     existing.source = "MOEX"
+    # Touch updated_at explicitly: an unchanged row would otherwise skip the
+    # UPDATE and other workers would keep treating the price as stale.
+    existing.updated_at = func.now()
     db.add(existing)
     db.commit()
+    db.refresh(existing)
+    resolved = _price_out_from_row(existing)
+    resolved.price_time = price_out.price_time
+    return resolved
 
-    resolved = MarketPriceOut(
-        instrument_id=secid,
-        board_id=selected_board_id,
-        price_date=price_date,
-        price_time=None,
-        price_cents=existing.price_cents,
-        price_percent_bp=existing.price_percent_bp,
-        accint_cents=existing.accint_cents,
-        yield_bp=existing.yield_bp,
-        currency_code=existing.currency_code,
-    )
-    _PRICE_CACHE[cache_key] = (now, resolved)
+
+def _run_price_refresh(cache_key: str, secid: str, board_id: str | None) -> None:
+    db = SessionLocal()
+    try:
+        # Another worker may have refreshed the shared row in the meantime.
+        stored = _load_stored_price(db, secid, board_id)
+        now = datetime.now(timezone.utc)
+        if stored is not None and _is_fresh(stored.updated_at, now):
+            _price_cache_put(cache_key, stored.updated_at, _price_out_from_row(stored))
+            return
+        price = _refresh_instrument_price(db, secid, board_id)
+        _price_cache_put(cache_key, price.updated_at or now, price)
+    except (requests.RequestException, HTTPException, SQLAlchemyError):
+        db.rollback()
+    finally:
+        db.close()
+        with _PRICE_CACHE_LOCK:
+            _PRICE_REFRESH_INFLIGHT.discard(cache_key)
+
+
+def _schedule_price_refresh(cache_key: str, secid: str, board_id: str | None) -> None:
+    with _PRICE_CACHE_LOCK:
+        if cache_key in _PRICE_REFRESH_INFLIGHT:
+            return
+        _PRICE_REFRESH_INFLIGHT.add(cache_key)
+    try:
+        _PRICE_REFRESH_EXECUTOR.submit(_run_price_refresh, cache_key, secid, board_id)
+    except RuntimeError:
+        with _PRICE_CACHE_LOCK:
+            _PRICE_REFRESH_INFLIGHT.discard(cache_key)
+
+
+@router.get("/instruments/{secid}/price", response_model=MarketPriceOut)
+def get_instrument_price(
+    secid: str,
+    board_id: str | None = None,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    cache_key = f"{secid}|{board_id or ''}"
+    now = datetime.now(timezone.utc)
+    cached = _price_cache_get(cache_key)
+    if cached is None:
+        stored = _load_stored_price(db, secid, board_id)
+        if stored is not None and stored.updated_at is not None:
+            cached = (stored.updated_at, _price_out_from_row(stored))
+            _price_cache_put(cache_key, *cached)
+
+    if cached is not None:
+        refreshed_at, price = cached
+        if _is_fresh(refreshed_at, now):
+            return price
+        # Stale-while-revalidate: answer with the last known price right away
+        # and let a single background refresh per key update the store.
+        _schedule_price_refresh(cache_key, secid, board_id)
+        return price.model_copy(update={"is_stale": True})
+
+    try:
+        resolved = _refresh_instrument_price(db, secid, board_id)
+    except UpstreamUnavailableError:
+        raise
+    except requests.RequestException as exc:
+        raise HTTPException(status_code=502, detail=str(exc)) from exc
+    _price_cache_put(cache_key, resolved.updated_at or now, resolved)
     return resolved
 
 
+def _load_stored_prices(
+    db: Session, secid: str, board_id: str | None, from_date: date, to_date: date
+) -> list[MarketPriceOut] | None:
+    instrument = db.get(MarketInstrument, secid)
+    board_id = board_id or (instrument.default_board_id if instrument else None)
+    if not board_id:
+        return None
+    rows = db.execute(
+        select(MarketPrice)
+        .where(
+            MarketPrice.instrument_id == secid,
+            MarketPrice.board_id == board_id,
+            MarketPrice.price_date >= from_date,
+            MarketPrice.price_date <= to_date,
+        )
+        .order_by(MarketPrice.price_date)
+    ).scalars()
+    return [_price_out_from_row(row).model_copy(update={"is_stale": True}) for row in rows]
+
+
 @router.get("/instruments/{secid}/prices", response_model=list[MarketPriceOut])
 def get_instrument_prices(
     secid: str,
@@ -505,12 +666,18 @@ def get_instrument_prices(
     to_date: date = Query(..., alias="to"),
     board_id: str | None = None,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     if from_date > to_date:
         raise HTTPException(status_code=400, detail="from must be on or before to")
 
-    details, boards = _fetch_instrument_details(secid)
+    try:
+        details, boards = _fetch_instrument_details(secid)
+    except UpstreamUnavailableError:
+        stored = _load_stored_prices(db, secid, board_id, from_date, to_date)
+        if stored is None:
+            raise
+        return stored
     instrument = _upsert_instrument(db, details)
     selected_board_id = _select_board_id(board_id, instrument, boards)
 
@@ -533,6 +700,8 @@ def get_instrument_prices(
                 "till": to_date.isoformat(),
             },
         )
+    except UpstreamUnavailableError:
+        raise
     except requests.RequestException as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
 
@@ -0,0 +1,395 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import hashlib
+from io import BytesIO
+import math
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile
+from fastapi.responses import Response
+from PIL import Image, ImageOps
+from sqlalchemy import delete, exists, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from db import get_db
+from models import Counterparty, MediaBlob, MediaSprite, MediaThumbnail
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+DEFAULT_MIME = "application/octet-stream"
+THUMBNAIL_MIME = "image/webp"
+MUTABLE_CACHE_CONTROL = "no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+MAX_UPLOAD_DIM = 1024
+ALLOWED_UPLOAD_FORMATS = {"PNG", "JPEG", "WEBP"}
+FORMAT_TO_MIME = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+_IMAGE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.image_upload_workers,
+    thread_name_prefix="image-upload",
+)
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime: str
+    thumbnails: dict[int, bytes]
+
+
+def media_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def media_url(digest: str, size: int | None = None) -> str:
+    url = f"{settings.public_base_url}/media/{digest}"
+    return f"{url}?size={size}" if size else url
+
+
+def render_thumbnail(data: bytes, size: int) -> bytes | None:
+    try:
+        with Image.open(BytesIO(data)) as source:
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+                image.mode == "P" and "transparency" in image.info
+            )
+            image = image.convert("RGBA" if has_alpha else "RGB")
+            output = BytesIO()
+            image.save(output, format="WEBP", quality=settings.media_thumbnail_quality)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return output.getvalue()
+
+
+def _reencode(image: Image.Image, image_format: str) -> bytes:
+    image = ImageOps.exif_transpose(image)
+    # Drop EXIF, ICC, XMP and text chunks; keep only what rendering needs.
+    transparency = image.info.get("transparency")
+    image.info = {"transparency": transparency} if transparency is not None else {}
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = BytesIO()
+    if image_format == "PNG":
+        image.save(output, format="PNG", optimize=True)
+    else:
+        image.save(output, format=image_format, quality=90)
+    return output.getvalue()
+
+
+def _prepare_image(data: bytes, noun: str) -> PreparedImage:
+    try:
+        Image.open(BytesIO(data)).verify()
+        image = Image.open(BytesIO(data))
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
+
+    image_format = image.format
+    if image_format not in ALLOWED_UPLOAD_FORMATS:
+        raise HTTPException(status_code=400, detail="Недопустимый формат изображения.")
+
+    # The header gives the size before any pixels are decoded.
+    width, height = image.size
+    if width > MAX_UPLOAD_DIM or height > MAX_UPLOAD_DIM:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Разрешение {noun} не должно превышать {MAX_UPLOAD_DIM}px.",
+        )
+
+    try:
+        with image:
+            encoded = _reencode(image, image_format)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Неверный формат изображения.") from exc
+
+    thumbnails = {}
+    for size in settings.media_thumbnail_sizes:
+        rendered = render_thumbnail(encoded, size)
+        if rendered is not None:
+            thumbnails[size] = rendered
+    return PreparedImage(data=encoded, mime=FORMAT_TO_MIME[image_format], thumbnails=thumbnails)
+
+
+async def read_upload(file: UploadFile, max_bytes: int, noun: str) -> bytes:
+    """Read an upload in chunks, stopping as soon as it passes max_bytes."""
+    too_large = HTTPException(
+        status_code=400,
+        detail=f"Размер {noun} не должен превышать {max_bytes // (1024 * 1024)} МБ.",
+    )
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise too_large
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Файл не загружен.")
+    return bytes(buffer)
+
+
+async def prepare_upload(file: UploadFile, noun: str = "фотографии") -> PreparedImage:
+    """Validate an uploaded image and re-encode it without metadata.
+
+    Decoding, encoding and thumbnail rendering run in a worker thread so
+    the event loop keeps serving other requests.
+    """
+    data = await read_upload(file, MAX_UPLOAD_BYTES, noun)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_IMAGE_EXECUTOR, _prepare_image, data, noun)
+
+
+def _store_thumbnail(
+    db: Session, digest: str, size: int, data: bytes, rendered: bytes | None = None
+) -> MediaThumbnail | None:
+    if rendered is None:
+        rendered = render_thumbnail(data, size)
+    if rendered is None:
+        return None
+    thumbnail = MediaThumbnail(sha256=digest, size=size, size_bytes=len(rendered), data=rendered)
+    try:
+        with db.begin_nested():
+            db.add(thumbnail)
+    except IntegrityError:
+        return db.get(MediaThumbnail, (digest, size))
+    return thumbnail
+
+
+def store_media(
+    db: Session,
+    data: bytes,
+    mime: str | None,
+    thumbnails: dict[int, bytes] | None = None,
+) -> str:
+    """Store the bytes unless an identical blob exists; return its hash.
+
+    Thumbnails for every configured size are stored with a new blob, using
+    the pre-rendered ones when given.
+    """
+    digest = media_hash(data)
+    if db.scalar(select(MediaBlob.sha256).where(MediaBlob.sha256 == digest)) is not None:
+        return digest
+    try:
+        # A concurrent upload of the same bytes may win the insert.
+        with db.begin_nested():
+            db.add(
+                MediaBlob(
+                    sha256=digest,
+                    mime=mime or DEFAULT_MIME,
+                    size_bytes=len(data),
+                    data=data,
+                )
+            )
+    except IntegrityError:
+        return digest
+    if thumbnails is not None:
+        for size, rendered in thumbnails.items():
+            _store_thumbnail(db, digest, size, data, rendered)
+    elif (mime or "").startswith("image/"):
+        for size in settings.media_thumbnail_sizes:
+            _store_thumbnail(db, digest, size, data)
+    return digest
+
+
+def store_prepared_image(db: Session, image: PreparedImage) -> str:
+    return store_media(db, image.data, image.mime, image.thumbnails)
+
+
+def _thumbnail(db: Session, digest: str, size: int) -> MediaThumbnail | None:
+    thumbnail = db.get(MediaThumbnail, (digest, size))
+    if thumbnail is not None:
+        return thumbnail
+    blob = db.get(MediaBlob, digest)
+    if blob is None:
+        return None
+    # Blobs stored before thumbnails existed get them on first use.
+    return _store_thumbnail(db, digest, size, blob.data)
+
+
+def _render_sprite(thumbnails: list[bytes], size: int, columns: int) -> bytes:
+    rows = math.ceil(len(thumbnails) / columns)
+    sheet = Image.new("RGBA", (columns * size, rows * size), (0, 0, 0, 0))
+    for index, data in enumerate(thumbnails):
+        with Image.open(BytesIO(data)) as cell:
+            cell = cell.convert("RGBA")
+            x = (index % columns) * size + (size - cell.width) // 2
+            y = (index // columns) * size + (size - cell.height) // 2
+            sheet.paste(cell, (x, y))
+    output = BytesIO()
+    sheet.save(output, format="WEBP", quality=90)
+    return output.getvalue()
+
+
+def _prune_sprites(db: Session, now: datetime) -> None:
+    """Drop sprites that have not been used within the retention period.
+
+    Each logo change produces a new sprite key, so superseded sheets would
+    otherwise accumulate forever. A sheet's blob goes with it unless another
+    sprite or a row still references the same bytes.
+    """
+    stale_before = now - timedelta(days=settings.media_sprite_retention_days)
+    stale = db.execute(
+        select(MediaSprite.key, MediaSprite.sha256)
+        .where(MediaSprite.last_used_at < stale_before)
+        .limit(settings.media_sprite_prune_batch)
+    ).all()
+    if not stale:
+        return
+    db.execute(delete(MediaSprite).where(MediaSprite.key.in_([key for key, _ in stale])))
+    for digest in {digest for _, digest in stale}:
+        if db.scalar(select(MediaSprite.key).where(MediaSprite.sha256 == digest).limit(1)):
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(delete(MediaBlob).where(MediaBlob.sha256 == digest))
+        except IntegrityError:
+            continue
+
+
+def media_sprite(db: Session, digests: list[str], size: int) -> MediaSprite | None:
+    """Return the sprite sheet for these blobs, building it on first request.
+
+    A sprite is keyed by the sorted set of hashes, so it is rebuilt only when
+    one of the images changes.
+    """
+    if size not in settings.media_thumbnail_sizes:
+        raise HTTPException(status_code=400, detail="Unsupported thumbnail size.")
+    unique = sorted(set(digests))
+    if not unique:
+        return None
+    key = media_hash(f"{size}:{','.join(unique)}".encode())
+    now = datetime.now(timezone.utc)
+    sprite = db.get(MediaSprite, key)
+    if sprite is not None:
+        db.execute(
+            update(MediaSprite)
+            .where(MediaSprite.key == key, MediaSprite.last_used_at < now - timedelta(days=1))
+            .values(last_used_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        return sprite
+
+    _prune_sprites(db, now)
+
+    cells: list[str] = []
+    thumbnails: list[bytes] = []
+    for digest in unique:
+        thumbnail = _thumbnail(db, digest, size)
+        if thumbnail is not None:
+            cells.append(digest)
+            thumbnails.append(thumbnail.data)
+    if not cells:
+        return None
+
+    columns = math.ceil(math.sqrt(len(cells)))
+    sheet = _render_sprite(thumbnails, size, columns)
+    sprite = MediaSprite(
+        key=key,
+        sha256=store_media(db, sheet, THUMBNAIL_MIME, thumbnails={}),
+        cell_size=size,
+        columns=columns,
+        cells=cells,
+        last_used_at=now,
+    )
+    try:
+        with db.begin_nested():
+            db.add(sprite)
+    except IntegrityError:
+        return db.get(MediaSprite, key)
+    return sprite
+
+
+def _etag(digest: str, size: int | None) -> str:
+    return f'"{digest}-{size}"' if size else f'"{digest}"'
+
+
+def _etag_matches(header: str | None, etag: str, exists: bool = False) -> bool:
+    # "*" matches any current representation, so it only counts once the
+    # blob or thumbnail is known to exist.
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if (candidate == "*" and exists) or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def media_response(
+    request: Request,
+    db: Session,
+    digest: str | None,
+    not_found_detail: str,
+    size: int | None = None,
+    cache_control: str = MUTABLE_CACHE_CONTROL,
+) -> Response:
+    """Serve a blob or one of its thumbnails with ETag revalidation."""
+    if not digest:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if size is not None and size not in settings.media_thumbnail_sizes:
+        raise HTTPException(status_code=400, detail="Unsupported thumbnail size.")
+
+    etag = _etag(digest, size)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    # Rows reference blobs by foreign key, so a known hash needs no lookup.
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if size is not None:
+        thumbnail = _thumbnail(db, digest, size)
+        if thumbnail is not None:
+            db.commit()
+            if _etag_matches(if_none_match, etag, exists=True):
+                return Response(status_code=304, headers=headers)
+            return Response(content=thumbnail.data, media_type=THUMBNAIL_MIME, headers=headers)
+
+    blob = db.get(MediaBlob, digest)
+    if blob is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if _etag_matches(if_none_match, etag, exists=True):
+        return Response(status_code=304, headers=headers)
+    return Response(content=blob.data, media_type=blob.mime, headers=headers)
+
+
+def _is_shared_media(db: Session, digest: str) -> bool:
+    return bool(
+        db.scalar(
+            select(
+                or_(
+                    exists().where(Counterparty.logo_hash == digest),
+                    exists().where(MediaSprite.sha256 == digest),
+                )
+            )
+        )
+    )
+
+
+@router.get("/{digest}")
+def get_media(
+    digest: str,
+    request: Request,
+    size: int | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    # Digests work as capability URLs and need no session. Logos and sprite
+    # sheets may sit in shared caches; user, item and person photos may not.
+    scope = "public" if _is_shared_media(db, digest) else "private"
+    return media_response(
+        request,
+        db,
+        digest,
+        "Media not found.",
+        size=size,
+        cache_control=f"{scope}, max-age={settings.media_cache_max_age_seconds}, immutable",
+    )
@@ -10,9 +10,12 @@ from sqlalchemy import (
     Integer,
     Float,
     Boolean,
+    Index,
+    JSON,
     LargeBinary,
     Numeric,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db import Base
@@ -20,6 +23,60 @@ from datetime import datetime, date
 from typing import Optional
 
 
+class MediaBlob(Base):
+    """Image bytes stored once per content hash and referenced by rows."""
+
+    __tablename__ = "media_blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    mime: Mapped[str] = mapped_column(String(50), nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class MediaThumbnail(Base):
+    """WebP rendition of a media blob, generated once per size."""
+
+    __tablename__ = "media_thumbnails"
+
+    sha256: Mapped[str] = mapped_column(
+        String(64), ForeignKey("media_blobs.sha256", ondelete="CASCADE"), primary_key=True
+    )
+    size: Mapped[int] = mapped_column(Integer, primary_key=True)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class MediaSprite(Base):
+    """Sprite sheet of thumbnails, keyed by the blob hashes it was built from."""
+
+    __tablename__ = "media_sprites"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    sha256: Mapped[str] = mapped_column(
+        String(64),
+        ForeignKey("media_blobs.sha256", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    cell_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    columns: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Blob hashes in cell order; blobs that could not be rendered are left out.
+    cells: Mapped[list] = mapped_column(JSON, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    # Refreshed at most daily; sprites nobody loads any more are pruned.
+    last_used_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -35,7 +92,9 @@ class User(Base):
     birth_date: Mapped[date | None] = mapped_column(Date, nullable=True)
     photo_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     photo_mime: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    photo_data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    photo_hash: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("media_blobs.sha256"), nullable=True
+    )
     accounting_start_date: Mapped[date | None] = mapped_column(Date, nullable=True)
 
     created_at: Mapped[DateTime] = mapped_column(
@@ -57,6 +116,7 @@ class User(Base):
     onboarding_states: Mapped[list["OnboardingState"]] = relationship(
         back_populates="user"
     )
+    jobs: Mapped[list["Job"]] = relationship(back_populates="user")
 
 
 class OnboardingState(Base):
@@ -178,6 +238,9 @@ class MarketPrice(Base):
     created_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
 
     instrument: Mapped["MarketInstrument"] = relationship()
 
@@ -215,10 +278,14 @@ class Counterparty(Base):
     license_status: Mapped[str | None] = mapped_column(String(40), nullable=True)
     logo_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     logo_mime: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    logo_data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    logo_hash: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("media_blobs.sha256"), nullable=True
+    )
     photo_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     photo_mime: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    photo_data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    photo_hash: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("media_blobs.sha256"), nullable=True
+    )
     owner_user_id: Mapped[int | None] = mapped_column(
         BigInteger, ForeignKey("users.id"), nullable=True
     )
@@ -242,6 +309,35 @@ class Counterparty(Base):
             "entity_type in ('LEGAL','PERSON')",
             name="ck_counterparties_entity_type",
         ),
+        # Trigram indexes serve ILIKE '%q%'; pattern_ops serve INN/OGRN prefixes.
+        Index(
+            "ix_counterparties_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_counterparties_full_name_trgm",
+            "full_name",
+            postgresql_using="gin",
+            postgresql_ops={"full_name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_counterparties_inn_prefix",
+            "inn",
+            postgresql_ops={"inn": "varchar_pattern_ops"},
+        ),
+        Index(
+            "ix_counterparties_ogrn_prefix",
+            "ogrn",
+            postgresql_ops={"ogrn": "varchar_pattern_ops"},
+        ),
+        Index("ix_counterparties_name_id", "name", "id"),
+        Index(
+            "ix_counterparties_logo_hash",
+            "logo_hash",
+            postgresql_where=text("logo_hash IS NOT NULL"),
+        ),
     )
 
 
@@ -278,6 +374,47 @@ class Category(Base):
     )
 
 
+class CategoryClosure(Base):
+    """Every ancestor/descendant pair of the category forest.
+
+    Each category is also paired with itself at depth 0, so a subtree is
+    simply all rows with ancestor_id = the subtree root.
+    """
+
+    __tablename__ = "category_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("categories.id"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("categories.id"), primary_key=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_category_closure_descendant_ancestor", "descendant_id", "ancestor_id"),
+    )
+
+
+class CategoryVersion(Base):
+    """Change counter for the global category tree and for each user's overlay.
+
+    scope is "global" or "user:<id>". Category writes bump it in the same
+    transaction so every worker can tell when its cached tree is stale.
+    """
+
+    __tablename__ = "category_versions"
+
+    scope: Mapped[str] = mapped_column(String(40), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+
 class UserCategoryState(Base):
     __tablename__ = "user_category_state"
 
@@ -371,7 +508,9 @@ class Item(Base):
     archived_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     photo_mime: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    photo_data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    photo_hash: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("media_blobs.sha256"), nullable=True
+    )
     photo_updated_at: Mapped[DateTime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
@@ -506,6 +645,9 @@ class Transaction(Base):
     chain: Mapped[Optional["TransactionChain"]] = relationship(back_populates="transactions")
 
     transaction_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # The virtual-chain occurrence this row overrides; it stays put when the
+    # row's own date is edited.
+    occurrence_date: Mapped[date | None] = mapped_column(Date, nullable=True)
     linked_item_id: Mapped[int | None] = mapped_column(
         BigInteger, ForeignKey("items.id"), nullable=True
     )
@@ -647,6 +789,12 @@ class TransactionChain(Base):
 
     comment: Mapped[str | None] = mapped_column(Text, nullable=True)
 
+    # Virtual chains store only the rule; occurrences become rows only when
+    # edited, confirmed or deleted individually.
+    is_virtual: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, server_default="false"
+    )
+
     deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
@@ -742,3 +890,44 @@ class Limit(Base):
             name="ck_limits_custom_date_order",
         ),
     )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=False)
+    user: Mapped["User"] = relationship(back_populates="jobs")
+
+    kind: Mapped[str] = mapped_column(String(40), nullable=False)
+    # Queued jobs with the same kind and key are collapsed into one.
+    dedupe_key: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    result: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    status: Mapped[str] = mapped_column(String(20), nullable=False, server_default="QUEUED")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+    __table_args__ = (
+        CheckConstraint(
+            "status in ('QUEUED','RUNNING','DONE','FAILED')",
+            name="ck_jobs_status",
+        ),
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_user_id_created_at", "user_id", "created_at"),
+    )
@@ -2,9 +2,9 @@ from fastapi import APIRouter, Depends
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
+from auth import Principal, get_current_user
 from db import get_db
-from models import OnboardingState, User
+from models import OnboardingState
 from schemas import (
     OnboardingDeviceType,
     OnboardingStateOut,
@@ -18,7 +18,7 @@ router = APIRouter()
 def get_onboarding_status(
     device_type: OnboardingDeviceType = "WEB",
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(OnboardingState).where(
         OnboardingState.user_id == user.id,
@@ -41,7 +41,7 @@ def get_onboarding_status(
 def update_onboarding_status(
     payload: OnboardingStateUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(OnboardingState).where(
         OnboardingState.user_id == user.id,
@@ -0,0 +1,57 @@
+"""PBKDF2 password hashing.
+
+Kept free of application imports: these functions run in the password
+process pool, whose workers import only this module.
+"""
+
+import base64
+import hashlib
+import hmac
+import secrets
+
+ALGORITHM = "pbkdf2_sha256"
+
+
+def _b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64url_decode(data: str) -> bytes:
+    padded = data + "=" * (-len(data) % 4)
+    return base64.urlsafe_b64decode(padded)
+
+
+def hash_password_sync(password: str, iterations: int) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, iterations
+    )
+    return "{}${}${}${}".format(
+        ALGORITHM, iterations, _b64url_encode(salt), _b64url_encode(digest)
+    )
+
+
+def stored_iterations(stored: str) -> int | None:
+    try:
+        algorithm, iterations_raw, _ = stored.split("$", 2)
+        if algorithm != ALGORITHM:
+            return None
+        return int(iterations_raw)
+    except (ValueError, TypeError):
+        return None
+
+
+def verify_password_sync(password: str, stored: str) -> bool:
+    try:
+        algorithm, iterations_raw, salt_b64, digest_b64 = stored.split("$", 3)
+        if algorithm != ALGORITHM:
+            return False
+        iterations = int(iterations_raw)
+        salt = _b64url_decode(salt_b64)
+        expected = _b64url_decode(digest_b64)
+    except (ValueError, TypeError):
+        return False
+    candidate = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, iterations
+    )
+    return hmac.compare_digest(candidate, expected)
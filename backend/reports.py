@@ -0,0 +1,489 @@
+from datetime import date as date_type, timedelta
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from auth import Principal, get_current_user
+from category_service import category_totals
+from db import get_db
+from market_utils import is_moex_item
+from models import FxRate, Item, MarketInstrument, MarketPrice, Transaction, User
+from schemas import (
+    CategoryTotalOut,
+    NetWorthItemSeriesOut,
+    NetWorthReportOut,
+    NetWorthStep,
+    TransactionDirection,
+)
+from transaction_chains import expand_virtual_occurrences
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+OPENING_SOURCE = "AUTO_ITEM_OPENING"
+
+
+def _item_start_date(item: Item, accounting_start: date_type | None) -> date_type:
+    if accounting_start and accounting_start > item.open_date:
+        return accounting_start
+    return item.open_date
+
+
+def _item_initial_cents(
+    item: Item, start_date: date_type, accounting_start: date_type | None
+) -> int:
+    # Items opened after the accounting start get their balance from the
+    # opening transactions, so history begins at zero.
+    if item.history_status == "NEW" and start_date != accounting_start:
+        return 0
+    return item.initial_value_rub
+
+
+def _month_end(value: date_type) -> date_type:
+    next_month = value.replace(day=28) + timedelta(days=4)
+    return next_month - timedelta(days=next_month.day)
+
+
+def _sample_dates(
+    date_from: date_type, date_to: date_type, step: NetWorthStep
+) -> list[date_type]:
+    if step == "DAY":
+        return [
+            date_from + timedelta(days=offset)
+            for offset in range((date_to - date_from).days + 1)
+        ]
+
+    points: list[date_type] = []
+    if step == "WEEK":
+        current = date_from + timedelta(days=6)
+        while current < date_to:
+            points.append(current)
+            current += timedelta(days=7)
+    else:
+        current = _month_end(date_from)
+        while current < date_to:
+            points.append(current)
+            current = _month_end(current + timedelta(days=1))
+    points.append(date_to)
+    return points
+
+
+def _to_day_offsets(values: list, origin: date_type) -> np.ndarray:
+    ordinals = np.fromiter((value.toordinal() for value in values), np.int64, len(values))
+    return ordinals - origin.toordinal()
+
+
+def _forward_fill(
+    series_days: np.ndarray, series_values: np.ndarray, days: np.ndarray
+) -> np.ndarray:
+    result = np.full(days.shape, np.nan)
+    if series_days.size == 0:
+        return result
+    positions = np.searchsorted(series_days, days, side="right") - 1
+    known = positions >= 0
+    result[known] = series_values[positions[known]]
+    return result
+
+
+def _map_ids(ids: np.ndarray, known_ids: np.ndarray, known_rows: np.ndarray) -> np.ndarray:
+    if known_ids.size == 0:
+        return np.full(ids.shape, -1, dtype=np.int64)
+    positions = np.clip(np.searchsorted(known_ids, ids), 0, known_ids.size - 1)
+    return np.where(known_ids[positions] == ids, known_rows[positions], -1)
+
+
+def _accumulate(grid: np.ndarray, rows: np.ndarray, days: np.ndarray, values: np.ndarray):
+    mask = (rows >= 0) & (days >= 0) & (days < grid.shape[1]) & (values != 0)
+    np.add.at(grid, (rows[mask], days[mask]), values[mask])
+
+
+def _to_optional_ints(values: np.ndarray) -> list:
+    missing = np.isnan(values)
+    result = np.where(missing, 0, values).astype(np.int64).astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+def _load_transactions(
+    db: Session,
+    user: User,
+    end_date: date_type,
+    today: date_type,
+    item_ids: set[int] | None,
+) -> list:
+    tomorrow = today + timedelta(days=1)
+    stmt = (
+        select(
+            Transaction.transaction_date,
+            Transaction.primary_item_id,
+            Transaction.primary_card_item_id,
+            Transaction.counterparty_item_id,
+            Transaction.counterparty_card_item_id,
+            Transaction.amount_rub,
+            Transaction.amount_counterparty,
+            Transaction.primary_quantity_lots,
+            Transaction.counterparty_quantity_lots,
+            Transaction.direction,
+            Transaction.source,
+        ).where(
+            Transaction.user_id == user.id,
+            Transaction.deleted_at.is_(None),
+            Transaction.transaction_date < end_date + timedelta(days=1),
+            or_(
+                Transaction.transaction_type == "ACTUAL",
+                Transaction.status == "REALIZED",
+                Transaction.transaction_date >= tomorrow,
+            ),
+        )
+    )
+    if item_ids is not None:
+        stmt = stmt.where(
+            or_(
+                Transaction.primary_item_id.in_(item_ids),
+                Transaction.primary_card_item_id.in_(item_ids),
+                Transaction.counterparty_item_id.in_(item_ids),
+                Transaction.counterparty_card_item_id.in_(item_ids),
+            )
+        )
+    rows = list(db.execute(stmt).all())
+
+    # Future occurrences of virtual chains take part in the forecast as if stored.
+    for tx in expand_virtual_occurrences(db, user, tomorrow, end_date):
+        if item_ids is not None and not (
+            {
+                tx.primary_item_id,
+                tx.primary_card_item_id,
+                tx.counterparty_item_id,
+                tx.counterparty_card_item_id,
+            }
+            & item_ids
+        ):
+            continue
+        rows.append(
+            (
+                tx.transaction_date,
+                tx.primary_item_id,
+                tx.primary_card_item_id,
+                tx.counterparty_item_id,
+                tx.counterparty_card_item_id,
+                tx.amount_rub,
+                tx.amount_counterparty,
+                None,
+                None,
+                tx.direction,
+                None,
+            )
+        )
+    return rows
+
+
+def _load_unit_prices(
+    db: Session,
+    moex_items: list[tuple[int, Item]],
+    end_date: date_type,
+    origin: date_type,
+    sample_days: np.ndarray,
+) -> dict[int, tuple[np.ndarray, str | None]]:
+    instrument_ids = {item.instrument_id for _, item in moex_items}
+    default_boards = dict(
+        db.execute(
+            select(MarketInstrument.secid, MarketInstrument.default_board_id).where(
+                MarketInstrument.secid.in_(instrument_ids)
+            )
+        ).all()
+    )
+    rows_by_key: dict[tuple[str, str], list] = {}
+    for row in db.execute(
+        select(
+            MarketPrice.instrument_id,
+            MarketPrice.board_id,
+            MarketPrice.price_date,
+            MarketPrice.price_cents,
+            MarketPrice.price_percent_bp,
+            MarketPrice.accint_cents,
+            MarketPrice.currency_code,
+        )
+        .where(
+            MarketPrice.instrument_id.in_(instrument_ids),
+            MarketPrice.price_date <= end_date,
+        )
+        .order_by(MarketPrice.price_date)
+    ):
+        rows_by_key.setdefault((row.instrument_id, row.board_id), []).append(row)
+
+    result: dict[int, tuple[np.ndarray, str | None]] = {}
+    for index, item in moex_items:
+        board_id = item.instrument_board_id or default_boards.get(item.instrument_id)
+        rows = rows_by_key.get((item.instrument_id, board_id), [])
+        unit_prices = np.full(len(rows), np.nan)
+        for position, row in enumerate(rows):
+            accint = row.accint_cents or 0
+            if row.price_cents is not None:
+                if item.type_code == "bonds":
+                    unit_prices[position] = row.price_cents + accint
+                else:
+                    unit_prices[position] = row.price_cents
+            elif (
+                item.type_code == "bonds"
+                and row.price_percent_bp is not None
+                and item.face_value_cents is not None
+            ):
+                unit_prices[position] = (
+                    item.face_value_cents * row.price_percent_bp / 10000 + accint
+                )
+        price_days = _to_day_offsets([row.price_date for row in rows], origin)
+        currency_code = rows[-1].currency_code if rows else None
+        result[index] = (
+            _forward_fill(price_days, unit_prices, sample_days),
+            currency_code or item.currency_code,
+        )
+    return result
+
+
+def _load_fx_rates(
+    db: Session,
+    currency_codes: set[str],
+    end_date: date_type,
+    origin: date_type,
+    sample_days: np.ndarray,
+) -> dict[str, np.ndarray]:
+    rates = {"RUB": np.ones(sample_days.shape)}
+    foreign = currency_codes - {"RUB"}
+    if not foreign:
+        return rates
+    rows_by_code: dict[str, list] = {}
+    for row in db.execute(
+        select(FxRate.char_code, FxRate.rate_date, FxRate.rate)
+        .where(FxRate.char_code.in_(foreign), FxRate.rate_date <= end_date)
+        .order_by(FxRate.rate_date)
+    ):
+        rows_by_code.setdefault(row.char_code, []).append(row)
+    for code in foreign:
+        rows = rows_by_code.get(code, [])
+        rates[code] = _forward_fill(
+            _to_day_offsets([row.rate_date for row in rows], origin),
+            np.array([row.rate for row in rows], dtype=np.float64),
+            sample_days,
+        )
+    return rates
+
+
+@router.get("/net-worth", response_model=NetWorthReportOut)
+def get_net_worth_report(
+    date_from: date_type = Query(alias="from"),
+    date_to: date_type = Query(alias="to"),
+    step: NetWorthStep = "DAY",
+    item_ids: list[int] | None = Query(default=None),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be later than to")
+
+    today = date_type.today()
+    accounting_start = user.accounting_start_date
+
+    # Cards linked to an account share the account balance, so their
+    # transactions are folded into the account series.
+    card_accounts = dict(
+        db.execute(
+            select(Item.id, Item.card_account_id).where(
+                Item.user_id == user.id, Item.card_account_id.isnot(None)
+            )
+        ).all()
+    )
+    stmt = (
+        select(Item)
+        .where(
+            Item.user_id == user.id,
+            Item.archived_at.is_(None),
+            Item.card_account_id.is_(None),
+        )
+        .order_by(Item.id)
+    )
+    if item_ids:
+        selected = set(item_ids)
+        selected.update(
+            account_id for card_id, account_id in card_accounts.items() if card_id in selected
+        )
+        stmt = stmt.where(Item.id.in_(selected))
+    items = list(db.execute(stmt).scalars())
+
+    dates = _sample_dates(date_from, date_to, step)
+    if not items:
+        return NetWorthReportOut(dates=dates, total_rub_cents=[0] * len(dates), items=[])
+
+    start_dates = [_item_start_date(item, accounting_start) for item in items]
+    origin = min(start_dates)
+    end_date = max(date_to, today)
+    day_count = (end_date - origin).days + 1
+    start_idx = _to_day_offsets(start_dates, origin)
+    sample_days = _to_day_offsets(dates, origin)
+
+    row_by_id = {item.id: row for row, item in enumerate(items)}
+    for card_id, account_id in card_accounts.items():
+        row_by_id[card_id] = row_by_id.get(account_id, -1)
+    known_ids = np.array(sorted(row_by_id), dtype=np.int64)
+    known_rows = np.array([row_by_id[item_id] for item_id in known_ids.tolist()], dtype=np.int64)
+
+    is_liability = np.array([item.kind == "LIABILITY" for item in items])
+    is_moex = np.array([is_moex_item(item) for item in items])
+
+    amount_grid = np.zeros((len(items), day_count), dtype=np.int64)
+    lots_grid = np.zeros((len(items), day_count), dtype=np.int64)
+
+    tracked_ids = (
+        {item_id for item_id, row in row_by_id.items() if row >= 0} if item_ids else None
+    )
+    tx_rows = _load_transactions(db, user, end_date, today, tracked_ids)
+    if tx_rows:
+        columns = list(zip(*tx_rows))
+        tx_days = _to_day_offsets(list(columns[0]), origin)
+
+        def ids(values) -> np.ndarray:
+            return _map_ids(
+                np.array([value or 0 for value in values], dtype=np.int64),
+                known_ids,
+                known_rows,
+            )
+
+        primary = ids(columns[1])
+        primary_card = ids(columns[2])
+        primary_card[primary_card == primary] = -1
+        counter = ids(columns[3])
+        counter_card = ids(columns[4])
+        counter_card[counter_card == counter] = -1
+
+        amount = np.array(columns[5], dtype=np.int64)
+        counter_amount = np.array(
+            [value if value is not None else fallback for value, fallback in zip(columns[6], columns[5])],
+            dtype=np.int64,
+        )
+        primary_lots = np.array([value or 0 for value in columns[7]], dtype=np.int64)
+        counter_lots = np.array([value or 0 for value in columns[8]], dtype=np.int64)
+        direction = np.array(columns[9])
+        is_income = direction == "INCOME"
+        is_expense = direction == "EXPENSE"
+        is_transfer = direction == "TRANSFER"
+        is_opening = np.array([source == OPENING_SOURCE for source in columns[10]])
+
+        for rows in (primary, primary_card):
+            liability = is_liability[rows] & (rows >= 0)
+            moex = is_moex[rows] & (rows >= 0)
+            # Opening transactions of liabilities are EXPENSE rows that
+            # increase the debt (see item_opening_service._create_income_expense).
+            delta = np.where(
+                is_income,
+                amount,
+                np.where(
+                    is_expense,
+                    np.where(is_opening & liability, amount, -amount),
+                    np.where(is_transfer, np.where(liability, amount, -amount), 0),
+                ),
+            )
+            _accumulate(amount_grid, np.where(moex, -1, rows), tx_days, delta)
+            lot_delta = np.where(is_income, primary_lots, -primary_lots)
+            _accumulate(lots_grid, np.where(moex, rows, -1), tx_days, lot_delta)
+
+        for rows in (counter, counter_card):
+            transfer_rows = np.where(is_transfer, rows, -1)
+            liability = is_liability[transfer_rows] & (transfer_rows >= 0)
+            moex = is_moex[transfer_rows] & (transfer_rows >= 0)
+            delta = np.where(liability, -counter_amount, counter_amount)
+            _accumulate(amount_grid, np.where(moex, -1, transfer_rows), tx_days, delta)
+            _accumulate(lots_grid, np.where(moex, transfer_rows, -1), tx_days, counter_lots)
+
+    # Balances are reset to the initial value on the start date, so anything
+    # dated earlier does not contribute.
+    started = np.arange(day_count)[None, :] >= start_idx[:, None]
+    amount_grid[~started] = 0
+    lots_grid[~started] = 0
+
+    initial = np.array(
+        [
+            _item_initial_cents(item, start, accounting_start)
+            for item, start in zip(items, start_dates)
+        ],
+        dtype=np.int64,
+    )
+    balances = initial[:, None] + np.cumsum(amount_grid, axis=1)
+
+    # position_lots is the current position: back out realized movements to
+    # get the position on the start date.
+    today_idx = (today - origin).days
+    realized_lots = lots_grid[:, : max(today_idx + 1, 0)].sum(axis=1)
+    current_lots = np.array([item.position_lots or 0 for item in items], dtype=np.int64)
+    lots = (current_lots - realized_lots)[:, None] + np.cumsum(lots_grid, axis=1)
+
+    in_range = sample_days >= 0
+    sample_cols = np.clip(sample_days, 0, day_count - 1)
+    active = in_range[None, :] & (sample_days[None, :] >= start_idx[:, None])
+
+    values = balances[:, sample_cols].astype(np.float64)
+    currency_codes = [item.currency_code for item in items]
+    moex_items = [(row, item) for row, item in enumerate(items) if is_moex[row]]
+    if moex_items:
+        unit_prices = _load_unit_prices(db, moex_items, end_date, origin, sample_days)
+        for row, item in moex_items:
+            prices, currency_code = unit_prices[row]
+            units = lots[row, sample_cols] * (item.lot_size or 1)
+            values[row] = np.rint(prices * units)
+            currency_codes[row] = currency_code
+
+    rates = _load_fx_rates(db, set(currency_codes), end_date, origin, sample_days)
+    rate_matrix = np.vstack([rates[code] for code in currency_codes])
+    rub_values = np.rint(values * rate_matrix)
+
+    values[~active] = np.nan
+    rub_values[~active] = np.nan
+
+    signs = np.where(
+        is_liability & np.array([item.type_code != "bank_card" for item in items]), -1.0, 1.0
+    )
+    signed = np.where(active, rub_values * signs[:, None], 0.0)
+    total = signed.sum(axis=0)
+
+    item_values = _to_optional_ints(values)
+    item_rub_values = _to_optional_ints(rub_values)
+    return NetWorthReportOut(
+        dates=dates,
+        total_rub_cents=_to_optional_ints(total),
+        items=[
+            NetWorthItemSeriesOut(
+                item_id=item.id,
+                currency_code=currency_codes[row],
+                values=item_values[row],
+                rub_values=item_rub_values[row],
+            )
+            for row, item in enumerate(items)
+        ],
+    )
+
+
+@router.get("/category-totals", response_model=list[CategoryTotalOut])
+def get_category_totals(
+    date_from: date_type = Query(alias="from"),
+    date_to: date_type = Query(alias="to"),
+    direction: TransactionDirection = "EXPENSE",
+    category_ids: list[int] | None = Query(default=None),
+    include_descendants: bool = False,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be later than to")
+
+    totals = category_totals(
+        db,
+        user.id,
+        date_from,
+        date_to,
+        direction=direction,
+        category_ids=category_ids or None,
+        include_descendants=include_descendants,
+    )
+    return [
+        CategoryTotalOut(category_id=category_id, amount_rub=amount, transaction_count=count)
+        for category_id, (amount, count) in sorted(totals.items())
+    ]
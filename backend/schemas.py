@@ -18,6 +18,7 @@ TransactionChainSource = Literal["AUTO_ITEM", "MANUAL"]
 TransactionChainPurpose = Literal["INTEREST", "PRINCIPAL"]
 CategoryScope = Literal["INCOME", "EXPENSE", "BOTH"]
 LimitPeriod = Literal["MONTHLY", "WEEKLY", "YEARLY", "CUSTOM"]
+NetWorthStep = Literal["DAY", "WEEK", "MONTH"]
 CounterpartyType = Literal["LEGAL", "PERSON"]
 OnboardingDeviceType = Literal["WEB", "MOBILE"]
 OnboardingStatus = Literal["PENDING", "POSTPONED", "IN_PROGRESS", "COMPLETED", "SKIPPED"]
@@ -328,6 +329,53 @@ class ItemCreate(BaseModel):
                 raise ValueError("initial_value_rub must be non-negative")
         return self
 
+class ItemPlanPreviewRequest(BaseModel):
+    kind: ItemKind
+    type_code: str = Field(min_length=1, max_length=50)
+    currency_code: str = Field(default="RUB", min_length=3, max_length=3)
+    open_date: date
+    deposit_term_days: int | None = Field(default=None, ge=1)
+    interest_rate: float | None = Field(default=None, ge=0)
+    interest_payout_order: InterestPayoutOrder | None = None
+    interest_capitalization: bool | None = None
+    interest_payout_account_id: int | None = None
+    initial_value_rub: int
+    plan_settings: ItemPlanSettingsBase
+
+
+class ItemPlanPreviewRowOut(BaseModel):
+    payout_date: date
+    principal_rub: int
+    interest_rub: int
+
+
+class ItemPlanPreviewOut(BaseModel):
+    rows: list[ItemPlanPreviewRowOut]
+    principal_total_rub: int
+    interest_total_rub: int
+
+
+class ItemReplanEntry(BaseModel):
+    item_id: int
+    interest_rate: float | None = Field(default=None, ge=0)
+    plan_settings: ItemPlanSettingsBase | None = None
+
+
+class ItemReplanRequest(BaseModel):
+    items: list[ItemReplanEntry] = Field(min_length=1, max_length=200)
+
+
+class ItemReplanResultOut(BaseModel):
+    item_id: int
+    status: Literal["REPLANNED", "UNCHANGED", "FAILED"]
+    detail: str | None = None
+
+
+class ItemReplanOut(BaseModel):
+    results: list[ItemReplanResultOut]
+    inserted_rows: int
+
+
 class ItemOut(BaseModel):
     id: int
     kind: ItemKind
@@ -364,6 +412,8 @@ class ItemOut(BaseModel):
     plan_settings: ItemPlanSettingsBase | None = None
     photo_url: str | None = None
     photo_updated_at: datetime | None = None
+    # Set when the change queued a background rebuild of the item's plan.
+    plan_job_id: int | None = None
 
     class Config:
         from_attributes = True
@@ -406,6 +456,8 @@ class TransactionOut(TransactionBase):
     deleted_at: datetime | None = None
     linked_item_id: int | None = None
     source: str | None = None
+    # Occurrence of a virtual chain; its negative id is materialized on first write.
+    is_virtual: bool = False
 
     class Config:
         from_attributes = True
@@ -436,6 +488,7 @@ class TransactionChainCreate(BaseModel):
     direction: TransactionDirection
     category_id: int | None = None
     comment: str | None = None
+    is_virtual: bool = False
 
     @model_validator(mode="after")
     def validate_frequency_details(self) -> "TransactionChainCreate":
@@ -488,6 +541,12 @@ class TransactionChainCreate(BaseModel):
         return self
 
 
+class TransactionChainUpdate(TransactionChainCreate):
+    is_virtual: bool | None = None
+    # Only occurrences on or after this date are rewritten.
+    apply_from: date | None = None
+
+
 class TransactionChainOut(BaseModel):
     id: int
     name: str
@@ -516,6 +575,7 @@ class TransactionChainOut(BaseModel):
     amount_is_variable: bool | None = None
     amount_min_rub: int | None = None
     amount_max_rub: int | None = None
+    is_virtual: bool = False
 
     class Config:
         from_attributes = True
@@ -559,6 +619,13 @@ class LimitOut(LimitBase):
         from_attributes = True
 
 
+class LimitUsageOut(BaseModel):
+    limit_id: int
+    start_date: date
+    end_date: date
+    spent_rub: int
+
+
 class CategoryCreate(BaseModel):
     name: str = Field(min_length=1, max_length=200)
     parent_id: int | None = None
@@ -654,6 +721,27 @@ class MarketPriceOut(BaseModel):
     accint_cents: int | None
     yield_bp: int | None
     currency_code: str | None
+    is_stale: bool = False
+    updated_at: datetime | None = None
+
+
+class NetWorthItemSeriesOut(BaseModel):
+    item_id: int
+    currency_code: str
+    values: list[int | None]
+    rub_values: list[int | None]
+
+
+class NetWorthReportOut(BaseModel):
+    dates: list[date]
+    total_rub_cents: list[int | None]
+    items: list[NetWorthItemSeriesOut]
+
+
+class CategoryTotalOut(BaseModel):
+    category_id: int
+    amount_rub: int
+    transaction_count: int
 
 
 class FxRatesBatchRequest(BaseModel):
@@ -733,6 +821,50 @@ class CounterpartyOut(CounterpartyBase):
         from_attributes = True
 
 
+class CounterpartyPageOut(BaseModel):
+    items: list[CounterpartyOut]
+    next_cursor: str | None = None
+    has_more: bool
+
+
+class CounterpartyLogoSpriteRequest(BaseModel):
+    counterparty_ids: list[int] = Field(min_length=1, max_length=1000)
+    size: int = 48
+
+
+class CounterpartyLogoSpriteCellOut(BaseModel):
+    counterparty_id: int
+    x: int
+    y: int
+
+
+class CounterpartyLogoSpriteOut(BaseModel):
+    sprite_url: str
+    cell_size: int
+    width: int
+    height: int
+    cells: list[CounterpartyLogoSpriteCellOut]
+
+
 class LegalFormOut(BaseModel):
     code: str
     label: str
+
+
+JobStatus = Literal["QUEUED", "RUNNING", "DONE", "FAILED"]
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    last_error: str | None
+    result: dict | None
+    run_after: datetime
+    created_at: datetime
+    finished_at: datetime | None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,89 @@
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from item_plan_service import _bisect_annuity_payment, _find_annuity_payment
+
+
+def monthly_payout_dates(first: date, periods: int) -> list[date]:
+    dates = []
+    for index in range(periods):
+        month = first.month - 1 + index
+        year = first.year + month // 12
+        month = month % 12 + 1
+        day = min(first.day, 28)
+        dates.append(date(year, month, day))
+    return dates
+
+
+def random_case(rng: random.Random) -> tuple[int, float, date, list[date]]:
+    principal = rng.choice([rng.randint(1, 1000), rng.randint(10_000, 10**9), rng.randint(10**9, 10**11)])
+    rate = round(rng.choice([0, rng.uniform(0.1, 45)]), rng.choice([0, 1, 2]))
+    period_start = date(2000, 1, 1) + timedelta(days=rng.randint(0, 365 * 30))
+    periods = rng.choice([1, 2, rng.randint(3, 36), rng.randint(60, 360)])
+    if rng.random() < 0.7:
+        first = period_start + timedelta(days=rng.randint(1, 40))
+        payout_dates = monthly_payout_dates(first, periods)
+    else:
+        payout_dates = []
+        current = period_start
+        for _ in range(periods):
+            current += timedelta(days=rng.randint(1, 120))
+            payout_dates.append(current)
+    return principal, rate, period_start, payout_dates
+
+
+def check_equivalence(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        principal, rate, period_start, payout_dates = random_case(rng)
+        expected = _bisect_annuity_payment(principal, rate, period_start, payout_dates)
+        actual = _find_annuity_payment(principal, rate, period_start, payout_dates)
+        if expected != actual:
+            mismatches += 1
+            print(
+                f"MISMATCH principal={principal} rate={rate} start={period_start} "
+                f"periods={len(payout_dates)}: {expected} != {actual}"
+            )
+    return mismatches
+
+
+def benchmark(periods: int, repeat: int) -> None:
+    period_start = date(2026, 1, 15)
+    payout_dates = monthly_payout_dates(date(2026, 2, 15), periods)
+    for label, func in (
+        ("bisection", _bisect_annuity_payment),
+        ("newton", _find_annuity_payment),
+    ):
+        began = time.perf_counter()
+        for _ in range(repeat):
+            func(1_500_000_000, 12.5, period_start, payout_dates)
+        elapsed = (time.perf_counter() - began) / repeat
+        print(f"{label:>10}: {elapsed * 1000:.3f} ms per {periods}-period solve")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the annuity payment solver against plain bisection and time both."
+    )
+    parser.add_argument("--cases", type=int, default=1000, help="Random schedules for the equivalence check")
+    parser.add_argument("--seed", type=int, default=20261018)
+    parser.add_argument("--periods", type=int, default=360, help="Payout count of the benchmark schedule")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.cases, args.seed)
+    print(f"Checked {args.cases} cases, {mismatches} mismatches")
+    benchmark(args.periods, args.repeat)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
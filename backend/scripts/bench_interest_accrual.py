@@ -0,0 +1,87 @@
+import argparse
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from item_plan_service import _days_in_year, _round_cents, _sum_interest_cents
+
+
+def sum_interest_cents_daily(
+    principal_cents: int | Decimal, rate: float, start: date, end: date
+) -> Decimal:
+    """Reference per-day accrual the segment engine must reproduce."""
+    principal = Decimal(principal_cents)
+    if principal <= 0 or rate <= 0:
+        return Decimal(0)
+    annual_rate = Decimal(str(rate)) / Decimal(100)
+    total = Decimal(0)
+    current = start
+    while current <= end:
+        total += principal * (annual_rate / Decimal(_days_in_year(current)))
+        current += timedelta(days=1)
+    return total
+
+
+def random_case(rng: random.Random) -> tuple[int | Decimal, float, date, date]:
+    if rng.random() < 0.2:
+        principal: int | Decimal = Decimal(rng.randint(0, 10**12)) / Decimal(rng.choice([1, 3, 7, 100]))
+    else:
+        principal = rng.randint(-1000, 10**11)
+    rate = round(rng.uniform(0, 40), rng.choice([0, 1, 2, 3]))
+    start = date(1996, 1, 1) + timedelta(days=rng.randint(0, 365 * 40))
+    # Mostly payout periods, with some whole-term spans and empty ranges.
+    span = rng.choice([rng.randint(-3, 40), rng.randint(28, 370), rng.randint(0, 365 * 30)])
+    return principal, rate, start, start + timedelta(days=span)
+
+
+def check_equivalence(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        principal, rate, start, end = random_case(rng)
+        expected = sum_interest_cents_daily(principal, rate, start, end)
+        actual = _sum_interest_cents(principal, rate, start, end)
+        if _round_cents(expected) != _round_cents(actual):
+            mismatches += 1
+            print(f"MISMATCH principal={principal} rate={rate} {start}..{end}: {expected} != {actual}")
+    return mismatches
+
+
+def benchmark(years: int, repeat: int) -> None:
+    start = date(2026, 1, 15)
+    end = start + timedelta(days=365 * years)
+    for label, func in (
+        ("daily loop", sum_interest_cents_daily),
+        ("year segments", _sum_interest_cents),
+    ):
+        began = time.perf_counter()
+        for _ in range(repeat):
+            func(1_500_000_000, 12.5, start, end)
+        elapsed = (time.perf_counter() - began) / repeat
+        print(f"{label:>14}: {elapsed * 1000:.3f} ms per {years}-year call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the year-segment interest engine against per-day accrual and time both."
+    )
+    parser.add_argument("--cases", type=int, default=5000, help="Random cases for the equivalence check")
+    parser.add_argument("--seed", type=int, default=20261018)
+    parser.add_argument("--years", type=int, default=30, help="Span of the benchmark call")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.cases, args.seed)
+    print(f"Checked {args.cases} cases, {mismatches} mismatches")
+    benchmark(args.years, args.repeat)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
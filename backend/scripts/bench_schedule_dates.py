@@ -0,0 +1,119 @@
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from transaction_chains import (
+    build_schedule_dates,
+    iter_daily,
+    iter_monthly,
+    iter_regular,
+    iter_weekly,
+)
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "REGULAR")
+
+
+def iter_schedule_dates(
+    start: date,
+    end: date,
+    frequency: str,
+    weekly_day: int | None,
+    monthly_day: int | None,
+    monthly_rule: str | None,
+    interval_days: int | None,
+) -> list[date]:
+    """Reference generator-based schedule the array engine must reproduce."""
+    if frequency == "DAILY":
+        return list(iter_daily(start, end))
+    if frequency == "WEEKLY":
+        if weekly_day is None:
+            return []
+        return list(iter_weekly(start, end, weekly_day))
+    if frequency == "MONTHLY":
+        return list(iter_monthly(start, end, monthly_day, monthly_rule))
+    if frequency == "REGULAR":
+        if interval_days is None or interval_days < 1:
+            return []
+        return list(iter_regular(start, end, interval_days))
+    return []
+
+
+def random_case(rng: random.Random) -> tuple:
+    start = date(1990, 1, 1) + timedelta(days=rng.randint(0, 365 * 50))
+    # Mostly chain-sized spans, with some empty and single-day ranges.
+    span = rng.choice([rng.randint(-5, 3), rng.randint(0, 90), rng.randint(0, 365 * 40)])
+    frequency = rng.choice(FREQUENCIES)
+    weekly_day = rng.choice([None, *range(7)]) if frequency == "WEEKLY" else None
+    monthly_day = None
+    monthly_rule = None
+    if frequency == "MONTHLY":
+        if rng.random() < 0.5:
+            monthly_day = rng.choice([1, 15, 28, 29, 30, 31, rng.randint(1, 31)])
+        else:
+            monthly_rule = rng.choice(["FIRST_DAY", "LAST_DAY"])
+    interval_days = rng.choice([None, 0, 1, 2, 7, 14, 30, rng.randint(1, 400)]) if frequency == "REGULAR" else None
+    return start, start + timedelta(days=span), frequency, weekly_day, monthly_day, monthly_rule, interval_days
+
+
+def check_equivalence(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        case = random_case(rng)
+        expected = iter_schedule_dates(*case)
+        actual = build_schedule_dates(*case)
+        if expected != actual or not all(type(value) is date for value in actual):
+            mismatches += 1
+            print(f"MISMATCH {case}: {len(expected)} != {len(actual)} dates")
+    return mismatches
+
+
+def benchmark(years: int, repeat: int) -> None:
+    start = date(2026, 1, 15)
+    end = start + timedelta(days=365 * years)
+    cases = (
+        ("DAILY", None, None, None, None),
+        ("WEEKLY", 4, None, None, None),
+        ("MONTHLY", None, 31, None, None),
+        ("MONTHLY", None, None, "LAST_DAY", None),
+        ("REGULAR", None, None, None, 3),
+    )
+    for frequency, weekly_day, monthly_day, monthly_rule, interval_days in cases:
+        args = (start, end, frequency, weekly_day, monthly_day, monthly_rule, interval_days)
+        timings = []
+        for func in (iter_schedule_dates, build_schedule_dates):
+            began = time.perf_counter()
+            for _ in range(repeat):
+                func(*args)
+            timings.append((time.perf_counter() - began) / repeat)
+        label = frequency if monthly_rule is None else f"{frequency}/{monthly_rule}"
+        print(
+            f"{label:>18}: iterators {timings[0] * 1000:.3f} ms, "
+            f"arrays {timings[1] * 1000:.3f} ms ({timings[0] / timings[1]:.1f}x)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the datetime64 schedule engine against the date iterators and time both."
+    )
+    parser.add_argument("--cases", type=int, default=5000, help="Random cases for the equivalence check")
+    parser.add_argument("--seed", type=int, default=20261018)
+    parser.add_argument("--years", type=int, default=30, help="Span of each benchmark schedule")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.cases, args.seed)
+    print(f"Checked {args.cases} cases, {mismatches} mismatches")
+    benchmark(args.years, args.repeat)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
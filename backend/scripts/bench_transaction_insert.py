@@ -0,0 +1,125 @@
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import func, insert, select
+
+from db import SessionLocal
+from models import Item, Transaction, TransactionChain, User
+from transaction_chains import _copy_transactions
+
+
+def planned_rows(user_id: int, chain_id: int, item_id: int, count: int) -> list[dict]:
+    start = date(2026, 1, 1)
+    return [
+        {
+            "user_id": user_id,
+            "chain_id": chain_id,
+            "transaction_date": datetime.combine(start + timedelta(days=offset), datetime.min.time()),
+            "primary_item_id": item_id,
+            "primary_card_item_id": None,
+            "counterparty_item_id": None,
+            "counterparty_card_item_id": None,
+            "counterparty_id": None,
+            "amount_rub": 10_000 + offset % 500,
+            "amount_counterparty": None,
+            "direction": "EXPENSE",
+            "transaction_type": "PLANNED",
+            "status": "CONFIRMED",
+            "category_id": None,
+            "comment": None,
+        }
+        for offset in range(count)
+    ]
+
+
+def insert_orm(db, rows: list[dict]) -> None:
+    db.add_all([Transaction(**row) for row in rows])
+    db.flush()
+
+
+def insert_core(db, rows: list[dict]) -> None:
+    db.execute(insert(Transaction.__table__), rows)
+
+
+def run_once(method, count: int) -> float:
+    # Everything happens in one transaction that is rolled back afterwards.
+    db = SessionLocal()
+    try:
+        user = User(login=f"bench-{time.time_ns()}")
+        db.add(user)
+        db.flush()
+        item = Item(
+            user_id=user.id,
+            kind="ASSET",
+            type_code="cash",
+            name="bench",
+            currency_code="RUB",
+            initial_value_rub=0,
+            current_value_rub=0,
+            open_date=date(2026, 1, 1),
+            start_date=date(2026, 1, 1),
+            history_status="HISTORICAL",
+        )
+        db.add(item)
+        db.flush()
+        chain = TransactionChain(
+            user_id=user.id,
+            name="bench",
+            start_date=date(2026, 1, 1),
+            end_date=date(2026, 1, 1) + timedelta(days=count - 1),
+            frequency="DAILY",
+            primary_item_id=item.id,
+            amount_rub=10_000,
+            direction="EXPENSE",
+        )
+        db.add(chain)
+        db.flush()
+        rows = planned_rows(user.id, chain.id, item.id, count)
+
+        began = time.perf_counter()
+        method(db, rows)
+        elapsed = time.perf_counter() - began
+
+        inserted = db.scalar(
+            select(func.count()).select_from(Transaction).where(Transaction.chain_id == chain.id)
+        )
+        if inserted != count:
+            raise RuntimeError(f"expected {count} rows, found {inserted}")
+        return elapsed
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time ORM add_all against Core INSERT and COPY for generated chain rows. "
+        "Runs against DATABASE_URL and rolls everything back."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    methods = [("orm add_all", insert_orm), ("core insert", insert_core)]
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            methods.append(("copy", _copy_transactions))
+
+    for count in args.sizes:
+        baseline = None
+        for label, method in methods:
+            best = min(run_once(method, count) for _ in range(args.repeat))
+            baseline = baseline or best
+            print(
+                f"{count:>7} rows  {label:>12}: {best * 1000:9.1f} ms"
+                f"  ({count / best:,.0f} rows/s, x{baseline / best:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,8 @@ from sqlalchemy import select
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-from config import settings
 from db import SessionLocal
+from media import media_url, store_media
 from models import Counterparty
 
 MAX_LOGO_BYTES = 2 * 1024 * 1024
@@ -19,10 +19,6 @@ UPLOADS_DIR = PROJECT_ROOT / "backend" / "uploads" / "counterparty-logos"
 FRONTEND_PUBLIC = PROJECT_ROOT / "frontend" / "public"
 
 
-def build_logo_url(counterparty_id: int) -> str:
-    return f"{settings.public_base_url}/counterparties/{counterparty_id}/logo"
-
-
 def load_logo_from_path(path: Path) -> tuple[bytes | None, str | None]:
     if not path.exists():
         return None, None
@@ -72,7 +68,7 @@ def resolve_logo_source(url: str) -> tuple[bytes | None, str | None]:
 
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description="Migrate counterparty logos from logo_url to bytea."
+        description="Migrate counterparty logos from logo_url to media blobs."
     )
     parser.add_argument("--dry-run", action="store_true", help="Do not commit changes")
     args = parser.parse_args()
@@ -82,17 +78,17 @@ def main() -> None:
         rows = session.execute(select(Counterparty)).scalars().all()
         updated = 0
         for row in rows:
-            if row.logo_data:
-                row.logo_url = build_logo_url(row.id)
+            if row.logo_hash:
+                row.logo_url = media_url(row.logo_hash)
                 continue
             if not row.logo_url:
                 continue
             data, mime = resolve_logo_source(row.logo_url)
             if not data:
                 continue
-            row.logo_data = data
             row.logo_mime = mime
-            row.logo_url = build_logo_url(row.id)
+            row.logo_hash = store_media(session, data, row.logo_mime)
+            row.logo_url = media_url(row.logo_hash)
             updated += 1
 
         if args.dry_run:
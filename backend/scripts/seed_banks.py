@@ -12,9 +12,10 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from db import SessionLocal
 from config import settings
+from media import media_url, store_media
 from models import Counterparty, CounterpartyIndustry
 
-CBR_URL = "https://cbr.ru/banking_sector/credit/FullCoList/"
+CBR_URL = f"{settings.cbr_base_url.rstrip('/')}/banking_sector/credit/FullCoList/"
 ALLOWED_STATUSES = {"Действующая", "Отозванная"}
 LOGO_MAX_BYTES = 2 * 1024 * 1024
 LOGO_BY_OGRN = {
@@ -204,25 +205,22 @@ def upsert_banks(rows: list[dict], dry_run: bool) -> int:
                 existing.entity_type = "LEGAL"
                 existing.industry_id = bank_industry.id
                 if logo_data:
-                    existing.logo_data = logo_data
                     existing.logo_mime = logo_mime
+                    existing.logo_hash = store_media(session, logo_data, logo_mime)
                 existing.logo_url = (
-                    f"{settings.public_base_url}/counterparties/{existing.id}/logo"
-                    if existing.logo_data
-                    else None
+                    media_url(existing.logo_hash) if existing.logo_hash else None
                 )
             else:
                 data["industry_id"] = bank_industry.id
-                data["logo_data"] = logo_data
+                data["logo_hash"] = (
+                    store_media(session, logo_data, logo_mime) if logo_data else None
+                )
                 data["logo_mime"] = logo_mime
                 data.pop("logo_source", None)
-                bank = Counterparty(**data)
-                session.add(bank)
-                session.flush()
-                if bank.logo_data:
-                    bank.logo_url = (
-                        f"{settings.public_base_url}/counterparties/{bank.id}/logo"
-                    )
+                data["logo_url"] = (
+                    media_url(data["logo_hash"]) if data["logo_hash"] else None
+                )
+                session.add(Counterparty(**data))
 
         if dry_run:
             session.rollback()
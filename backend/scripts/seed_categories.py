@@ -3,6 +3,7 @@ import argparse
 from sqlalchemy import select
 
 from category_seed_data import CATEGORY_ICON_BY_L1, CATEGORY_SEED
+from category_service import add_category_closure, bump_category_version
 from db import SessionLocal
 from models import Category
 
@@ -43,7 +44,7 @@ def upsert_category(
         icon_name=icon_name,
     )
     session.add(category)
-    session.flush()
+    add_category_closure(session, category)
     return category
 
 
@@ -73,6 +74,7 @@ def main() -> None:
     session = SessionLocal()
     try:
         seed_tree(session, CATEGORY_SEED, scope="BOTH", parent_id=None)
+        bump_category_version(session, None)
         if args.dry_run:
             session.rollback()
         else:
@@ -3,10 +3,11 @@ import xml.etree.ElementTree as ET
 
 import requests
 
+from config import settings
 from db import SessionLocal
 from models import Currency
 
-CBR_URL = "https://cbr.ru/scripts/XML_valFull.asp"
+CBR_URL = f"{settings.cbr_base_url.rstrip('/')}/scripts/XML_valFull.asp"
 
 
 def load_xml(path: str | None) -> bytes:
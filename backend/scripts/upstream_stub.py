@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures" / "upstream"
+DEFAULT_UPSTREAMS = {
+    "iss": "https://iss.moex.com/iss",
+    "cbr": "https://cbr.ru",
+}
+UPSTREAM_TIMEOUT_SECONDS = 30
+
+
+def canonical_query(query: str) -> str:
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def fixture_slug(path: str, query: str) -> str:
+    slug = path.strip("/").replace("/", "_").replace(".", "_") or "root"
+    if query:
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        slug = f"{slug}__{digest}"
+    return slug
+
+
+class FixtureStore:
+    """Fixtures keyed by path and canonical query.
+
+    Each fixture is a ``<slug>.json`` metadata file next to a ``<slug>.body``
+    file with the raw upstream bytes. A fixture recorded with an empty query
+    also answers any query for the same path.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.lock = threading.Lock()
+        self.exact: dict[tuple[str, str], dict] = {}
+        self.by_path: dict[str, dict] = {}
+        if root.exists():
+            for meta_path in sorted(root.glob("*.json")):
+                with open(meta_path, "r", encoding="utf-8") as handle:
+                    meta = json.load(handle)
+                meta["body_path"] = meta_path.with_suffix(".body")
+                self._index(meta)
+
+    def _index(self, meta: dict) -> None:
+        self.exact[(meta["path"], meta["query"])] = meta
+        if not meta["query"]:
+            self.by_path[meta["path"]] = meta
+
+    def find(self, path: str, query: str) -> dict | None:
+        with self.lock:
+            return self.exact.get((path, query)) or self.by_path.get(path)
+
+    def save(self, path: str, query: str, status: int, content_type: str, body: bytes) -> None:
+        slug = fixture_slug(path, query)
+        meta = {
+            "path": path,
+            "query": query,
+            "status": status,
+            "content_type": content_type,
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        body_path = self.root / f"{slug}.body"
+        body_path.write_bytes(body)
+        with open(self.root / f"{slug}.json", "w", encoding="utf-8") as handle:
+            json.dump(meta, handle, ensure_ascii=False, indent=2)
+            handle.write("\n")
+        meta["body_path"] = body_path
+        with self.lock:
+            self._index(meta)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = canonical_query(parts.query)
+        if self.server.mode == "record":
+            self._record(path, query, parts.query)
+        else:
+            self._replay(path, query)
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, path: str, query: str, raw_query: str) -> None:
+        prefix, _, rest = path.lstrip("/").partition("/")
+        upstream = self.server.upstreams.get(prefix)
+        if not upstream:
+            self._send(404, "text/plain; charset=utf-8", b"Unknown upstream prefix")
+            return
+        url = f"{upstream.rstrip('/')}/{rest}"
+        if raw_query:
+            url = f"{url}?{raw_query}"
+        try:
+            response = requests.get(url, timeout=UPSTREAM_TIMEOUT_SECONDS)
+        except requests.RequestException as exc:
+            self._send(502, "text/plain; charset=utf-8", str(exc).encode("utf-8"))
+            return
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        self.server.store.save(path, query, response.status_code, content_type, response.content)
+        self._send(response.status_code, content_type, response.content)
+
+    def _replay(self, path: str, query: str) -> None:
+        server = self.server
+        delay, outcome = server.next_outcome()
+        if delay:
+            time.sleep(delay)
+        if outcome == "stall":
+            time.sleep(server.stall_seconds)
+        elif outcome == "error":
+            self._send(server.error_status, "text/plain; charset=utf-8", b"Injected upstream error")
+            return
+
+        fixture = server.store.find(path, query)
+        if fixture is None:
+            self._send(404, "text/plain; charset=utf-8", f"No fixture for {path}?{query}".encode("utf-8"))
+            return
+        self._send(fixture["status"], fixture["content_type"], fixture["body_path"].read_bytes())
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        store: FixtureStore,
+        mode: str,
+        upstreams: dict[str, str],
+        latency_ms: int = 0,
+        jitter_ms: int = 0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 30.0,
+        seed: int | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(address, StubHandler)
+        self.store = store
+        self.mode = mode
+        self.upstreams = upstreams
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def next_outcome(self) -> tuple[float, str]:
+        # One shared seeded generator keeps a replay run reproducible.
+        with self.random_lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            roll = self.random.random()
+        delay = max(self.latency_ms + jitter, 0) / 1000
+        if roll < self.stall_rate:
+            return delay, "stall"
+        if roll < self.stall_rate + self.error_rate:
+            return delay, "error"
+        return delay, "ok"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for MOEX ISS and CBR: record real responses or replay fixtures."
+    )
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR), help="Fixture directory")
+    parser.add_argument("--moex-upstream", default=DEFAULT_UPSTREAMS["iss"])
+    parser.add_argument("--cbr-upstream", default=DEFAULT_UPSTREAMS["cbr"])
+    parser.add_argument("--latency-ms", type=int, default=0, help="Base delay per replayed response")
+    parser.add_argument("--jitter-ms", type=int, default=0, help="Uniform +/- jitter around latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of requests that hang to force client timeouts")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error injection")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = StubServer(
+        (args.host, args.port),
+        FixtureStore(Path(args.fixtures)),
+        args.mode,
+        {"iss": args.moex_upstream, "cbr": args.cbr_upstream},
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    base = f"http://{args.host}:{args.port}"
+    print(f"Serving {args.mode} on {base}")
+    print(f"  MOEX_BASE_URL={base}/iss")
+    print(f"  CBR_BASE_URL={base}/cbr")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
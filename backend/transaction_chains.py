@@ -1,15 +1,28 @@
+from bisect import bisect_left
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta, timezone
 import calendar
+import io
+from typing import Callable
 
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session
 
-from auth import get_current_user
+from auth import Principal, get_current_user
 from category_service import resolve_category_or_400
+from config import settings
 from db import get_db
+from jobs import enqueue_job, job_handler
 from models import Item, Transaction, TransactionChain, User, Counterparty
-from schemas import TransactionChainCreate, TransactionChainOut
+from schemas import (
+    TransactionChainCreate,
+    TransactionChainOut,
+    TransactionChainUpdate,
+    TransactionOut,
+)
 
 router = APIRouter(prefix="/transaction-chains", tags=["transaction-chains"])
 
@@ -120,7 +133,29 @@ def iter_regular(start: date, end: date, interval_days: int):
         current += step
 
 
-def build_schedule_dates(
+def _day(value: date) -> np.datetime64:
+    return np.datetime64(value, "D")
+
+
+def _monthly_dates(
+    start: date, end: date, monthly_day: int | None, monthly_rule: str | None
+) -> np.ndarray:
+    months = np.arange(
+        np.datetime64(start, "M"), np.datetime64(end, "M") + 1, dtype="datetime64[M]"
+    )
+    month_starts = months.astype("datetime64[D]")
+    month_lengths = ((months + 1).astype("datetime64[D]") - month_starts).astype(np.int64)
+    if monthly_day is not None:
+        offsets = np.minimum(monthly_day, month_lengths) - 1
+    elif monthly_rule == "FIRST_DAY":
+        offsets = np.zeros_like(month_lengths)
+    else:
+        offsets = month_lengths - 1
+    candidates = month_starts + offsets
+    return candidates[(candidates >= _day(start)) & (candidates <= _day(end))]
+
+
+def schedule_date_array(
     start: date,
     end: date,
     frequency: str,
@@ -128,20 +163,337 @@ def build_schedule_dates(
     monthly_day: int | None,
     monthly_rule: str | None,
     interval_days: int | None,
-) -> list[date]:
+) -> np.ndarray:
+    """Ascending datetime64[D] occurrences, same dates as the iter_* generators."""
+    empty = np.array([], dtype="datetime64[D]")
+    if start > end:
+        return empty
+    stop = _day(end) + 1
     if frequency == "DAILY":
-        return list(iter_daily(start, end))
+        return np.arange(_day(start), stop, dtype="datetime64[D]")
     if frequency == "WEEKLY":
         if weekly_day is None:
-            return []
-        return list(iter_weekly(start, end, weekly_day))
+            return empty
+        first = _day(start) + (weekly_day - start.weekday()) % 7
+        return np.arange(first, stop, 7, dtype="datetime64[D]")
     if frequency == "MONTHLY":
-        return list(iter_monthly(start, end, monthly_day, monthly_rule))
+        return _monthly_dates(start, end, monthly_day, monthly_rule)
     if frequency == "REGULAR":
         if interval_days is None or interval_days < 1:
-            return []
-        return list(iter_regular(start, end, interval_days))
-    return []
+            return empty
+        return np.arange(_day(start), stop, interval_days, dtype="datetime64[D]")
+    return empty
+
+
+def build_schedule_dates(
+    start: date,
+    end: date,
+    frequency: str,
+    weekly_day: int | None,
+    monthly_day: int | None,
+    monthly_rule: str | None,
+    interval_days: int | None,
+) -> list[date]:
+    return schedule_date_array(
+        start, end, frequency, weekly_day, monthly_day, monthly_rule, interval_days
+    ).tolist()
+
+
+def chain_occurrence_values(chain: TransactionChain, occurrence_date: date) -> dict:
+    return {
+        "user_id": chain.user_id,
+        "chain_id": chain.id,
+        "transaction_date": datetime.combine(occurrence_date, datetime.min.time()),
+        "primary_item_id": chain.primary_item_id,
+        "primary_card_item_id": chain.primary_card_item_id,
+        "counterparty_item_id": chain.counterparty_item_id,
+        "counterparty_card_item_id": chain.counterparty_card_item_id,
+        "counterparty_id": chain.counterparty_id,
+        "amount_rub": chain.amount_rub,
+        "amount_counterparty": chain.amount_counterparty,
+        "direction": chain.direction,
+        "transaction_type": "PLANNED",
+        "status": "CONFIRMED",
+        "category_id": chain.category_id,
+        "comment": chain.comment,
+    }
+
+
+# A virtual occurrence is addressed by a negative id packing the chain id and
+# the proleptic ordinal of its date (below 2**20 until year 2870).
+_OCCURRENCE_DATE_BITS = 20
+_OCCURRENCE_DATE_MASK = (1 << _OCCURRENCE_DATE_BITS) - 1
+# Smallest batch of schedule dates checked for materialized rows at once.
+_VIRTUAL_WINDOW_MIN = 64
+
+
+def virtual_occurrence_id(chain_id: int, occurrence_date: date) -> int:
+    return -((chain_id << _OCCURRENCE_DATE_BITS) | occurrence_date.toordinal())
+
+
+def parse_virtual_occurrence_id(tx_id: int) -> tuple[int, date] | None:
+    if tx_id >= 0:
+        return None
+    packed = -tx_id
+    try:
+        occurrence_date = date.fromordinal(packed & _OCCURRENCE_DATE_MASK)
+    except ValueError:
+        return None
+    return packed >> _OCCURRENCE_DATE_BITS, occurrence_date
+
+
+def _chain_schedule(chain: TransactionChain, end_date: date | None = None) -> list[date]:
+    return build_schedule_dates(
+        chain.start_date,
+        chain.end_date if end_date is None else min(chain.end_date, end_date),
+        chain.frequency,
+        chain.weekly_day,
+        chain.monthly_day,
+        chain.monthly_rule,
+        chain.interval_days,
+    )
+
+
+def _materialized_dates(
+    db: Session, user: User, chain_id: int, first: date, last: date
+) -> set[date]:
+    return set(
+        db.execute(
+            select(Transaction.occurrence_date).where(
+                Transaction.user_id == user.id,
+                Transaction.chain_id == chain_id,
+                Transaction.occurrence_date >= first,
+                Transaction.occurrence_date <= last,
+            )
+        ).scalars()
+    )
+
+
+def expand_virtual_occurrences(
+    db: Session,
+    user: User,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    matches: Callable[[TransactionOut], bool] | None = None,
+    limit: int | None = None,
+) -> list[TransactionOut]:
+    """Unmaterialized occurrences of the user's virtual chains within a range.
+
+    Occurrences that already have a row in the chain, deleted or not, are
+    skipped: that row replaced the generated occurrence, even if its own date
+    was edited since. Each schedule is walked from
+    the newest date down, so with a limit at most that many matching
+    occurrences are built per chain.
+    """
+    query = db.query(TransactionChain).filter(
+        TransactionChain.user_id == user.id,
+        TransactionChain.is_virtual.is_(True),
+        TransactionChain.deleted_at.is_(None),
+    )
+    if date_from is not None:
+        query = query.filter(TransactionChain.end_date >= date_from)
+    if date_to is not None:
+        query = query.filter(TransactionChain.start_date <= date_to)
+    chains = query.all()
+
+    occurrences = []
+    for chain in chains:
+        dates = _chain_schedule(chain, date_to)
+        if date_from is not None:
+            dates = dates[bisect_left(dates, date_from) :]
+
+        # Materialized rows are looked up one window of dates at a time.
+        window = len(dates) if limit is None else max(limit, _VIRTUAL_WINDOW_MIN)
+        found = 0
+        upper = len(dates)
+        while upper > 0 and (limit is None or found < limit):
+            lower = max(upper - window, 0)
+            skipped = _materialized_dates(db, user, chain.id, dates[lower], dates[upper - 1])
+            for occurrence_date in reversed(dates[lower:upper]):
+                if occurrence_date in skipped:
+                    continue
+                occurrence = TransactionOut(
+                    id=virtual_occurrence_id(chain.id, occurrence_date),
+                    created_at=chain.created_at,
+                    chain_name=chain.name,
+                    is_virtual=True,
+                    **chain_occurrence_values(chain, occurrence_date),
+                )
+                if matches is not None and not matches(occurrence):
+                    continue
+                occurrences.append(occurrence)
+                found += 1
+                if limit is not None and found >= limit:
+                    break
+            upper = lower
+    return occurrences
+
+
+def materialize_virtual_occurrence(db: Session, user: User, tx_id: int) -> Transaction | None:
+    """Turn a virtual occurrence id into a stored PLANNED row, once."""
+    parsed = parse_virtual_occurrence_id(tx_id)
+    if parsed is None:
+        return None
+    chain_id, occurrence_date = parsed
+    chain = (
+        db.query(TransactionChain)
+        .filter(
+            TransactionChain.id == chain_id,
+            TransactionChain.user_id == user.id,
+            TransactionChain.is_virtual.is_(True),
+            TransactionChain.deleted_at.is_(None),
+        )
+        .with_for_update()
+        .first()
+    )
+    if not chain or occurrence_date not in _chain_schedule(chain):
+        return None
+
+    existing = (
+        db.query(Transaction)
+        .filter(
+            Transaction.user_id == user.id,
+            Transaction.chain_id == chain.id,
+            Transaction.occurrence_date == occurrence_date,
+        )
+        .order_by(Transaction.id)
+        .first()
+    )
+    if existing:
+        return existing
+    tx = Transaction(
+        occurrence_date=occurrence_date, **chain_occurrence_values(chain, occurrence_date)
+    )
+    db.add(tx)
+    db.flush()
+    return tx
+
+
+def _copy_literal(value: object) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_transactions(db: Session, rows: list[dict]) -> None:
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_literal(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {Transaction.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+_DEFERRED_ROWS_KEY = "deferred_planned_transactions"
+
+
+@contextmanager
+def deferred_planned_inserts(db: Session):
+    """Collect rows passed to insert_planned_transactions inside the block
+    instead of inserting them; the caller inserts the yielded list later."""
+    rows: list[dict] = []
+    db.info[_DEFERRED_ROWS_KEY] = rows
+    try:
+        yield rows
+    finally:
+        db.info.pop(_DEFERRED_ROWS_KEY, None)
+
+
+def insert_planned_transactions(db: Session, rows: list[dict]) -> None:
+    """Insert generated chain rows without building ORM objects.
+
+    Rows must share the same keys. Regular schedules go through a multi-row
+    INSERT batched by ``insertmanyvalues``; very large ones use COPY on
+    PostgreSQL. Inserted rows are not added to the session.
+    """
+    if not rows:
+        return
+    deferred = db.info.get(_DEFERRED_ROWS_KEY)
+    if deferred is not None:
+        deferred.extend(rows)
+        return
+    if (
+        len(rows) >= settings.transaction_copy_threshold_rows
+        and db.get_bind().dialect.name == "postgresql"
+    ):
+        _copy_transactions(db, rows)
+        return
+    db.execute(insert(Transaction.__table__), rows)
+
+
+# A resync never changes a matched row's identity, date, type or status.
+_SYNC_KEPT_KEYS = {"user_id", "chain_id", "transaction_date", "transaction_type", "status"}
+
+
+def sync_chain_rows(
+    db: Session,
+    user: User,
+    chain_id: int,
+    rows: list[dict],
+    now: datetime,
+    date_from: date | None = None,
+) -> None:
+    """Apply the minimal diff that makes a chain's open PLANNED rows match ``rows``.
+
+    Rows are matched by date: matched rows get changed columns updated,
+    missing dates are inserted and dates no longer scheduled are soft-deleted.
+    Dates the chain already realized are not planned again, and nothing dated
+    before ``date_from`` is touched.
+    """
+    query = db.query(Transaction).filter(
+        Transaction.user_id == user.id,
+        Transaction.chain_id == chain_id,
+        Transaction.transaction_type == "PLANNED",
+        Transaction.deleted_at.is_(None),
+    )
+    if date_from is not None:
+        query = query.filter(
+            Transaction.transaction_date >= datetime.combine(date_from, datetime.min.time())
+        )
+    by_date: dict[date, list[Transaction]] = {}
+    realized_dates: set[date] = set()
+    for tx in query.order_by(Transaction.transaction_date, Transaction.id):
+        if tx.status == "REALIZED":
+            realized_dates.add(tx.transaction_date.date())
+        else:
+            by_date.setdefault(tx.transaction_date.date(), []).append(tx)
+
+    new_rows = []
+    for row in rows:
+        tx_date = row["transaction_date"].date()
+        if date_from is not None and tx_date < date_from:
+            continue
+        matches = by_date.pop(tx_date, None)
+        if not matches:
+            if tx_date not in realized_dates:
+                new_rows.append(row)
+            continue
+        # Assigning an equal value leaves the attribute clean, so untouched
+        # rows produce no UPDATE at flush.
+        for key, value in row.items():
+            if key not in _SYNC_KEPT_KEYS:
+                setattr(matches[0], key, value)
+        for duplicate in matches[1:]:
+            duplicate.deleted_at = now
+
+    for stale in by_date.values():
+        for tx in stale:
+            tx.deleted_at = now
+    insert_planned_transactions(db, new_rows)
 
 
 def resolve_counterparty(
@@ -168,7 +520,7 @@ def resolve_counterparty(
 def list_transaction_chains(
     linked_item_id: int | None = None,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     query = db.query(TransactionChain).filter(TransactionChain.user_id == user.id)
     if linked_item_id is not None:
@@ -176,12 +528,11 @@ def list_transaction_chains(
     return query.order_by(TransactionChain.created_at.desc(), TransactionChain.id.desc()).all()
 
 
-@router.post("", response_model=TransactionChainOut)
-def create_transaction_chain(
+def _resolve_chain_values(
+    db: Session,
+    user: User,
     data: TransactionChainCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+) -> tuple[dict, list[date]]:
     resolve_counterparty(db, user, data.counterparty_id)
     primary_side = _resolve_effective_side(db, user, data.primary_item_id, "primary")
     primary = primary_side.effective_item
@@ -252,8 +603,7 @@ def create_transaction_chain(
 
     category = resolve_category_or_400(db, user, data.category_id)
 
-    chain = TransactionChain(
-        user_id=user.id,
+    values = dict(
         name=data.name,
         start_date=data.start_date,
         end_date=data.end_date,
@@ -281,44 +631,136 @@ def create_transaction_chain(
         category_id=category.id if category else None,
         comment=data.comment,
     )
+    return values, schedule_dates
+
+
+@router.post("", response_model=TransactionChainOut)
+def create_transaction_chain(
+    data: TransactionChainCreate,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    values, schedule_dates = _resolve_chain_values(db, user, data)
+    chain = TransactionChain(user_id=user.id, is_virtual=data.is_virtual, **values)
     db.add(chain)
     db.flush()
 
-    txs = []
-    for tx_date in schedule_dates:
-        txs.append(
-            Transaction(
-                user_id=user.id,
-                chain_id=chain.id,
-                transaction_date=datetime.combine(tx_date, datetime.min.time()),
-                primary_item_id=primary.id,
-                primary_card_item_id=primary_side.card_item.id if primary_side.card_item else None,
-                counterparty_item_id=counter.id if data.direction == "TRANSFER" else None,
-                counterparty_card_item_id=(
-                    counter_side.card_item.id if counter_side and counter_side.card_item else None
-                ),
-                counterparty_id=data.counterparty_id,
-                amount_rub=data.amount_rub,
-                amount_counterparty=amount_counterparty if data.direction == "TRANSFER" else None,
-                direction=data.direction,
-                transaction_type="PLANNED",
-                status="CONFIRMED",
-                category_id=category.id if category else None,
-                comment=data.comment,
+    if not chain.is_virtual:
+        insert_planned_transactions(
+            db, [chain_occurrence_values(chain, tx_date) for tx_date in schedule_dates]
+        )
+    db.commit()
+    db.refresh(chain)
+    return chain
+
+
+@router.patch("/{chain_id}", response_model=TransactionChainOut)
+def update_transaction_chain(
+    chain_id: int,
+    data: TransactionChainUpdate,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    chain = (
+        db.query(TransactionChain)
+        .filter(TransactionChain.id == chain_id, TransactionChain.user_id == user.id)
+        .with_for_update()
+        .first()
+    )
+    if not chain:
+        raise HTTPException(status_code=404, detail="Transaction chain not found")
+    if chain.deleted_at is not None:
+        raise HTTPException(status_code=400, detail="Cannot edit deleted transaction chain")
+    if chain.source == "AUTO_ITEM":
+        raise HTTPException(
+            status_code=400, detail="Auto-generated chains are edited through their item"
+        )
+    if "is_virtual" in data.model_fields_set and data.is_virtual != chain.is_virtual:
+        raise HTTPException(status_code=400, detail="is_virtual cannot be changed")
+    if chain.is_virtual and data.apply_from is not None:
+        raise HTTPException(
+            status_code=400, detail="apply_from is not supported for virtual chains"
+        )
+
+    values, schedule_dates = _resolve_chain_values(db, user, data)
+    for key, value in values.items():
+        setattr(chain, key, value)
+
+    now = datetime.now(timezone.utc)
+    if chain.is_virtual:
+        # Stored rows of a virtual chain are per-occurrence overrides: keep
+        # them, except open ones whose occurrence is no longer scheduled.
+        scheduled = set(schedule_dates)
+        for tx in (
+            db.query(Transaction)
+            .filter(
+                Transaction.user_id == user.id,
+                Transaction.chain_id == chain.id,
+                Transaction.transaction_type == "PLANNED",
+                Transaction.status != "REALIZED",
+                Transaction.deleted_at.is_(None),
             )
+        ):
+            if tx.occurrence_date not in scheduled:
+                tx.deleted_at = now
+    else:
+        sync_chain_rows(
+            db,
+            user,
+            chain.id,
+            [chain_occurrence_values(chain, tx_date) for tx_date in schedule_dates],
+            now,
+            date_from=data.apply_from,
         )
 
-    db.add_all(txs)
     db.commit()
     db.refresh(chain)
     return chain
 
 
+CHAIN_PURGE_JOB = "CHAIN_PURGE"
+
+
+def _open_planned_rows(user: User, chain_id: int):
+    return (
+        Transaction.user_id == user.id,
+        Transaction.chain_id == chain_id,
+        Transaction.transaction_type == "PLANNED",
+        Transaction.deleted_at.is_(None),
+    )
+
+
+@job_handler(CHAIN_PURGE_JOB)
+def _run_chain_purge(db: Session, user: User, payload: dict) -> dict:
+    """Soft-delete a deleted chain's planned rows in short committed batches."""
+    chain = db.get(TransactionChain, payload["chain_id"])
+    if not chain or chain.user_id != user.id or chain.deleted_at is None:
+        return {"purged": 0}
+    deleted_at = chain.deleted_at
+    purged = 0
+    while True:
+        ids = db.scalars(
+            select(Transaction.id)
+            .where(*_open_planned_rows(user, chain.id))
+            .limit(settings.chain_purge_batch_rows)
+        ).all()
+        if not ids:
+            return {"purged": purged}
+        db.execute(
+            update(Transaction)
+            .where(Transaction.id.in_(ids))
+            .values(deleted_at=deleted_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        purged += len(ids)
+
+
 @router.delete("/{chain_id}")
 def delete_transaction_chain(
     chain_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     chain = (
         db.query(TransactionChain)
@@ -335,14 +777,17 @@ def delete_transaction_chain(
     now = datetime.now(timezone.utc)
     chain.deleted_at = now
 
+    open_rows = db.scalar(
+        select(func.count()).select_from(Transaction).where(*_open_planned_rows(user, chain.id))
+    )
+    if open_rows > settings.chain_purge_inline_max_rows:
+        job = enqueue_job(db, user, CHAIN_PURGE_JOB, {"chain_id": chain.id})
+        db.commit()
+        return {"ok": True, "job_id": job.id}
+
     (
         db.query(Transaction)
-        .filter(
-            Transaction.user_id == user.id,
-            Transaction.chain_id == chain.id,
-            Transaction.transaction_type == "PLANNED",
-            Transaction.deleted_at.is_(None),
-        )
+        .filter(*_open_planned_rows(user, chain.id))
         .update({Transaction.deleted_at: now}, synchronize_session=False)
     )
 
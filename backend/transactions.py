@@ -2,11 +2,13 @@ from dataclasses import dataclass
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, selectinload
 
+from config import settings
 from db import get_db
-from auth import get_current_user
-from category_service import resolve_category_or_400
+from auth import Principal, get_current_user
+from category_service import category_subtree, resolve_category_or_400
 from models import Transaction, Item, User, Counterparty
 from market_utils import is_moex_item
+from transaction_chains import expand_virtual_occurrences, materialize_virtual_occurrence
 from schemas import (
     TransactionCreate,
     TransactionOut,
@@ -17,7 +19,7 @@ from schemas import (
     TransactionType,
 )
 from sqlalchemy import select, and_, or_, func
-from datetime import date, datetime, time, timezone
+from datetime import date, datetime, time, timedelta, timezone
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
@@ -96,6 +98,20 @@ def _parse_cursor(value: str) -> tuple[datetime, int]:
         cursor_dt = cursor_dt.replace(tzinfo=None)
     return cursor_dt, cursor_id
 
+def _materialized_tx_id(db: Session, user: User, tx_id: int) -> int:
+    # Negative ids address virtual chain occurrences: writing to one stores it.
+    if tx_id >= 0:
+        return tx_id
+    tx = materialize_virtual_occurrence(db, user, tx_id)
+    if not tx:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return tx.id
+
+
+def _sort_key(tx) -> tuple[datetime, int]:
+    return tx.transaction_date, tx.id
+
+
 def transfer_delta(kind: str, is_primary: bool, amount: int) -> int:
     if kind == "LIABILITY":
         return amount if is_primary else -amount
@@ -189,18 +205,38 @@ def _apply_position_delta(item: Item, delta_lots: int, tx_date) -> None:
 
 @router.get("", response_model=list[TransactionOut])
 def list_transactions(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int | None = Query(default=None, ge=1),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     # показываем только транзакции текущего пользователя
-    return (
+    query = (
         db.query(Transaction)
         .filter(Transaction.user_id == user.id)
         .filter(Transaction.deleted_at.is_(None))
-        .options(selectinload(Transaction.chain))
-        .order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
-        .all()
     )
+    if date_from:
+        query = query.filter(Transaction.transaction_date >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.filter(Transaction.transaction_date <= datetime.combine(date_to, time.max))
+    query = query.options(selectinload(Transaction.chain)).order_by(
+        Transaction.transaction_date.desc(), Transaction.id.desc()
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    rows = query.all()
+    # Virtual chains may run for decades; without an explicit bound only the
+    # planning horizon is expanded.
+    virtual_to = date_to or date.today() + timedelta(
+        days=settings.virtual_occurrence_horizon_days
+    )
+    virtual = expand_virtual_occurrences(db, user, date_from, virtual_to, limit=limit)
+    if not virtual:
+        return rows
+    merged = sorted([*rows, *virtual], key=_sort_key, reverse=True)
+    return merged if limit is None else merged[:limit]
 
 
 @router.get("/page", response_model=TransactionPageOut)
@@ -218,12 +254,13 @@ def list_transactions_page(
     card_item_ids: list[int] | None = Query(default=None),
     currency_item_ids: list[int] | None = Query(default=None),
     category_ids: list[int] | None = Query(default=None),
+    include_descendants: bool = False,
     counterparty_ids: list[int] | None = Query(default=None),
     comment_query: str | None = None,
     min_amount: int | None = Query(default=None, ge=0),
     max_amount: int | None = Query(default=None, ge=0),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     stmt = select(Transaction).where(Transaction.user_id == user.id)
 
@@ -247,6 +284,8 @@ def list_transactions_page(
     if transaction_type:
         stmt = stmt.where(Transaction.transaction_type.in_(transaction_type))
     if category_ids:
+        if include_descendants:
+            category_ids = list(db.execute(category_subtree(category_ids)).scalars())
         stmt = stmt.where(Transaction.category_id.in_(category_ids))
     if counterparty_ids:
         stmt = stmt.where(Transaction.counterparty_id.in_(counterparty_ids))
@@ -302,6 +341,61 @@ def list_transactions_page(
         .limit(limit + 1)
     )
     rows = list(db.execute(stmt).scalars())
+
+    include_virtual = (
+        not deleted_only
+        and (not status or "CONFIRMED" in status)
+        and (not transaction_type or "PLANNED" in transaction_type)
+    )
+    if include_virtual:
+        trimmed_comment = comment_query.strip().lower() if comment_query else ""
+        cursor_key = _parse_cursor(cursor) if cursor else None
+
+        def matches(tx: TransactionOut) -> bool:
+            if direction and tx.direction not in direction:
+                return False
+            if category_ids and tx.category_id not in category_ids:
+                return False
+            if counterparty_ids and tx.counterparty_id not in counterparty_ids:
+                return False
+            if item_ids or card_item_ids:
+                if not (
+                    (item_ids and (tx.primary_item_id in item_ids or tx.counterparty_item_id in item_ids))
+                    or (
+                        card_item_ids
+                        and (
+                            tx.primary_card_item_id in card_item_ids
+                            or tx.counterparty_card_item_id in card_item_ids
+                        )
+                    )
+                ):
+                    return False
+            if currency_item_ids and not (
+                tx.primary_item_id in currency_item_ids
+                or tx.counterparty_item_id in currency_item_ids
+            ):
+                return False
+            if trimmed_comment and trimmed_comment not in (tx.comment or "").lower():
+                return False
+            if min_amount is not None and abs(tx.amount_rub) < min_amount:
+                return False
+            if max_amount is not None and abs(tx.amount_rub) > max_amount:
+                return False
+            if cursor_key and _sort_key(tx) >= cursor_key:
+                return False
+            return True
+
+        # Nothing newer than the cursor can be on this page, and no chain can
+        # contribute more than limit + 1 of its rows.
+        upper = date_to
+        if cursor_key and (upper is None or cursor_key[0].date() < upper):
+            upper = cursor_key[0].date()
+        virtual = expand_virtual_occurrences(
+            db, user, date_from, upper, matches=matches, limit=limit + 1
+        )
+        if virtual:
+            rows = sorted([*rows, *virtual], key=_sort_key, reverse=True)[: limit + 1]
+
     has_more = len(rows) > limit
     if has_more:
         rows = rows[:limit]
@@ -316,7 +410,7 @@ def list_transactions_page(
 @router.get("/deleted", response_model=list[TransactionOut])
 def list_deleted_transactions(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     return (
         db.query(Transaction)
@@ -333,7 +427,7 @@ def list_deleted_transactions(
 def create_transaction(
     data: TransactionCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
     primary_side = _resolve_effective_side(db, user, data.primary_item_id, True, "primary")
     primary = primary_side.effective_item
@@ -514,8 +608,9 @@ def update_transaction(
     tx_id: int,
     data: TransactionCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
+    tx_id = _materialized_tx_id(db, user, tx_id)
     tx = (
         db.query(Transaction)
         .filter(Transaction.id == tx_id, Transaction.user_id == user.id)
@@ -889,8 +984,9 @@ def update_transaction_status(
     tx_id: int,
     data: TransactionStatusUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
+    tx_id = _materialized_tx_id(db, user, tx_id)
     tx = (
         db.query(Transaction)
         .filter(Transaction.id == tx_id, Transaction.user_id == user.id)
@@ -912,8 +1008,9 @@ def update_transaction_status(
 def delete_transaction(
     tx_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
+    tx_id = _materialized_tx_id(db, user, tx_id)
     tx = (
         db.query(Transaction)
         .filter(Transaction.id == tx_id, Transaction.user_id == user.id)
@@ -0,0 +1,124 @@
+from contextvars import ContextVar
+import threading
+import time
+from typing import Any, Callable
+
+import requests
+
+from config import settings
+
+# Monotonic deadline for upstream calls made while serving the current request.
+_DEADLINE: ContextVar[float | None] = ContextVar("upstream_deadline", default=None)
+
+
+class UpstreamUnavailableError(requests.RequestException):
+    """Raised without calling the upstream: its circuit is open or the request's
+    latency budget is spent."""
+
+
+async def upstream_latency_budget() -> None:
+    # Async so the deadline is set in the request context and is inherited by
+    # the threadpool that runs the sync endpoint.
+    _DEADLINE.set(time.monotonic() + settings.upstream_budget_seconds)
+
+
+def _remaining_budget() -> float | None:
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        probe_url: Callable[[], str],
+        timeout_seconds: Callable[[], float],
+    ) -> None:
+        self.name = name
+        self.probe_url = probe_url
+        self.timeout_seconds = timeout_seconds
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probe_timer: threading.Timer | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def get(self, url: str, params: dict[str, Any] | None = None) -> requests.Response:
+        if self.is_open:
+            raise UpstreamUnavailableError(f"{self.name} is temporarily unavailable")
+
+        timeout = self.timeout_seconds()
+        remaining = _remaining_budget()
+        cut_by_budget = remaining is not None and remaining < timeout
+        if cut_by_budget:
+            if remaining <= 0:
+                raise UpstreamUnavailableError(f"{self.name} latency budget exhausted")
+            timeout = remaining
+
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+        except requests.Timeout as exc:
+            # A timeout forced by a short remaining budget says nothing about
+            # the upstream's health.
+            if cut_by_budget:
+                raise UpstreamUnavailableError(f"{self.name} latency budget exhausted") from exc
+            self._record_failure()
+            raise
+        except requests.ConnectionError:
+            self._record_failure()
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self._record_failure()
+        else:
+            self._record_success()
+        response.raise_for_status()
+        return response
+
+    def _record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+
+    def _record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= settings.upstream_failure_threshold:
+                self.opened_at = time.monotonic()
+                self._schedule_probe()
+
+    def _schedule_probe(self) -> None:
+        self.probe_timer = threading.Timer(settings.upstream_reset_seconds, self._probe)
+        self.probe_timer.daemon = True
+        self.probe_timer.start()
+
+    def _probe(self) -> None:
+        try:
+            response = self.session.get(self.probe_url(), timeout=self.timeout_seconds())
+            healthy = response.status_code < 500 and response.status_code != 429
+        except requests.RequestException:
+            healthy = False
+        with self.lock:
+            if healthy:
+                self.failures = 0
+                self.opened_at = None
+                self.probe_timer = None
+            else:
+                self._schedule_probe()
+
+
+MOEX_BREAKER = CircuitBreaker(
+    "MOEX ISS",
+    probe_url=lambda: f"{settings.moex_base_url.rstrip('/')}/securities.json?iss.meta=off&limit=1",
+    timeout_seconds=lambda: settings.moex_timeout_seconds,
+)
+CBR_BREAKER = CircuitBreaker(
+    "CBR",
+    probe_url=lambda: f"{settings.cbr_base_url.rstrip('/')}/scripts/XML_daily.asp",
+    timeout_seconds=lambda: settings.cbr_timeout_seconds,
+)
@@ -87,6 +87,7 @@ import {
   fetchCounterpartyIndustries,
   fetchCurrencies,
   fetchFxRates,
+  fetchJob,
   fetchMarketInstruments,
   fetchMarketInstrumentDetails,
   fetchMarketInstrumentPrice,
@@ -108,6 +109,7 @@ import {
   CounterpartyIndustryOut,
   CurrencyOut,
   FxRateOut,
+  JobOut,
   MarketBoardOut,
   MarketInstrumentOut,
   MarketPriceOut,
@@ -323,6 +325,7 @@ const AUTO_PLAN_LOAN_TYPES = [
   "loan_to_third_party",
   "third_party_receivables",
 ];
+const PLAN_JOB_POLL_MS = 1500;
 
 const ITEM_SECTIONS: {
   id: string;
@@ -732,6 +735,7 @@ export default function Page() {
   const [itemPhotoPreview, setItemPhotoPreview] = useState<string | null>(null);
   const [itemPhotoError, setItemPhotoError] = useState<string | null>(null);
   const itemPhotoInputRef = useRef<HTMLInputElement | null>(null);
+  const planJobPollsRef = useRef<Map<number, number>>(new Map());
   const [icon3dFormat, setIcon3dFormat] = useState<"png" | "webp" | null>("png");
   const [show2dIcon, setShow2dIcon] = useState(false);
   const [isRightPanelOpen, setIsRightPanelOpen] = useState(false);
@@ -1989,6 +1993,42 @@ export default function Page() {
     }
   }
 
+  useEffect(() => {
+    const polls = planJobPollsRef.current;
+    return () => {
+      polls.forEach((timer) => window.clearTimeout(timer));
+      polls.clear();
+    };
+  }, []);
+
+  // Plan chains are rebuilt by a background job; reload planned
+  // transactions once it finishes and report a failed rebuild.
+  function watchPlanJob(jobId: number | null | undefined) {
+    const polls = planJobPollsRef.current;
+    if (!jobId || polls.has(jobId)) return;
+    const poll = async () => {
+      let job: JobOut | null = null;
+      try {
+        job = await fetchJob(jobId);
+      } catch {
+        job = null;
+      }
+      if (!polls.has(jobId)) return;
+      if (job && job.status !== "DONE" && job.status !== "FAILED") {
+        polls.set(jobId, window.setTimeout(poll, PLAN_JOB_POLL_MS));
+        return;
+      }
+      polls.delete(jobId);
+      await loadTransactions();
+      if (job?.status === "FAILED") {
+        setError(
+          `Не удалось перестроить плановые транзакции: ${job.last_error ?? "неизвестная ошибка"}`
+        );
+      }
+    };
+    polls.set(jobId, window.setTimeout(poll, PLAN_JOB_POLL_MS));
+  }
+
   async function loadCurrencies() {
     try {
       const data = await fetchCurrencies();
@@ -3253,6 +3293,7 @@ export default function Page() {
             // Photo upload is optional, so we continue even if it fails
           }
         }
+        watchPlanJob(updatedItem.plan_job_id);
         // Update the item in the list with the new data
         setItems((prevItems) =>
           prevItems.map((item) =>
@@ -3324,8 +3365,9 @@ export default function Page() {
           return;
         }
       }
-      await archiveItem(item.id);
+      const archivedItem = await archiveItem(item.id);
       await loadItems();
+      watchPlanJob(archivedItem.plan_job_id);
     } catch (e: any) {
       setError(e?.message ?? "Ошибка архивации");
     } finally {
@@ -3360,6 +3402,7 @@ export default function Page() {
     // Если баланс нулевой, продолжаем как раньше
     setLoading(true);
     try {
+      let closedItem: ItemOut;
       if (item.type_code === "bank_account") {
         const linkedCards = linkedCardsByAccountId.get(item.id) ?? [];
         if (linkedCards.length > 0) {
@@ -3370,14 +3413,15 @@ export default function Page() {
             setLoading(false);
             return;
           }
-          await closeItem(item.id, { closeCards: true });
+          closedItem = await closeItem(item.id, { closeCards: true });
         } else {
-          await closeItem(item.id);
+          closedItem = await closeItem(item.id);
         }
       } else {
-        await closeItem(item.id);
+        closedItem = await closeItem(item.id);
       }
       await loadItems();
+      watchPlanJob(closedItem.plan_job_id);
     } catch (e: any) {
       setError(e?.message ?? "Не удалось закрыть счет");
     } finally {
@@ -3412,8 +3456,9 @@ export default function Page() {
         }
       }
       
-      await closeItem(closingItem.id, payload);
+      const closedItem = await closeItem(closingItem.id, payload);
       await loadItems();
+      watchPlanJob(closedItem.plan_job_id);
       setCloseItemDialogOpen(false);
       setClosingItem(null);
     } catch (e: any) {
@@ -4202,14 +4247,12 @@ export default function Page() {
                   <div className="grid gap-2">
                     <Label>{isBankCounterparty ? "Банк" : "Контрагент"}</Label>
                     <CounterpartySelector
-                      counterparties={counterparties}
                       selectedIds={counterpartyId ? [counterpartyId] : []}
                       onChange={(ids) => setCounterpartyId(ids[0] ?? null)}
                       selectionMode="single"
                       placeholder="Начните вводить название"
                       industries={industries}
                       disabled={counterpartyLoading}
-                      counterpartyCounts={counterpartyTxCounts}
                       filterByIndustryId={
                         isBankCounterparty
                           ? industries.find((ind) => ind.name === "Банки")?.id ?? null
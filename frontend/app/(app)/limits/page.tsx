@@ -31,7 +31,6 @@ import {
   SelectValue,
 } from "@/components/ui/select";
 import {
-  buildCategoryDescendants,
   buildCategoryLookup,
   buildCategoryMaps,
   CategoryNode,
@@ -45,12 +44,12 @@ import {
   createLimit,
   deleteLimit,
   fetchCategories,
+  fetchLimitUsage,
   fetchLimits,
-  fetchTransactions,
   LimitCreate,
   LimitOut,
   LimitPeriod,
-  TransactionOut,
+  LimitUsageOut,
   updateLimit,
 } from "@/lib/api";
 import { formatAmount } from "@/lib/item-utils";
@@ -114,10 +113,6 @@ function getTodayKey() {
   return toDateKey(new Date());
 }
 
-function toTxDateKey(value: string) {
-  return value ? value.slice(0, 10) : "";
-}
-
 function normalizeCategory(value: string) {
   return value.trim().replace(/\s+/g, " ").toLocaleLowerCase("ru");
 }
@@ -184,10 +179,6 @@ function normalizeRubOnBlur(value: string): string {
   return `${intPart},${decPart.slice(0, 2)}`;
 }
 
-function isRealizedTransaction(tx: TransactionOut) {
-  return tx.transaction_type === "ACTUAL" || tx.status === "REALIZED";
-}
-
 function getWeekStart(date: Date) {
   const day = date.getDay();
   const diff = (day + 6) % 7;
@@ -250,7 +241,7 @@ export default function LimitsPage() {
   const { activeStep, isWizardOpen } = useOnboarding();
 
   const [limits, setLimits] = useState<LimitOut[]>([]);
-  const [txs, setTxs] = useState<TransactionOut[]>([]);
+  const [usage, setUsage] = useState<LimitUsageOut[]>([]);
   const [categoryNodes, setCategoryNodes] = useState<CategoryNode[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
@@ -290,10 +281,6 @@ export default function LimitsPage() {
     () => buildCategoryLookup(categoryNodes),
     [categoryNodes]
   );
-  const categoryDescendants = useMemo(
-    () => buildCategoryDescendants(categoryNodes),
-    [categoryNodes]
-  );
 
   const categoryPaths = useMemo(() => {
     const paths: CategoryPathOption[] = [];
@@ -339,22 +326,11 @@ export default function LimitsPage() {
       { spent: number; progress: number; rangeLabel: string | null }
     >();
 
+    const spentById = new Map(usage.map((entry) => [entry.limit_id, entry.spent_rub]));
+
     limits.forEach((limit) => {
       const range = getLimitRange(limit, now);
-      const categoryIds =
-        categoryDescendants.get(limit.category_id) ?? new Set([limit.category_id]);
-      let spent = 0;
-      if (range) {
-        txs.forEach((tx) => {
-          if (tx.direction !== "EXPENSE") return;
-          if (!isRealizedTransaction(tx)) return;
-          if (!tx.category_id || !categoryIds.has(tx.category_id)) return;
-          const dateKey = toTxDateKey(tx.transaction_date);
-          if (!dateKey) return;
-          if (dateKey < range.startKey || dateKey > range.endKey) return;
-          spent += tx.amount_rub;
-        });
-      }
+      const spent = range ? spentById.get(limit.id) ?? 0 : 0;
       const progress =
         limit.amount_rub > 0 ? Math.min(spent / limit.amount_rub, 1) : 0;
       map.set(limit.id, {
@@ -364,19 +340,20 @@ export default function LimitsPage() {
       });
     });
     return map;
-  }, [categoryDescendants, limits, txs]);
+  }, [limits, usage]);
 
   const loadAll = async () => {
     setLoading(true);
     setError(null);
     try {
-      const [limitsData, txData, categoriesData] = await Promise.all([
+      const [limitsData, usageData, categoriesData] = await Promise.all([
         fetchLimits({ include_deleted: true }),
-        fetchTransactions(),
+        // Spend is summed on the server, including subcategories.
+        fetchLimitUsage({ on: getTodayKey(), include_deleted: true }),
         fetchCategories(),
       ]);
       setLimits(limitsData);
-      setTxs(txData);
+      setUsage(usageData);
       setCategoryNodes(categoriesData);
     } catch (e: any) {
       setError(
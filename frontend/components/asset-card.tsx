@@ -12,7 +12,7 @@ import {
   DropdownMenuSeparator,
   DropdownMenuTrigger,
 } from "@/components/ui/dropdown-menu";
-import { ItemOut, CounterpartyOut, API_BASE, MarketPriceOut } from "@/lib/api";
+import { ItemOut, CounterpartyOut, API_BASE, MarketPriceOut, mediaThumbnailUrl } from "@/lib/api";
 import { getEffectiveItemKind, formatAmount, getItemPhotoUrl } from "@/lib/item-utils";
 import { getItemTypeLabel } from "@/lib/item-types";
 import { buildCounterpartyDisplayName } from "@/lib/counterparty-utils";
@@ -288,7 +288,10 @@ export function AssetCard({
 
   // Counterparty logo/icon handling
   const counterpartyLogoUrl = counterparty
-    ? (counterparty.entity_type === "PERSON" ? counterparty.photo_url : counterparty.logo_url)
+    ? mediaThumbnailUrl(
+        counterparty.entity_type === "PERSON" ? counterparty.photo_url : counterparty.logo_url,
+        48
+      )
     : null;
   const rawCounterpartyLogoUrl = counterpartyLogoUrl;
   const counterpartyLogoUrlFull = rawCounterpartyLogoUrl
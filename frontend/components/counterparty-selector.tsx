@@ -11,7 +11,15 @@ import {
 } from "react";
 import { User, Building2 } from "lucide-react";
 
-import { CounterpartyOut, CounterpartyIndustryOut } from "@/lib/api";
+import {
+  CounterpartyLogoSpriteCellOut,
+  CounterpartyLogoSpriteOut,
+  CounterpartyOut,
+  CounterpartyIndustryOut,
+  fetchCounterpartyLogoSprite,
+  mediaThumbnailUrl,
+  searchCounterparties,
+} from "@/lib/api";
 import {
   normalizeCounterpartySearch,
   buildCounterpartyDisplayName,
@@ -24,7 +32,8 @@ import { ACCENT0, ACCENT2, ACTIVE_TEXT_DARK, DROPDOWN_BG, SIDEBAR_TEXT_ACTIVE, S
 import { AuthInput } from "@/components/ui/auth-input";
 
 type CounterpartySelectorProps = {
-  counterparties: CounterpartyOut[];
+  // Without a preloaded list the selector searches the server as the user types.
+  counterparties?: CounterpartyOut[];
   selectedIds: number[];
   onChange: (nextIds: number[]) => void;
   selectionMode?: "single" | "multi";
@@ -43,6 +52,25 @@ type CounterpartySelectorProps = {
 };
 
 const DEFAULT_EMPTY_MESSAGE = "Нет контрагентов.";
+const LOGO_SPRITE_MAX_IDS = 1000;
+const LOGO_DISPLAY_PX = 24;
+const SEARCH_PAGE_SIZE = 20;
+const SEARCH_DEBOUNCE_MS = 250;
+const SEARCH_MAX_IDS = 100;
+const NO_COUNTERPARTIES: CounterpartyOut[] = [];
+
+function buildSpriteCellStyle(
+  sprite: CounterpartyLogoSpriteOut,
+  cell: CounterpartyLogoSpriteCellOut
+): CSSProperties {
+  const scale = LOGO_DISPLAY_PX / sprite.cell_size;
+  return {
+    backgroundImage: `url(${sprite.sprite_url})`,
+    backgroundSize: `${sprite.width * scale}px ${sprite.height * scale}px`,
+    backgroundPosition: `-${cell.x * scale}px -${cell.y * scale}px`,
+    backgroundRepeat: "no-repeat",
+  };
+}
 const DEFAULT_NO_RESULTS_MESSAGE = "Ничего не найдено";
 
 export function CounterpartySelector({
@@ -67,6 +95,8 @@ export function CounterpartySelector({
   const [open, setOpen] = useState(false);
   const anchorRef = useRef<HTMLDivElement | null>(null);
   const [dropdownStyle, setDropdownStyle] = useState<CSSProperties | null>(null);
+  const isRemote = counterparties === undefined;
+  const localCounterparties = counterparties ?? NO_COUNTERPARTIES;
 
   useEffect(() => {
     if (resetSignal === undefined) return;
@@ -91,8 +121,8 @@ export function CounterpartySelector({
   }, [counterpartyCounts]);
 
   const sortedCounterparties = useMemo(
-    () => sortCounterpartiesByTransactionCount(counterparties, countById),
-    [counterparties, countById]
+    () => sortCounterpartiesByTransactionCount(localCounterparties, countById),
+    [localCounterparties, countById]
   );
 
   const filteredCounterparties = useMemo(() => {
@@ -117,9 +147,112 @@ export function CounterpartySelector({
     return filtered;
   }, [sortedCounterparties, query, filterByIndustryId, industriesMap]);
 
+  const [searchResults, setSearchResults] = useState<CounterpartyOut[]>([]);
+  const [searchCursor, setSearchCursor] = useState<string | null>(null);
+  const [searchLoading, setSearchLoading] = useState(false);
+  const [knownById, setKnownById] = useState<Map<number, CounterpartyOut>>(() => new Map());
+  const searchRequestRef = useRef(0);
+
+  const rememberCounterparties = useCallback((rows: CounterpartyOut[]) => {
+    if (rows.length === 0) return;
+    setKnownById((prev) => {
+      const next = new Map(prev);
+      rows.forEach((cp) => next.set(cp.id, cp));
+      return next;
+    });
+  }, []);
+
+  const runSearch = useCallback(
+    async (cursor: string | null) => {
+      const requestId = ++searchRequestRef.current;
+      setSearchLoading(true);
+      try {
+        const page = await searchCounterparties({
+          q: query.trim() || undefined,
+          industry_id: filterByIndustryId ?? null,
+          cursor,
+          limit: SEARCH_PAGE_SIZE,
+        });
+        if (requestId !== searchRequestRef.current) return;
+        setSearchResults((prev) => (cursor ? [...prev, ...page.items] : page.items));
+        setSearchCursor(page.has_more ? page.next_cursor : null);
+        rememberCounterparties(page.items);
+      } catch {
+        if (requestId !== searchRequestRef.current) return;
+        if (!cursor) setSearchResults([]);
+        setSearchCursor(null);
+      } finally {
+        if (requestId === searchRequestRef.current) setSearchLoading(false);
+      }
+    },
+    [query, filterByIndustryId, rememberCounterparties]
+  );
+
+  useEffect(() => {
+    if (!isRemote || !open) return;
+    const timer = window.setTimeout(() => {
+      void runSearch(null);
+    }, SEARCH_DEBOUNCE_MS);
+    return () => window.clearTimeout(timer);
+  }, [isRemote, open, runSearch]);
+
+  // Selected ids may not be on any loaded page; resolve them directly.
+  const selectedKey = selectedIds.join(",");
+  useEffect(() => {
+    if (!isRemote || !selectedKey) return;
+    const missing = selectedKey
+      .split(",")
+      .map(Number)
+      .filter((id) => !knownById.has(id))
+      .slice(0, SEARCH_MAX_IDS);
+    if (missing.length === 0) return;
+    let cancelled = false;
+    searchCounterparties({ ids: missing, limit: missing.length })
+      .then((page) => {
+        if (!cancelled) rememberCounterparties(page.items);
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [isRemote, selectedKey, knownById, rememberCounterparties]);
+
+  const options = isRemote ? searchResults : filteredCounterparties;
+
+  // One sprite sheet replaces a request per logo in long lists like banks.
+  const spriteIds = useMemo(
+    () =>
+      localCounterparties
+        .filter((cp) => (cp.entity_type === "PERSON" ? cp.photo_url : cp.logo_url))
+        .map((cp) => cp.id)
+        .slice(0, LOGO_SPRITE_MAX_IDS),
+    [localCounterparties]
+  );
+  const spriteKey = spriteIds.join(",");
+  const [logoSprite, setLogoSprite] = useState<CounterpartyLogoSpriteOut | null>(null);
+  useEffect(() => {
+    if (!open || !spriteKey) return;
+    let cancelled = false;
+    fetchCounterpartyLogoSprite(spriteKey.split(",").map(Number))
+      .then((sprite) => {
+        if (!cancelled) setLogoSprite(sprite);
+      })
+      .catch(() => {
+        if (!cancelled) setLogoSprite(null);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [open, spriteKey]);
+  const spriteCellById = useMemo(
+    () => new Map((logoSprite?.cells ?? []).map((cell) => [cell.counterparty_id, cell])),
+    [logoSprite]
+  );
+
   const counterpartiesById = useMemo(
-    () => new Map(counterparties.map((cp) => [cp.id, cp])),
-    [counterparties]
+    () =>
+      isRemote ? knownById : new Map(localCounterparties.map((cp) => [cp.id, cp])),
+    [isRemote, knownById, localCounterparties]
   );
   const selectedSet = useMemo(() => new Set(selectedIds), [selectedIds]);
   const selectedCounterparties = useMemo(
@@ -136,9 +269,12 @@ export function CounterpartySelector({
   const inputValue = query || selectedLabel;
   const selectedCounterparty = selectionMode === "single" ? selectedCounterparties[0] : null;
   const selectedImageUrl = selectedCounterparty
-    ? selectedCounterparty.entity_type === "PERSON"
-      ? selectedCounterparty.photo_url
-      : selectedCounterparty.logo_url
+    ? mediaThumbnailUrl(
+        selectedCounterparty.entity_type === "PERSON"
+          ? selectedCounterparty.photo_url
+          : selectedCounterparty.logo_url,
+        48
+      )
     : null;
 
   const applySelection = (id: number) => {
@@ -197,7 +333,7 @@ export function CounterpartySelector({
   useLayoutEffect(() => {
     if (!open) return;
     updateDropdownPosition();
-  }, [open, updateDropdownPosition, filteredCounterparties.length, selectedCounterparties.length]);
+  }, [open, updateDropdownPosition, options.length, selectedCounterparties.length]);
 
   useEffect(() => {
     if (!open) return;
@@ -237,6 +373,16 @@ export function CounterpartySelector({
       </span>
     ) : undefined;
 
+  const emptyText = isRemote
+    ? searchLoading
+      ? "Загрузка..."
+      : query.trim()
+      ? noResultsMessage
+      : emptyMessage
+    : localCounterparties.length === 0
+    ? emptyMessage
+    : noResultsMessage;
+
   return (
     <div className="space-y-3">
       <div className="relative [&_div.relative.flex.items-center]:h-10 [&_div.relative.flex.items-center]:min-h-[40px] [&_input]:text-sm [&_input]:font-normal" ref={anchorRef}>
@@ -277,10 +423,10 @@ export function CounterpartySelector({
               event.key === "Enter" &&
               open &&
               query.trim() &&
-              filteredCounterparties.length > 0
+              options.length > 0
             ) {
               event.preventDefault();
-              applySelection(filteredCounterparties[0].id);
+              applySelection(options[0].id);
             }
           }}
         />
@@ -324,16 +470,12 @@ export function CounterpartySelector({
                     {clearLabel}
                   </button>
                 )}
-                {counterparties.length === 0 ? (
-                  <div className="px-2 py-1 text-sm" style={{ color: SIDEBAR_TEXT_INACTIVE }}>
-                    {emptyMessage}
-                  </div>
-                ) : filteredCounterparties.length === 0 ? (
+                {options.length === 0 ? (
                   <div className="px-2 py-1 text-sm" style={{ color: SIDEBAR_TEXT_INACTIVE }}>
-                    {noResultsMessage}
+                    {emptyText}
                   </div>
                 ) : (
-                  filteredCounterparties.map((counterparty) => {
+                  options.map((counterparty) => {
                     const isSelected = selectedSet.has(counterparty.id);
                     const displayName = buildCounterpartyDisplayName(counterparty);
                     const typeLabel = getCounterpartyTypeLabel(counterparty);
@@ -349,10 +491,12 @@ export function CounterpartySelector({
 
                     const DefaultIcon =
                       counterparty.entity_type === "PERSON" ? User : Building2;
-                    const imageUrl =
+                    const imageUrl = mediaThumbnailUrl(
                       counterparty.entity_type === "PERSON"
                         ? counterparty.photo_url
-                        : counterparty.logo_url;
+                        : counterparty.logo_url,
+                      48
+                    );
 
                     return (
                       <button
@@ -376,7 +520,16 @@ export function CounterpartySelector({
                         onMouseDown={(event) => event.preventDefault()}
                         onClick={() => applySelection(counterparty.id)}
                       >
-                        {imageUrl ? (
+                        {logoSprite && spriteCellById.has(counterparty.id) ? (
+                          <span
+                            aria-hidden
+                            className={`h-6 w-6 shrink-0 rounded bg-white ${logoToneClass}`}
+                            style={buildSpriteCellStyle(
+                              logoSprite,
+                              spriteCellById.get(counterparty.id)!
+                            )}
+                          />
+                        ) : imageUrl ? (
                           <img
                             src={imageUrl}
                             alt={displayName}
@@ -420,6 +573,18 @@ export function CounterpartySelector({
                     );
                   })
                 )}
+                {isRemote && searchCursor && (
+                  <button
+                    type="button"
+                    className="w-full rounded-md px-2 py-1.5 text-left text-sm transition-colors"
+                    style={{ color: SIDEBAR_TEXT_INACTIVE }}
+                    disabled={searchLoading}
+                    onMouseDown={(event) => event.preventDefault()}
+                    onClick={() => void runSearch(searchCursor)}
+                  >
+                    {searchLoading ? "Загрузка..." : "Показать ещё"}
+                  </button>
+                )}
               </div>
             </div>
           </div>
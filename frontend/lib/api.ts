@@ -59,6 +59,7 @@ export type ItemOut = {
   plan_settings?: ItemPlanSettings | null;
   photo_url: string | null;
   photo_updated_at: string | null;
+  plan_job_id?: number | null;
 };
 
 export type ItemCreate = {
@@ -91,6 +92,51 @@ export type ItemCreate = {
   plan_settings?: ItemPlanSettings | null;
 };
 
+export type ItemPlanPreviewRequest = Pick<
+  ItemCreate,
+  | "kind"
+  | "type_code"
+  | "currency_code"
+  | "open_date"
+  | "deposit_term_days"
+  | "interest_rate"
+  | "interest_payout_order"
+  | "interest_capitalization"
+  | "interest_payout_account_id"
+  | "initial_value_rub"
+> & {
+  plan_settings: ItemPlanSettings;
+};
+
+export type ItemPlanPreviewRow = {
+  payout_date: string;
+  principal_rub: number;
+  interest_rub: number;
+};
+
+export type ItemPlanPreviewOut = {
+  rows: ItemPlanPreviewRow[];
+  principal_total_rub: number;
+  interest_total_rub: number;
+};
+
+export type ItemReplanEntry = {
+  item_id: number;
+  interest_rate?: number | null;
+  plan_settings?: ItemPlanSettings | null;
+};
+
+export type ItemReplanResult = {
+  item_id: number;
+  status: "REPLANNED" | "UNCHANGED" | "FAILED";
+  detail: string | null;
+};
+
+export type ItemReplanOut = {
+  results: ItemReplanResult[];
+  inserted_rows: number;
+};
+
 export type BankOut = {
   id: number;
   ogrn: string;
@@ -128,6 +174,20 @@ export type CounterpartyOut = {
   deleted_at: string | null;
 };
 
+export type CounterpartyLogoSpriteCellOut = {
+  counterparty_id: number;
+  x: number;
+  y: number;
+};
+
+export type CounterpartyLogoSpriteOut = {
+  sprite_url: string;
+  cell_size: number;
+  width: number;
+  height: number;
+  cells: CounterpartyLogoSpriteCellOut[];
+};
+
 export type OnboardingStateOut = {
   device_type: OnboardingDeviceType;
   status: OnboardingStatus;
@@ -218,6 +278,23 @@ export type MarketPriceOut = {
   accint_cents: number | null;
   yield_bp: number | null;
   currency_code: string | null;
+  is_stale?: boolean;
+  updated_at?: string | null;
+};
+
+export type NetWorthStep = "DAY" | "WEEK" | "MONTH";
+
+export type NetWorthItemSeriesOut = {
+  item_id: number;
+  currency_code: string;
+  values: (number | null)[];
+  rub_values: (number | null)[];
+};
+
+export type NetWorthReportOut = {
+  dates: string[];
+  total_rub_cents: (number | null)[];
+  items: NetWorthItemSeriesOut[];
 };
 
 export type CategoryScope = "INCOME" | "EXPENSE" | "BOTH";
@@ -280,6 +357,8 @@ export type TransactionOut = {
   deleted_at: string | null;
   linked_item_id?: number | null;
   source?: TransactionSource | null;
+  // Unstored occurrence of a virtual chain (negative id); writes materialize it.
+  is_virtual?: boolean;
 };
 
 export type UserMeOut = {
@@ -325,6 +404,7 @@ export type FetchTransactionsPageParams = {
   card_item_ids?: number[];
   currency_item_ids?: number[];
   category_ids?: number[];
+  include_descendants?: boolean;
   counterparty_ids?: number[];
   comment_query?: string;
   min_amount?: number;
@@ -350,6 +430,11 @@ export type TransactionChainCreate = {
   direction: TransactionDirection;
   category_id: number | null;
   comment?: string | null;
+  is_virtual?: boolean;
+};
+
+export type TransactionChainUpdate = TransactionChainCreate & {
+  apply_from?: string | null;
 };
 
 export type TransactionChainOut = {
@@ -380,6 +465,7 @@ export type TransactionChainOut = {
   amount_is_variable?: boolean | null;
   amount_min_rub?: number | null;
   amount_max_rub?: number | null;
+  is_virtual?: boolean;
 };
 
 export type LimitPeriod = "MONTHLY" | "WEEKLY" | "YEARLY" | "CUSTOM";
@@ -396,6 +482,13 @@ export type LimitOut = {
   deleted_at: string | null;
 };
 
+export type LimitUsageOut = {
+  limit_id: number;
+  start_date: string;
+  end_date: string;
+  spent_rub: number;
+};
+
 export type LimitCreate = {
   name: string;
   period: LimitPeriod;
@@ -426,6 +519,13 @@ export type TransactionCreate = {
 
 export const API_BASE = process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000";
 
+/** Point a content-hash media URL at its cached WebP thumbnail (48, 96 or 256 px). */
+export function mediaThumbnailUrl(url: string | null | undefined, size: 48 | 96 | 256): string | null {
+  if (!url) return null;
+  if (!url.includes("/media/")) return url;
+  return `${url.split("?")[0]}?size=${size}`;
+}
+
 async function authFetch(input: RequestInfo, init?: RequestInit) {
   const session = await getSession();
   const idToken = (session as any)?.idToken;
@@ -546,6 +646,43 @@ export async function fetchCounterparties(options?: {
   return res.json();
 }
 
+export type CounterpartyPageOut = {
+  items: CounterpartyOut[];
+  next_cursor: string | null;
+  has_more: boolean;
+};
+
+export async function searchCounterparties(options: {
+  q?: string;
+  industry_id?: number | null;
+  ids?: number[];
+  cursor?: string | null;
+  limit?: number;
+}): Promise<CounterpartyPageOut> {
+  const params = new URLSearchParams();
+  if (options.q) params.set("q", options.q);
+  if (options.industry_id != null) params.set("industry_id", String(options.industry_id));
+  options.ids?.forEach((id) => params.append("ids", String(id)));
+  if (options.cursor) params.set("cursor", options.cursor);
+  if (options.limit) params.set("limit", String(options.limit));
+  const qs = params.toString();
+  const res = await authFetch(`${API_BASE}/counterparties/search${qs ? `?${qs}` : ""}`);
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
+export async function fetchCounterpartyLogoSprite(
+  counterpartyIds: number[],
+  size: 48 | 96 | 256 = 48
+): Promise<CounterpartyLogoSpriteOut> {
+  const res = await authFetch(`${API_BASE}/counterparties/logo-sprite`, {
+    method: "POST",
+    body: JSON.stringify({ counterparty_ids: counterpartyIds, size }),
+  });
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
 export async function fetchLegalForms(): Promise<LegalFormOut[]> {
   const res = await authFetch(`${API_BASE}/counterparties/legal-forms`);
   if (!res.ok) throw new Error(await readError(res));
@@ -682,6 +819,22 @@ export async function fetchMarketInstrumentPrice(
   return res.json();
 }
 
+export async function fetchNetWorthReport(options: {
+  from: string;
+  to: string;
+  step?: NetWorthStep;
+  itemIds?: number[];
+}): Promise<NetWorthReportOut> {
+  const params = new URLSearchParams();
+  params.set("from", options.from);
+  params.set("to", options.to);
+  if (options.step) params.set("step", options.step);
+  options.itemIds?.forEach((id) => params.append("item_ids", String(id)));
+  const res = await authFetch(`${API_BASE}/reports/net-worth?${params.toString()}`);
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
 export async function fetchMarketInstrumentPrices(
   secid: string,
   options: { from: string; to: string; boardId?: string }
@@ -767,6 +920,28 @@ export async function deleteCategory(id: number): Promise<void> {
   if (!res.ok) throw new Error(await readError(res));
 }
 
+export async function previewItemPlan(
+  payload: ItemPlanPreviewRequest
+): Promise<ItemPlanPreviewOut> {
+  const res = await authFetch(`${API_BASE}/items/plan-preview`, {
+    method: "POST",
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
+export async function replanItems(
+  items: ItemReplanEntry[]
+): Promise<ItemReplanOut> {
+  const res = await authFetch(`${API_BASE}/items/replan`, {
+    method: "POST",
+    body: JSON.stringify({ items }),
+  });
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
 export async function createItem(payload: ItemCreate): Promise<ItemOut> {
   const res = await authFetch(`${API_BASE}/items`, {
     method: "POST",
@@ -915,6 +1090,7 @@ export async function fetchTransactionsPage(
   options.category_ids?.forEach((value) =>
     params.append("category_ids", String(value))
   );
+  if (options.include_descendants) params.set("include_descendants", "true");
   options.counterparty_ids?.forEach((value) =>
     params.append("counterparty_ids", String(value))
   );
@@ -998,11 +1174,26 @@ export async function createTransactionChain(
   return res.json();
 }
 
-export async function deleteTransactionChain(id: number): Promise<void> {
+export async function updateTransactionChain(
+  id: number,
+  payload: TransactionChainUpdate
+): Promise<TransactionChainOut> {
+  const res = await authFetch(`${API_BASE}/transaction-chains/${id}`, {
+    method: "PATCH",
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
+export async function deleteTransactionChain(
+  id: number
+): Promise<{ ok: boolean; job_id?: number }> {
   const res = await authFetch(`${API_BASE}/transaction-chains/${id}`, {
     method: "DELETE",
   });
   if (!res.ok) throw new Error(await readError(res));
+  return res.json();
 }
 
 export async function fetchLimits(options?: {
@@ -1018,6 +1209,19 @@ export async function fetchLimits(options?: {
   return res.json();
 }
 
+export async function fetchLimitUsage(options?: {
+  on?: string;
+  include_deleted?: boolean;
+}): Promise<LimitUsageOut[]> {
+  const params = new URLSearchParams();
+  if (options?.on) params.set("on", options.on);
+  if (options?.include_deleted) params.set("include_deleted", "true");
+  const qs = params.toString();
+  const res = await authFetch(`${API_BASE}/limits/usage${qs ? `?${qs}` : ""}`);
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
 export async function createLimit(payload: LimitCreate): Promise<LimitOut> {
   const res = await authFetch(`${API_BASE}/limits`, {
     method: "POST",
@@ -1045,3 +1249,37 @@ export async function deleteLimit(id: number): Promise<void> {
   });
   if (!res.ok) throw new Error(await readError(res));
 }
+
+export type JobStatus = "QUEUED" | "RUNNING" | "DONE" | "FAILED";
+
+export type JobOut = {
+  id: number;
+  kind: string;
+  status: JobStatus;
+  attempts: number;
+  max_attempts: number;
+  last_error: string | null;
+  result: Record<string, unknown> | null;
+  run_after: string;
+  created_at: string;
+  finished_at: string | null;
+};
+
+export async function fetchJobs(options?: {
+  status?: JobStatus[];
+  limit?: number;
+}): Promise<JobOut[]> {
+  const params = new URLSearchParams();
+  options?.status?.forEach((status) => params.append("status", status));
+  if (options?.limit) params.set("limit", String(options.limit));
+  const qs = params.toString();
+  const res = await authFetch(`${API_BASE}/jobs${qs ? `?${qs}` : ""}`);
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
+
+export async function fetchJob(id: number): Promise<JobOut> {
+  const res = await authFetch(`${API_BASE}/jobs/${id}`);
+  if (!res.ok) throw new Error(await readError(res));
+  return res.json();
+}
@@ -9,6 +9,8 @@ export function getItemPhotoUrl(
   const base = item.photo_url.startsWith("http")
     ? item.photo_url
     : `${apiBase}${item.photo_url.startsWith("/") ? item.photo_url : `/${item.photo_url}`}`;
+  // Content-hash URLs change with the image, so they need no cache-busting.
+  if (base.includes("/media/")) return base;
   const qs = item.photo_updated_at
     ? `?t=${new Date(item.photo_updated_at).getTime()}`
     : "";